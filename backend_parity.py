@@ -0,0 +1,145 @@
+"""
+Check that the pandas and Polars backends create the same player stats and dribbles (see src/polars_backend.py).
+
+The events of a competition are loaded from StatsBomb once and both backends calculate the player stats (with the
+filters of create_data.py) and all dribbles from them. The frames have to have the same columns, dtypes and rows in
+the same order, numeric values have to match within the tolerance and all other values exactly. The report has
+the time of every backend and every column that differs, the exit code is 1 if a column differs.
+
+Usage:
+    python backend_parity.py                                        # Euro 2024
+    python backend_parity.py --matches 5                            # only the first 5 matches
+    python backend_parity.py --competition-id 43 --season-id 106 --shot-window 10
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import dribbles, player_stats, polars_backend
+from src.matches import get_all_matches, load_all_events
+
+
+def compare_frames(df_pandas, df_polars, rtol=1e-9):
+    """
+    Compare the output of the pandas and Polars backends.
+
+    Parameters
+    ----------
+    df_pandas: pd.DataFrame
+        The output of the pandas backend.
+    df_polars: pd.DataFrame
+        The output of the Polars backend.
+    rtol: float
+        The relative tolerance of numeric values, sums are added up in another order.
+
+    Returns
+    -------
+    differences: list
+        A description of every difference, empty if the frames match.
+    """
+    columns_pandas, columns_polars = list(df_pandas.columns), list(df_polars.columns)
+    if columns_pandas != columns_polars:
+        return [f"columns differ: {columns_pandas} (pandas) and {columns_polars} (polars)"]
+    if len(df_pandas) != len(df_polars):
+        return [f"{len(df_pandas)} rows (pandas) and {len(df_polars)} rows (polars)"]
+
+    differences = []
+    for column in columns_pandas:
+        series_pandas, series_polars = df_pandas[column], df_polars[column]
+        if series_pandas.dtype != series_polars.dtype:
+            differences.append(f"{column}: dtype {series_pandas.dtype} (pandas) and {series_polars.dtype} (polars)")
+            continue
+
+        # Numeric values within the tolerance, missing values in the same rows
+        if pd.api.types.is_numeric_dtype(series_pandas) and not pd.api.types.is_bool_dtype(series_pandas):
+            values_pandas = series_pandas.to_numpy(dtype=float)
+            values_polars = series_polars.to_numpy(dtype=float)
+            different = ~np.isclose(values_pandas, values_polars, rtol=rtol, atol=0, equal_nan=True)
+        else:
+            missing = series_pandas.isna().to_numpy() & series_polars.isna().to_numpy()
+            different = ~missing & (series_pandas.to_numpy() != series_polars.to_numpy())
+
+        if different.any():
+            row = int(np.flatnonzero(different)[0])
+            differences.append(
+                f"{column}: {different.sum()} rows differ, first in row {row}: "
+                f"{series_pandas.iloc[row]!r} (pandas) and {series_polars.iloc[row]!r} (polars)"
+            )
+
+    return differences
+
+
+def run_backends(function, *args, **kwargs):
+    """
+    Run a function of the pandas and the Polars backend with the same arguments.
+
+    Parameters
+    ----------
+    function: str
+        The name of the function, "calculate_player_stats" or "get_all_dribbles".
+    args, kwargs:
+        The arguments of the function.
+
+    Returns
+    -------
+    results: dict
+        The output and the seconds of every backend.
+    """
+    modules = {
+        "pandas": player_stats if function == "calculate_player_stats" else dribbles,
+        "polars": polars_backend,
+    }
+
+    results = {}
+    for backend, module in modules.items():
+        start_time = time.perf_counter()
+        df = getattr(module, function)(*args, **kwargs)
+        results[backend] = (df, time.perf_counter() - start_time)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the pandas and Polars backends create the same data.")
+    parser.add_argument("--competition-id", type=int, default=55, help="StatsBomb competition id.")
+    parser.add_argument("--season-id", type=int, default=282, help="StatsBomb season id.")
+    parser.add_argument("--matches", type=int, default=None, help="Only use the first matches of the competition.")
+    parser.add_argument("--shot-window", type=int, default=15, help="Shot window of the danger dribbles in seconds.")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="Relative tolerance of numeric values.")
+    args = parser.parse_args()
+
+    # Load the events once, both backends use the same events
+    match_ids = get_all_matches(competition_id=args.competition_id, season_id=args.season_id)["match_id"].tolist()[:args.matches]
+    print(f"Loading the events of {len(match_ids)} matches...")
+    df_all_events = load_all_events(match_ids)
+
+    # Same filters as create_data.py
+    checks = {
+        "player stats": run_backends(
+            "calculate_player_stats", match_ids, df_all_events,
+            min_playing_time=1, min_attempted_dribbles=0, shot_window=args.shot_window
+        ),
+        "dribbles": run_backends("get_all_dribbles", match_ids, df_all_events, shot_window=args.shot_window),
+    }
+
+    failed = False
+    for name, results in checks.items():
+        (df_pandas, pandas_seconds), (df_polars, polars_seconds) = results["pandas"], results["polars"]
+        print(f"{name:<14} {len(df_pandas):6} rows  pandas {pandas_seconds:6.2f}s  polars {polars_seconds:6.2f}s")
+
+        differences = compare_frames(df_pandas, df_polars, args.rtol)
+        for difference in differences:
+            print(f"    {difference}")
+        failed = failed or bool(differences)
+
+    if failed:
+        sys.exit(1)
+    print("Both backends create the same player stats and dribbles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Build the app bundle: the data files, percentile cube and optionally thumbnails in one file (see src/bundle.py).
+
+A replica started with APP_BUNDLE set to the bundle maps it instead of reading the data files and building the cube.
+
+Usage:
+    python build_bundle.py                                  # data/app_bundle.arrow
+    python build_bundle.py --thumbnails                     # with thumbnails of the default filters
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description="Build the app bundle from the data files.")
+parser.add_argument("--output", type=Path, default=Path("data/app_bundle.arrow"), help="Path of the bundle.")
+parser.add_argument("--thumbnails", action="store_true", help="Render thumbnails of the radar and pitch plots of the default filters.")
+args = parser.parse_args()
+
+# The full size plots of the thumbnails are saved in a temp directory, not in generated_images/
+images_dir = tempfile.TemporaryDirectory(prefix="bundle_images_")
+os.environ["APP_IMAGES_DIR"] = images_dir.name
+for plots_dir in ["radar_plots", "pitch_plots"]:
+    os.makedirs(os.path.join(images_dir.name, plots_dir))
+
+from src.bundle import DATA_FILES, create_thumbnails, get_bundle_cube, open_bundle, read_app_data, read_bundle_data, write_bundle
+from src.percentile_cube import build_percentile_cube
+
+# Read all data files that exist
+print("Reading data files...")
+tables = {name: df for name in DATA_FILES if (df := read_app_data(name)) is not None}
+
+# Build the percentile cube of the default shot window
+print("Building percentile cube...")
+cube = build_percentile_cube(tables["player_stats"])
+
+thumbnails = None
+if args.thumbnails:
+    print("Rendering thumbnails...")
+    thumbnails = create_thumbnails(tables["player_stats"], tables["dribbles"], cube, tables.get("player_match_stats"))
+images_dir.cleanup()
+
+# Write the bundle
+print("Writing bundle...")
+manifest = write_bundle(args.output, tables, cube, thumbnails)
+
+# Load everything from the bundle, like a new replica
+start_time = time.perf_counter()
+bundle = open_bundle(args.output)
+for name in manifest["tables"]:
+    read_bundle_data(bundle, name)
+get_bundle_cube(bundle)
+load_seconds = time.perf_counter() - start_time
+
+n_thumbnails = 0 if thumbnails is None else sum(len(images) for images in thumbnails.values())
+print(f"Bundle of {args.output.stat().st_size / 1024 ** 2:.1f} MB: {', '.join(manifest['tables'])}, {cube['cohorts']} cohorts and {n_thumbnails} thumbnails")
+print(f"Loaded in {load_seconds * 1000:.0f} ms")
+print("Done!")
@@ -1,28 +1,98 @@
-from src.matches import get_all_match_ids, load_all_events
-from src.player_stats import calculate_player_stats
+import argparse
+import sys
+
+from src.match_executor import MATCH_STAGE_COLUMNS, close_match_executor, create_match_executor, map_matches
+from src.form import create_form_series
+from src.matches import get_all_matches, load_all_events
+from src.player_stats import calculate_player_match_stats, calculate_player_stats
 from src.dribbles import get_all_dribbles
+from src.percentile_sketch import build_partition_sketches, write_partition_sketches
+from src.zones import create_zone_index
+from src.schema import write_data
+
+# Select the backend for the player stats and dribbles, the Polars backend needs polars installed
+parser = argparse.ArgumentParser(description="Create the data files for the Streamlit app.")
+parser.add_argument("--backend", choices=["pandas", "polars"], default="pandas")
+# Run the per match stages of the pandas backend on multiple cores, the Polars backend uses all cores itself
+parser.add_argument("--workers", type=int, default=1, help="Worker processes for the per match stages (pandas backend).")
+parser.add_argument("--chunk-size", type=int, default=None, help="Matches per task of a worker.")
+# Other competitions only add their percentile sketches, for percentiles against all competitions
+parser.add_argument("--competition-id", type=int, default=55, help="StatsBomb competition id.")
+parser.add_argument("--season-id", type=int, default=282, help="StatsBomb season id.")
+parser.add_argument("--sketches-only", action="store_true", help="Only write the percentile sketches of the competition.")
+args = parser.parse_args()
+
+if args.backend == "polars":
+    from src.polars_backend import calculate_player_stats, get_all_dribbles
 
-# Get all match ids
-match_ids = get_all_match_ids(competition_id=55, season_id=282)
+# Get all matches and their ids
+df_matches = get_all_matches(competition_id=args.competition_id, season_id=args.season_id)
+match_ids = df_matches['match_id'].tolist()
 
 # Get all events
 print("Combining all events...")
 df_all_events = load_all_events(match_ids)
 
+# Share the events with the worker processes
+executor = None
+if args.backend == "pandas" and args.workers > 1:
+    print(f"Starting {args.workers} workers...")
+    # Only the columns the per match stages read are shared
+    columns = [column for column in MATCH_STAGE_COLUMNS if column in df_all_events.columns]
+    # This script can't be re-imported by spawned workers, so they are forked
+    executor = create_match_executor(df_all_events, match_ids, args.workers, args.chunk_size, columns=columns, start_method="fork")
+
 # Get all player stats
 print("Calculating player stats...")
-df_player_stats = calculate_player_stats(match_ids, df_all_events, min_playing_time=1, min_attempted_dribbles=0)
+if executor is None:
+    df_player_stats = calculate_player_stats(match_ids, df_all_events, min_playing_time=1, min_attempted_dribbles=0)
+else:
+    df_player_stats = calculate_player_stats(match_ids, df_all_events, min_playing_time=1, min_attempted_dribbles=0, executor=executor)
+
+# Summarize the player stats of the competition in percentile sketches
+print("Building percentile sketches...")
+write_partition_sketches(build_partition_sketches(df_player_stats), f"data/percentile_sketches/{args.competition_id}_{args.season_id}.parquet")
+if args.sketches_only:
+    if executor is not None:
+        close_match_executor(executor)
+    sys.exit()
+
+# Save to parquet
+print("Saving to parquet...")
+write_data(df_player_stats, "player_stats", "data/player_stats.parquet")
+
+# Get player stats per match, used for the bootstrap intervals
+print("Calculating player stats per match...")
+df_player_match_stats = calculate_player_match_stats(match_ids, df_all_events, executor=executor)
 
 # Save to parquet
 print("Saving to parquet...")
-df_player_stats.to_parquet("data/player_stats.parquet", index=False)
+write_data(df_player_match_stats, "player_match_stats", "data/player_match_stats.parquet")
+
+# Get the form series of every player, in match order
+print("Creating form series...")
+df_form = create_form_series(df_player_match_stats, df_matches, df_player_stats)
+
+# Save to parquet
+print("Saving to parquet...")
+write_data(df_form, "player_form", "data/player_form.parquet")
 
 # Get all dribbles
 print("Getting all dribbles...")
-df_dribbles = get_all_dribbles(match_ids, df_all_events)
+df_dribbles = get_all_dribbles(match_ids, df_all_events) if executor is None else map_matches(executor, "dribbles")
+if executor is not None:
+    close_match_executor(executor)
+
+# Save to parquet
+print("Saving to parquet...")
+write_data(df_dribbles, "dribbles", "data/dribbles.parquet")
+
+# Create spatial index of dribbles
+print("Creating dribble zone index...")
+df_zone_index = create_zone_index(df_dribbles)
 
 # Save to parquet
 print("Saving to parquet...")
-df_dribbles.to_parquet("data/dribbles.parquet", index=False)
+write_data(df_zone_index, "dribble_zones", "data/dribble_zones.parquet")
 
 print("Done!")
\ No newline at end of file
@@ -1,56 +1,110 @@
+import time
 import streamlit as st
 import pandas as pd
 import numpy as np
-from src.radar_plot import create_radar_plot, create_radar_path
-from src.pitch_plot import create_pitch_plot, create_pitch_path
-import os
+from concurrent.futures import ThreadPoolExecutor
+from src import data_plots
+from src.bundle import has_app_data, open_bundle, read_app_data, read_app_snapshot
+from src.render_client import BUNDLE_PATH, SKETCH_DIR, get_data_version, start_render_worker, request_plot, request_plot_data, request_prefetch
+from src.plot_data import FORM_METRICS, decode_plot_data, get_form_plot_data
+from src.radar_plot import RADAR_PARAMS
+from src.vega_plots import create_form_chart, create_pitch_chart, create_radar_chart
+from src.similarity import create_similarity_index, find_similar_players
+from src.dribbles import apply_shot_window
+from src.dribble_stats import update_danger_dribble_stats
+from src.telemetry import METRICS_DIR, format_metrics, increment, observe, read_metrics, set_process_name, summarize_metrics, timer, write_metrics
 
 @st.cache_data
 def filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter):
-    df = df_player_stats.copy()
+    return data_plots.filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter)
 
-    # Apply filters
-    if position_filter != "All":
-        if position_filter == "Defenders":
-            df = df[df["position"] == "defender"]
-        elif position_filter == "Midfielders":
-            df = df[df["position"] == "midfielder"]
-        elif position_filter == "Forwards":
-            df = df[df["position"] == "forward"]
-    if minutes_played_filter:
-        df = df[df["playing_time"] >= minutes_played_filter * 60]
-    if dribbles_filter:
-        df = df[df["attempted_dribbles"] >= dribbles_filter]
 
-    # Convert playing time to minutes for display
-    df["playing_time"] = df["playing_time"] / 60
+@st.cache_data
+def apply_danger_window(df_player_stats, df_dribbles, shot_window):
+    # Recalculate danger dribbles from the gap to the next shot
+    return update_danger_dribble_stats(df_player_stats, df_dribbles, shot_window), apply_shot_window(df_dribbles, shot_window)
+
+
+@st.cache_resource
+def get_render_requests():
+    # Plots are rendered by a separate worker process, requests are sent from a small thread pool
+    start_render_worker()
+    return ThreadPoolExecutor(max_workers=4)
+
+
+@st.cache_resource
+def get_similarity_index(_df, position_filter, minutes_played_filter, dribbles_filter, shot_window, data_version):
+    # The filters and the data version identify the cohort, so the index is built once per cohort and rebuilt after the data changed
+    return create_similarity_index(_df)
+
 
-    return df
+def get_plot_result(future, plot, data_version):
+    # A plot that failed (e.g. the worker is busy or stopped) shows a warning, the rest of the page still works
+    try:
+        return future.result()
+    except (RuntimeError, ConnectionError, TimeoutError, EOFError) as error:
+        # The data changed since this run read it (e.g. a live publish), run again with the new data
+        if get_data_version() != data_version:
+            st.rerun()
+        increment("app_plot_errors_total", {"plot": plot})
+        st.warning(f"The {plot} plot couldn't be loaded, try again in a moment. {error}")
+        st.button("Try again", key=f"retry_{plot}")
+        return None
 
 
-def show_radar_plot(df, player_id, position_filter, minutes_played_filter, dribbles_filter):
-    # Check if plot already exists
-    plot_path = create_radar_path(player_id, position_filter, minutes_played_filter, dribbles_filter)
-    if os.path.exists(plot_path):
-        return plot_path
+def write_rerun_metrics(script_start_time):
+    # Metrics are written at the end of every rerun, for Prometheus and the diagnostics page
+    observe("app_script_seconds", time.perf_counter() - script_start_time)
+    write_metrics()
 
-    fig, path = create_radar_plot(df, player_id, position_filter, minutes_played_filter, dribbles_filter)
-    return path
 
+def show_diagnostics():
+    # Hidden page with the runtime metrics of all processes, open it with ?diagnostics
+    write_metrics()
+    counters, histograms = summarize_metrics(read_metrics())
+    counter_values = {(counter["metric"], counter["labels"]): counter["value"] for counter in counters}
 
-def get_pitch_path(df_dribbles, player_id, player_name, team_name):
-    # Check if plot already exists
-    plot_path = create_pitch_path(player_id)
-    if os.path.exists(plot_path):
-        return plot_path
+    st.title("Diagnostics")
+    st.write(f"Runtime metrics of the app, the render worker and the render processes since they started, from the Prometheus files in {METRICS_DIR}.")
 
-    fig, path = create_pitch_plot(df_dribbles, player_id, player_name, team_name)
-    return path
+    # Cache hit ratio of the plot images and reruns per session
+    cache_hits = sum(counter["value"] for counter in counters if counter["metric"] == "render_cache_total" and "result=hit" in counter["labels"])
+    cache_requests = sum(counter["value"] for counter in counters if counter["metric"] == "render_cache_total")
+    sessions = counter_values.get(("app_sessions_total", ""), 0)
+    columns = st.columns(3)
+    columns[0].metric("Image cache hit ratio", f"{cache_hits / cache_requests:.0%}" if cache_requests else "-")
+    columns[1].metric("Reruns per session", f"{counter_values.get(('app_reruns_total', ''), 0) / sessions:.1f}" if sessions else "-")
+    columns[2].metric("Reruns of this session", st.session_state["reruns"])
 
+    st.subheader("Latency")
+    st.dataframe(
+        pd.DataFrame(histograms, columns=["metric", "labels", "count", "mean", "p50", "p95", "p99"]),
+        column_config={column: st.column_config.NumberColumn(column, help="Seconds", format="%.3f") for column in ["mean", "p50", "p95", "p99"]},
+        hide_index=True,
+    )
+    st.subheader("Counters")
+    st.dataframe(pd.DataFrame(counters, columns=["metric", "labels", "value"]), hide_index=True)
+    with st.expander("Prometheus metrics of the app process"):
+        st.code(format_metrics(), language="text")
+
+
+# Count sessions and reruns
+set_process_name("app")
+script_start_time = time.perf_counter()
+increment("app_reruns_total")
+if "reruns" not in st.session_state:
+    st.session_state["reruns"] = 0
+    increment("app_sessions_total")
+st.session_state["reruns"] += 1
+
+if "diagnostics" in st.query_params:
+    show_diagnostics()
+    st.stop()
 
-# Get player stats and dribbles
-df_player_stats = pd.read_parquet("data/player_stats.parquet")
-df_dribbles = pd.read_parquet("data/dribbles.parquet")
+# Get player stats and dribbles, from the prebuilt bundle if APP_BUNDLE is set, and the version of the data
+bundle = open_bundle(BUNDLE_PATH) if BUNDLE_PATH else None
+app_data, data_version = read_app_snapshot(["player_stats", "dribbles"], bundle)
+df_player_stats, df_dribbles = app_data["player_stats"], app_data["dribbles"]
 
 st.title("Best dribblers at Euro 2024")
 st.write("This app generates radar and pitch plots for the dribbling performance of players at Euro 2024.")
@@ -66,8 +120,28 @@ with st.sidebar:
     minutes_played_filter = st.number_input("Minimum minutes played", min_value=0, max_value=900, value=270, step=1)
     dribbles_filter = st.number_input("Minimum dribbles", min_value=0, max_value=100, value=10, step=1)
 
+    # The shot window can only be changed if the dribbles have their gap to the next shot
+    shot_window = 15
+    if "shot_gap" in df_dribbles.columns:
+        shot_window = st.select_slider("Danger dribble window (seconds)", options=[5, 10, 15, 20, 30], value=15)
+
+    # Percentiles against the players of all competitions are estimated from their sketches (15 second window only)
+    percentiles = "cohort"
+    if any(SKETCH_DIR.glob("*.parquet")):
+        compare_with = st.segmented_control("Compare with", ["Table", "All competitions"], default="Table", disabled=shot_window != 15)
+        if compare_with == "All competitions" and shot_window == 15:
+            percentiles = "competitions"
+
+    # Interactive plots are drawn in the browser from the plot data, images are rendered by the worker
+    plot_mode = st.segmented_control("Plots", ["Image", "Interactive"], default="Image")
+
+# Recalculate danger dribbles for another shot window
+if shot_window != 15:
+    df_player_stats, df_dribbles = apply_danger_window(df_player_stats, df_dribbles, shot_window)
+
 # Filter player stats
-df_player_stats_filtered = filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter)
+with timer("app_filter_seconds"):
+    df_player_stats_filtered = filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter)
 # st.write(f"Number of players: {len(df_player_stats_filtered)}")
 
 # Select a player
@@ -129,7 +203,7 @@ selected_player = st.dataframe(
         ),
         "danger_dribbles": st.column_config.NumberColumn(
             "Danger dribbles",
-            help="Danger dribbles lead to a shot within 15 seconds",
+            help=f"Danger dribbles lead to a shot within {shot_window} seconds",
             format="%.0f",
         ),
         "danger_dribbles_xg": st.column_config.NumberColumn(
@@ -161,30 +235,112 @@ selected_player = st.dataframe(
     on_select="rerun"
 )
 
-if not selected_player["selection"]["rows"]:
+render_requests = get_render_requests()
+render_filters = {
+    "position_filter": position_filter,
+    "minutes_played_filter": minutes_played_filter,
+    "dribbles_filter": dribbles_filter,
+    "shot_window": shot_window,
+    "percentiles": percentiles,
+}
+
+# Request both plots of the selected player first, so the click always wins over prefetching
+interactive = plot_mode == "Interactive"
+request_function = request_plot_data if interactive else request_plot
+plot_labels = {"mode": "interactive" if interactive else "image"}
+plot_request_time = time.perf_counter()
+selected_rows = selected_player["selection"]["rows"]
+if selected_rows:
+    selected_row = df_player_stats_filtered.iloc[selected_rows[0]]
+    radar_future = render_requests.submit(request_function, "radar", selected_row["player_id"], render_filters, data_version)
+    pitch_future = render_requests.submit(request_function, "pitch", selected_row["player_id"], render_filters, data_version)
+
+# Prefetch the plots of the top rows of the table in the background, interactive plots don't need rendering
+if not interactive:
+    render_requests.submit(request_prefetch, df_player_stats_filtered["player_id"].head(5).tolist(), render_filters, data_version)
+
+if not selected_rows:
     st.info("Select a player to proceed with the analysis.")
+    write_rerun_metrics(script_start_time)
     st.stop()
 
 # Get stats for the selected player
-selected_id = selected_player["selection"]["rows"][0]
-selected_player_id = df_player_stats_filtered.iloc[selected_id]["player_id"]
-selected_player_name = df_player_stats_filtered.iloc[selected_id]["player_short_name"]
-selected_player_team = df_player_stats_filtered.iloc[selected_id]["team_name"]
+selected_player_id = selected_row["player_id"]
+selected_player_name = selected_row["player_short_name"]
+selected_player_team = selected_row["team_name"]
 # st.write(f"Selected player: {selected_player_id} - {selected_player_name} ({selected_player_team})")
 
 with st.spinner("Generating radar plot..."):
     # Show radar plot
-    radar_path = show_radar_plot(df_player_stats_filtered, selected_player_id, position_filter, minutes_played_filter, dribbles_filter)
-    st.image(radar_path)
+    radar_result = get_plot_result(radar_future, "radar", data_version)
+    observe("app_plot_seconds", time.perf_counter() - plot_request_time, {"plot": "radar", **plot_labels})
+    if radar_result is None:
+        pass
+    elif interactive:
+        radar_data = decode_plot_data(radar_result)
+        st.vega_lite_chart(create_radar_chart(radar_data), theme=None)
+        st.caption("  \n".join(radar_data["notes"]))
+    else:
+        st.image(radar_result)
     #st.pyplot(fig)
-    st.write(f"This radar plot shows how {selected_player_name} performed compared to other players from the table at the top of the page. Changing the player filters will also change this plot.")
+    if percentiles == "competitions":
+        st.write(f"This radar plot shows how {selected_player_name} performed compared to the players of all competitions with at least the minutes and dribbles in the footnote. The percentiles are estimated from sketches of every competition and can be up to a percentile off.")
+    else:
+        st.write(f"This radar plot shows how {selected_player_name} performed compared to other players from the table at the top of the page. Changing the player filters will also change this plot.")
     st.write(f"All stats are normalized to per 90 minutes. This gives a better comparison of players with different playing times.")
     st.write(f"Scores at the outer edge of the radar plot are among the best, while scores at the inner edge are among the worst compared to the other players.")
+    if has_app_data("player_match_stats", bundle) and percentiles == "cohort":
+        st.write(f"The dark lines show how certain each percentile is: 90% of the time it falls within the line when the matches of all players are resampled. Players with few matches have longer lines.")
 
 with st.spinner("Generating pitch plot..."):
     # Show pitch plot
-    pitch_path = get_pitch_path(df_dribbles, selected_player_id, selected_player_name, selected_player_team)
-    st.image(pitch_path)
+    pitch_result = get_plot_result(pitch_future, "pitch", data_version)
+    observe("app_plot_seconds", time.perf_counter() - plot_request_time, {"plot": "pitch", **plot_labels})
+    if pitch_result is None:
+        pass
+    elif interactive:
+        pitch_data = decode_plot_data(pitch_result)
+        st.vega_lite_chart(create_pitch_chart(pitch_data), theme=None)
+        totals = pitch_data["totals"]
+        st.caption(f"{totals['completed']} completed, {totals['danger']} danger and {totals['failed']} failed dribbles.  \n" + "  \n".join(pitch_data["notes"]))
+    else:
+        st.image(pitch_result)
     #st.pyplot(fig)
     st.write(f"This pitch plot shows all the dribbles of {selected_player_name} at Euro 2024. It shows successful, failed and danger dribbles.")
-    st.write(f"Danger dribbles are dribbles that ended in a shot within 15 seconds. The size of the dribble points is scaled according to the xG of the shot.")
\ No newline at end of file
+    st.write(f"Danger dribbles are dribbles that ended in a shot within {shot_window} seconds. The size of the dribble points is scaled according to the xG of the shot.")
+
+# Show the form of the player, drawn from the form series without the events
+df_form = read_app_data("player_form", bundle)
+if df_form is not None:
+    form_labels = {column: label.replace("\n", " ") for column, label in zip(data_plots.RADAR_COLUMNS, RADAR_PARAMS)}
+    form_columns = st.columns(2)
+    form_window = form_columns[0].select_slider("Form window (matches)", options=[1, 2, 3, 4, 5], value=3)
+    form_metrics = form_columns[1].multiselect("Form stats", list(form_labels), default=FORM_METRICS, format_func=form_labels.get)
+    if form_metrics:
+        form_data = get_form_plot_data(df_form, selected_player_id, selected_player_name, selected_player_team, form_window, form_metrics)
+        st.vega_lite_chart(create_form_chart(form_data), theme=None)
+        st.caption("  \n".join(form_data["notes"]))
+    st.write(f"This chart shows the form of {selected_player_name}: the stats over the last {form_window} matches after every match of the tournament.")
+
+# Show similar players
+similarity_index = get_similarity_index(df_player_stats_filtered, position_filter, minutes_played_filter, dribbles_filter, shot_window, data_version)
+similar_player_ids, similar_distances = find_similar_players(similarity_index, selected_player_id)
+if len(similar_player_ids):
+    df_similar_players = df_player_stats_filtered.set_index("player_id").loc[similar_player_ids, ["player_short_name", "team_name"]]
+    df_similar_players["distance"] = similar_distances
+    st.write(f"Players from the table with the most similar profile to {selected_player_name}:")
+    st.dataframe(
+        df_similar_players,
+        column_config={
+            "player_short_name": st.column_config.TextColumn("Player"),
+            "team_name": st.column_config.TextColumn("Team"),
+            "distance": st.column_config.NumberColumn(
+                "Distance",
+                help="Distance between the per 90 and rate stats of both players, lower is more similar",
+                format="%.2f",
+            ),
+        },
+        hide_index=True,
+    )
+
+write_rerun_metrics(script_start_time)
@@ -0,0 +1,156 @@
+"""
+Measure the cold-start import time of the modules in src/ and of the app, and check it against the budget.
+
+Every target is imported in a fresh interpreter with `python -X importtime`. The report shows the total import
+time of every target and its slowest imports. The check fails if a target exceeds its budget in
+import_budget.json by more than the tolerance plus the slack.
+
+Usage:
+    python import_budget.py             # report and check against the budget
+    python import_budget.py --update    # report and write the measured times as the new budget
+"""
+
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Get project root directory
+project_root = Path(__file__).parent
+
+BUDGET_PATH = project_root / "import_budget.json"
+
+# Budget tolerance, import times vary between runs and machines
+TOLERANCE = 0.25
+
+# Absolute slack in milliseconds on top of the tolerance, so a few milliseconds of noise don't fail the small budgets
+SLACK_MS = 50
+
+
+def get_app_imports(app_path=project_root / "dribble_analysis.py"):
+    """
+    Get the top-level imports of the app.
+
+    Parameters
+    ----------
+    app_path: Path
+        The path of the app script.
+
+    Returns
+    -------
+    list
+        The imported module names.
+    """
+    modules = []
+    for node in ast.parse(app_path.read_text()).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+
+    return modules
+
+
+def get_targets():
+    """
+    Get the import targets: every module in src/ and the imports of the app.
+
+    Returns
+    -------
+    dict
+        The import statement of every target.
+    """
+    targets = {
+        f"src.{path.stem}": f"import src.{path.stem}"
+        for path in sorted((project_root / "src").glob("*.py"))
+        if path.stem != "__init__"
+    }
+    targets["app"] = "; ".join(f"import {module}" for module in get_app_imports())
+
+    return targets
+
+
+def measure_import_time(statement, runs=3):
+    """
+    Measure the import time of a statement in a fresh interpreter.
+
+    Parameters
+    ----------
+    statement: str
+        The import statement.
+    runs: int
+        The number of runs, the fastest run is reported.
+
+    Returns
+    -------
+    total_ms: float
+        The total import time in milliseconds.
+    slowest: list
+        The (package, cumulative milliseconds) of the slowest packages imported in the fastest run.
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", statement],
+            cwd=project_root, capture_output=True, text=True, check=True
+        )
+
+        # Lines look like "import time:   self [us] | cumulative | imported package"
+        total_ms = 0
+        packages = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative_ms = int(cumulative) / 1000
+
+            # Top-level imports are not indented, together they make up the total
+            if not name[1:].startswith(" "):
+                total_ms += cumulative_ms
+
+            # Packages (not submodules) outside src show where the time goes
+            name = name.strip()
+            if "." not in name and name != "src":
+                packages.append((name, cumulative_ms))
+
+        if best is None or total_ms < best[0]:
+            best = (total_ms, sorted(packages, key=lambda item: -item[1])[:5])
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import time budget.")
+    parser.add_argument("--update", action="store_true", help="Write the measured times as the new budget.")
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_PATH.read_text()) if BUDGET_PATH.exists() else {}
+    measured = {}
+    failed = []
+
+    for target, statement in get_targets().items():
+        total_ms, slowest = measure_import_time(statement)
+        measured[target] = round(total_ms)
+
+        limit = budget.get(target)
+        status = "no budget" if limit is None else f"budget {limit} ms"
+        if limit is not None and total_ms > limit * (1 + TOLERANCE) + SLACK_MS:
+            status += " EXCEEDED"
+            failed.append(target)
+
+        print(f"{target:<22} {total_ms:8.0f} ms  ({status})")
+        for name, cumulative in slowest:
+            print(f"    {name:<30} {cumulative:8.0f} ms")
+
+    if args.update:
+        BUDGET_PATH.write_text(json.dumps(measured, indent=4) + "\n")
+        print(f"Budget written to {BUDGET_PATH.name}")
+    elif failed:
+        print(f"Import time budget exceeded for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
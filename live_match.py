@@ -0,0 +1,74 @@
+"""
+Update the data files of the app while a match is being played.
+
+The events of the match are read from a feed (a JSON lines file that a live provider appends to, see src/live.py)
+and the player stats, dribbles and player match stats are published to the data files every publish interval.
+The app and the render worker pick up the new files on their next rerun or request. When the feed ends with the
+end event (or has no new events for the idle timeout), the final stats are published and the script stops.
+
+Run create_data.py after the match to update the other data files (form series and dribble zones) as well.
+
+Usage:
+    python live_match.py --feed feed.jsonl --match-id 3942382                          # follow a feed
+    python live_match.py --feed feed.jsonl --match-id 3942382 --replay --speed 60     # replay a StatsBomb match
+"""
+
+import argparse
+import threading
+import time
+
+from src.live import create_live_match, finish_live_match, follow_feed, ingest_event, publish_live_match, read_base_data, write_feed
+from src.telemetry import increment, set_process_name, timer, write_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the data files of the app from the event feed of a live match.")
+    parser.add_argument("--feed", required=True, help="JSON lines file the events of the match are appended to.")
+    parser.add_argument("--match-id", type=int, required=True, help="The match id of the feed.")
+    parser.add_argument("--publish-interval", type=float, default=10, help="Seconds between updates of the data files.")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="Stop when the feed has no new events for this many seconds.")
+    parser.add_argument("--replay", action="store_true", help="Write the events of the match from StatsBomb to the feed while following it.")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed, e.g. 60 plays a minute per second. As fast as possible by default.")
+    args = parser.parse_args()
+
+    set_process_name("live")
+
+    # The data before the match, the match is added to it on every publish
+    base = read_base_data(args.match_id)
+    live = create_live_match(args.match_id)
+
+    if args.replay:
+        from src.matches import get_parser
+
+        df_events = get_parser().event(args.match_id)[0]
+        open(args.feed, "w").close()
+        threading.Thread(target=write_feed, args=(df_events, args.feed, args.speed), daemon=True).start()
+
+    last_publish_time = time.monotonic()
+    published_events = 0
+    for events in follow_feed(args.feed, idle_timeout=args.idle_timeout):
+        for event in events:
+            ingest_event(live, event)
+        increment("live_events_total", value=len(events))
+
+        # Publish the new events every interval, and at once when the match is over
+        if live["finished"] or (live["events"] > published_events and time.monotonic() - last_publish_time >= args.publish_interval):
+            with timer("live_publish_seconds"):
+                publish_live_match(live, base)
+            write_metrics()
+            last_publish_time = time.monotonic()
+            published_events = live["events"]
+            print(f"Published {live['events']} events, {len(live['dribbles'])} dribbles of {len(live['players'])} players")
+
+    # The feed timed out before the end event
+    if not live["finished"]:
+        print(f"No events for {args.idle_timeout} s, finishing the match")
+        finish_live_match(live)
+        publish_live_match(live, base)
+        write_metrics()
+
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Load test the Streamlit app with concurrent sessions.
+
+Every session is a headless AppTest of dribble_analysis.py in its own thread, so the sessions share the caches of
+one app process like on a Streamlit server. A session loads the app and performs a random (seeded) script of
+interactions: change the position, move the minutes and dribbles filters and select a row of the table (which
+waits for the radar and pitch plot). The render worker is started in a separate process group on a free port,
+with a cold image cache and its own metrics directory.
+
+The report has the p50/p95/p99 latency of every interaction, the CPU time and memory of the app and the render
+worker (including its render processes) and the render metrics of src/telemetry.py. Save it as JSON and compare
+a later run against it to judge a change.
+
+Usage:
+    python load_test.py --sessions 10 --actions 8                  # real data in data/
+    python load_test.py --data synthetic --players 2000            # synthetic data
+    python load_test.py --output before.json                       # save the report
+    python load_test.py --compare before.json                      # compare against a saved report
+"""
+
+import argparse
+import json
+import os
+import resource
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.positions import POSITION_BITS, POSITION_FILTERS
+
+# Get project root directory
+project_root = Path(__file__).parent
+
+APP_PATH = project_root / "dribble_analysis.py"
+
+# Interactions of a session script after loading the app
+ACTIONS = ["position", "minutes", "dribbles", "select"]
+POSITIONS = ["All", "Defenders", "Midfielders", "Forwards"]
+
+# Teams of the synthetic players
+TEAMS = [f"Team {i}" for i in range(24)]
+
+
+def create_synthetic_data(directory, n_players=600, n_matches=51, seed=0):
+    """
+    Create synthetic player stats and dribbles in the format of create_data.py.
+
+    The player stats are aggregated from the dribbles, so danger dribbles can be recalculated for other shot
+    windows. There are no player match stats, so the radar plots have no bootstrap intervals.
+
+    Parameters
+    ----------
+    directory: Path
+        The directory to write the data files to.
+    n_players: int
+        The number of players.
+    n_matches: int
+        The number of matches.
+    seed: int
+        The seed of the random generator.
+    """
+    from src.schema import write_data
+
+    rng = np.random.default_rng(seed)
+
+    # Players with a team, position and playing time in seconds
+    player_ids = np.arange(1, n_players + 1) + 900_000
+    positions = rng.choice(list(POSITION_FILTERS.values()), n_players)
+    df_players = pd.DataFrame({
+        "player_id": player_ids,
+        "player_name": [f"Player {i}" for i in range(n_players)],
+        "player_short_name": [f"Player {i}" for i in range(n_players)],
+        "team_name": rng.choice(TEAMS, n_players),
+        "position": positions,
+        "position_mask": [POSITION_BITS[position] for position in positions],
+        "playing_time": rng.integers(60, 7 * 95 * 60, n_players),
+    })
+
+    # Dribbles proportional to playing time, a third of the completed dribbles is followed by a shot
+    n_dribbles = rng.poisson(df_players["playing_time"] / 5400 * 2)
+    dribble_players = np.repeat(player_ids, n_dribbles)
+    n = len(dribble_players)
+    completed = rng.random(n) < 0.55
+    shot_gap = np.where(completed & (rng.random(n) < 0.3), rng.exponential(12, n), np.nan)
+    next_shot_xg = np.where(np.isnan(shot_gap), 0.0, rng.beta(1, 9, n))
+    next_shot_goal = ~np.isnan(shot_gap) & (rng.random(n) < next_shot_xg)
+    danger = shot_gap <= 15
+    df_dribbles = pd.DataFrame({
+        "match_id": rng.integers(1, n_matches + 1, n),
+        "type_name": "Dribble",
+        "player_id": dribble_players,
+        "outcome_name": np.where(completed, "Complete", "Incomplete"),
+        "x": rng.uniform(0, 120, n),
+        "y": rng.uniform(0, 80, n),
+        "danger_dribble": danger,
+        "xg_from_dribble": np.where(danger, next_shot_xg, 0.0),
+        "dribble_to_goal": danger & next_shot_goal,
+        "shot_gap": shot_gap,
+        "next_shot_xg": next_shot_xg,
+        "next_shot_goal": next_shot_goal,
+    })
+
+    # Player stats from the dribbles, other stats are random
+    df_counts = df_dribbles.assign(
+        completed=completed, failed=~completed, danger_xg=df_dribbles["xg_from_dribble"]
+    ).groupby("player_id").agg(
+        completed_dribbles=("completed", "sum"),
+        failed_dribbles=("failed", "sum"),
+        danger_dribbles=("danger_dribble", "sum"),
+        danger_dribbles_xg=("danger_xg", "sum"),
+        dribbles_to_goals=("dribble_to_goal", "sum"),
+    )
+    df_player_stats = df_players.join(df_counts, on="player_id").fillna(0)
+    matches_played = df_player_stats["playing_time"] / 5400
+    df_player_stats["shots"] = rng.poisson(matches_played * 1.5)
+    df_player_stats["goals"] = rng.binomial(df_player_stats["shots"], 0.1)
+    df_player_stats["assists"] = rng.poisson(matches_played * 0.1)
+    df_player_stats["shots_xg"] = df_player_stats["shots"] * rng.beta(1, 9, n_players)
+    df_player_stats["attempted_dribbles"] = df_player_stats["completed_dribbles"] + df_player_stats["failed_dribbles"]
+    df_player_stats["dribble_success_rate"] = (df_player_stats["completed_dribbles"] / df_player_stats["attempted_dribbles"]).fillna(0)
+    df_player_stats["xg_per_danger_dribble"] = (df_player_stats["danger_dribbles_xg"] / df_player_stats["danger_dribbles"]).fillna(0)
+    for column in ["goals", "assists", "shots", "shots_xg", "completed_dribbles", "failed_dribbles", "attempted_dribbles", "danger_dribbles", "danger_dribbles_xg", "dribbles_to_goals"]:
+        df_player_stats[f"{column}_per90"] = df_player_stats[column] / df_player_stats["playing_time"] * 5400
+
+    directory.mkdir(parents=True, exist_ok=True)
+    write_data(df_player_stats, "player_stats", directory / "player_stats.parquet")
+    write_data(df_dribbles, "dribbles", directory / "dribbles.parquet")
+
+
+def get_free_port():
+    # Let the OS pick a free local port for the render worker
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def get_process_group_usage(group_id):
+    """
+    Get the CPU time and memory of a process group (the render worker and its render processes).
+
+    Parameters
+    ----------
+    group_id: int
+        The id of the process group.
+
+    Returns
+    -------
+    cpu_seconds: float
+        The CPU time of all processes in the group, NaN if /proc is not available.
+    rss_bytes: float
+        The resident memory of all processes in the group, NaN if /proc is not available.
+    """
+    if not os.path.exists("/proc"):
+        return np.nan, np.nan
+
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    cpu_seconds, rss_bytes = 0.0, 0.0
+    for stat_path in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # The process name can contain spaces, the other fields come after its closing bracket
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[2]) != group_id:
+            continue
+        cpu_seconds += sum(int(field) for field in fields[11:15]) / clock_ticks
+        rss_bytes += int(fields[21]) * page_size
+
+    return cpu_seconds, rss_bytes
+
+
+def start_worker(env):
+    """
+    Start the render worker in its own process group and wait until it's healthy.
+
+    Parameters
+    ----------
+    env: dict
+        The environment of the worker (port, data, images and metrics directories).
+
+    Returns
+    -------
+    subprocess.Popen
+        The worker process.
+    """
+    from src.render_client import check_health
+
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "src.render_worker"], cwd=project_root, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+
+    start_time = time.monotonic()
+    while check_health() is None:
+        if time.monotonic() - start_time > 60 or worker.poll() is not None:
+            stop_worker(worker)
+            raise TimeoutError("Render worker didn't start within 60 seconds.")
+        time.sleep(0.2)
+
+    return worker
+
+
+def stop_worker(worker):
+    # Stop the worker and its render processes
+    try:
+        os.killpg(worker.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    worker.wait(timeout=10)
+
+
+def select_row(at, row):
+    """
+    Select a row of the player table, AppTest has no API for dataframe selections.
+
+    Parameters
+    ----------
+    at: AppTest
+        The session.
+    row: int
+        The row to select.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    # Send the selection as the widget state of the table, like the browser does
+    widget_states = at._tree.get_widget_states()
+    selection = {"selection": {"rows": [row], "columns": [], "cells": []}}
+    widget_states.widgets.append(WidgetState(id=at.dataframe[0].proto.id, string_value=json.dumps(selection)))
+    at._run(widget_states)
+
+
+def run_session(session_id, n_actions, plot_mode, think_time, seed, results):
+    """
+    Run a session: load the app and perform a random script of interactions.
+
+    Parameters
+    ----------
+    session_id: int
+        The id of the session.
+    n_actions: int
+        The number of interactions after loading the app.
+    plot_mode: str
+        "Image" or "Interactive" plots.
+    think_time: float
+        The mean number of seconds between interactions.
+    seed: int
+        The seed of the random script.
+    results: list
+        The list to add a (session, action, seconds, error) tuple to for every interaction.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng([seed, session_id])
+    at = AppTest.from_file(str(APP_PATH), default_timeout=300)
+
+    def timed(action, interact):
+        start_time = time.perf_counter()
+        error = None
+        try:
+            interact()
+            if at.exception:
+                error = at.exception[0].message
+        except Exception as exception:
+            error = repr(exception)
+        results.append((session_id, action, time.perf_counter() - start_time, error))
+        time.sleep(rng.exponential(think_time) if think_time else 0)
+
+    timed("load", at.run)
+    if plot_mode != "Image":
+        # Other controls (e.g. the percentile comparison) are only shown for some data, so find it by its label
+        timed("plot_mode", lambda: next(control for control in at.sidebar.segmented_control if control.label == "Plots").set_value(plot_mode).run())
+
+    for action in rng.choice(ACTIONS, n_actions):
+        if action == "position":
+            timed(action, lambda: at.sidebar.segmented_control[0].set_value(str(rng.choice(POSITIONS))).run())
+        elif action == "minutes":
+            timed(action, lambda: at.sidebar.number_input[0].set_value(int(rng.integers(0, 450))).run())
+        elif action == "dribbles":
+            timed(action, lambda: at.sidebar.number_input[1].set_value(int(rng.integers(0, 20))).run())
+        elif len(at.dataframe) and len(at.dataframe[0].value):
+            # Users select one of the top rows of the table
+            timed(action, lambda: select_row(at, int(rng.integers(0, min(len(at.dataframe[0].value), 20)))))
+
+
+def summarize_latency(results):
+    """
+    Summarize the latency of every interaction.
+
+    Parameters
+    ----------
+    results: list
+        The (session, action, seconds, error) tuple of every interaction.
+
+    Returns
+    -------
+    dict
+        The count, errors, mean, p50, p95, p99 and max latency (in seconds) of every interaction and of all together.
+    """
+    df = pd.DataFrame(results, columns=["session", "action", "seconds", "error"])
+    summary = {}
+    for action, df_action in [*df.groupby("action"), ("all", df)]:
+        seconds = df_action["seconds"].to_numpy()
+        summary[action] = {
+            "count": len(seconds),
+            "errors": int(df_action["error"].notna().sum()),
+            "mean": float(seconds.mean()),
+            "p50": float(np.percentile(seconds, 50)),
+            "p95": float(np.percentile(seconds, 95)),
+            "p99": float(np.percentile(seconds, 99)),
+            "max": float(seconds.max()),
+        }
+
+    return summary
+
+
+def print_report(report, baseline=None):
+    # Latency per interaction, with the change against the baseline
+    print(f"\n{report['sessions']} sessions, {report['actions']} actions each, {report['data']} data ({report['players']} players), "
+          f"{report['plot_mode'].lower()} plots, {report['wall_seconds']:.1f} s")
+    print(f"{'interaction':<12}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, stats in report["latency"].items():
+        line = f"{action:<12}{stats['count']:>7}{stats['errors']:>8}" + "".join(f"{stats[key] * 1000:>10.0f}" for key in ["p50", "p95", "p99", "max"])
+        if baseline is not None and action in baseline["latency"]:
+            changes = [stats[key] / baseline["latency"][action][key] - 1 for key in ["p50", "p95"] if baseline["latency"][action][key]]
+            line += "   vs baseline: " + ", ".join(f"{key} {change:+.0%}" for key, change in zip(["p50", "p95"], changes))
+        print(line)
+
+    resources = report["resources"]
+    print(f"\nApp: {resources['app_cpu_seconds']:.1f} s CPU, {resources['app_peak_rss_mb']:.0f} MB peak memory")
+    print(f"Render worker: {resources['worker_cpu_seconds']:.1f} s CPU, {resources['worker_rss_mb']:.0f} MB memory at the end")
+    print(f"Throughput: {report['throughput']:.2f} interactions per second")
+
+    if report["render"]:
+        print(f"\n{'render metric':<36}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+        for histogram in report["render"]:
+            name = f"{histogram['metric']} {histogram['labels']}"
+            print(f"{name:<36}{histogram['count']:>7}{histogram['p50'] * 1000:>10.0f}{histogram['p95'] * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent headless sessions.")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of concurrent sessions.")
+    parser.add_argument("--actions", type=int, default=8, help="Number of interactions per session after loading the app.")
+    parser.add_argument("--data", choices=["real", "synthetic"], default="real", help="The data files in data/ or synthetic data.")
+    parser.add_argument("--players", type=int, default=600, help="Number of players of the synthetic data.")
+    parser.add_argument("--plot-mode", choices=["Image", "Interactive"], default="Image", help="Plot mode of the sessions.")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean seconds between interactions of a session.")
+    parser.add_argument("--warm-cache", action="store_true", help="Use the rendered plots in generated_images/ instead of a cold cache.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the session scripts and synthetic data.")
+    parser.add_argument("--output", type=Path, help="Write the report as JSON.")
+    parser.add_argument("--compare", type=Path, help="Compare against a report written with --output.")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix="load_test_") as temp_dir:
+        temp_dir = Path(temp_dir)
+
+        # The app and the worker read the settings from the environment, so set it before importing src
+        os.environ["RENDER_WORKER_PORT"] = str(get_free_port())
+        os.environ["RENDER_WORKER_AUTHKEY"] = secrets.token_hex(32)
+        os.environ["APP_METRICS_DIR"] = str(temp_dir / "metrics")
+        if args.data == "synthetic":
+            os.environ["APP_DATA_DIR"] = str(temp_dir / "data")
+            create_synthetic_data(temp_dir / "data", args.players, seed=args.seed)
+        if not args.warm_cache:
+            os.environ["APP_IMAGES_DIR"] = str(temp_dir / "images")
+            for plots_dir in ["radar_plots", "pitch_plots"]:
+                (temp_dir / "images" / plots_dir).mkdir(parents=True)
+
+        from src.render_client import DATA_PATHS
+        from src.telemetry import read_metrics, summarize_metrics
+
+        n_players = len(pd.read_parquet(DATA_PATHS[0], columns=["player_id"]))
+        worker = start_worker(dict(os.environ))
+        results = []
+        try:
+            # Start all sessions at once
+            start_time = time.perf_counter()
+            sessions = [
+                threading.Thread(target=run_session, args=(session_id, args.actions, args.plot_mode, args.think_time, args.seed, results))
+                for session_id in range(args.sessions)
+            ]
+            for session in sessions:
+                session.start()
+            for session in sessions:
+                session.join()
+            wall_seconds = time.perf_counter() - start_time
+
+            worker_cpu_seconds, worker_rss_bytes = get_process_group_usage(worker.pid)
+        finally:
+            stop_worker(worker)
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, histograms = summarize_metrics(read_metrics())
+
+    report = {
+        "sessions": args.sessions,
+        "actions": args.actions,
+        "data": args.data,
+        "players": n_players,
+        "plot_mode": args.plot_mode,
+        "think_time": args.think_time,
+        "warm_cache": args.warm_cache,
+        "seed": args.seed,
+        "wall_seconds": wall_seconds,
+        "throughput": len(results) / wall_seconds,
+        "latency": summarize_latency(results),
+        "resources": {
+            "app_cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "app_peak_rss_mb": usage.ru_maxrss / 1024,
+            "worker_cpu_seconds": worker_cpu_seconds,
+            "worker_rss_mb": worker_rss_bytes / 1024 ** 2,
+        },
+        "render": [histogram for histogram in histograms if histogram["metric"] in ("plot_render_seconds", "worker_request_seconds")],
+        "errors": sorted({error for _, _, _, error in results if error is not None}),
+    }
+
+    print_report(report, baseline)
+    if report["errors"]:
+        print("\nErrors:\n" + "\n".join(report["errors"]))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=4))
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Stress test rendering the radar and pitch plots from a thread pool.
+
+The plots of the first players of a cohort are rendered once serially as the reference. Then every plot is rendered
+a few more times concurrently from a thread pool, in random (seeded) order, so renders of the same and of different
+plots overlap. Every image has to match its serial reference byte for byte, matplotlib's rcParams have to be
+unchanged afterwards and no figure may be registered with pyplot (see src/plot_style.py). The plots are rendered in
+a temporary image directory, the exit code is 1 if an image differs.
+
+Usage:
+    python render_stress.py                                         # 50 players, 3 concurrent renders per plot
+    python render_stress.py --players 100 --repeats 4 --threads 16
+    python render_stress.py --minutes 270 --dribbles 10             # another cohort
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from src.data_plots import filter_player_stats
+from src.schema import read_data
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def render_plot(plot, args):
+    """
+    Render a plot and hash the saved image.
+
+    Parameters
+    ----------
+    plot: str
+        "radar" or "pitch".
+    args: tuple
+        The content of a radar plot or the arguments of create_pitch_plot.
+
+    Returns
+    -------
+    str
+        The sha256 of the image.
+    """
+    # Plot modules are imported after the image directory is set
+    from src.pitch_plot import create_pitch_plot
+    from src.radar_plot import draw_radar_plot
+
+    if plot == "radar":
+        _, path = draw_radar_plot(*args)
+    else:
+        _, path = create_pitch_plot(*args)
+
+    # Images are replaced in one step, so this is a whole image of the plot (of this or a concurrent render)
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_jobs(df_player_stats, df_dribbles, position_filter, minutes_played_filter, dribbles_filter, n_players):
+    """
+    Get the radar and pitch plots of the first players of a cohort.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        The player stats of all players.
+    df_dribbles: pd.DataFrame
+        The dribbles of all players.
+    position_filter, minutes_played_filter, dribbles_filter:
+        The filters of the cohort.
+    n_players: int
+        The number of players.
+
+    Returns
+    -------
+    jobs: list
+        The plot, its key and the arguments of render_plot of every plot.
+    """
+    from src.radar_plot import get_radar_content
+
+    df_cohort = filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter)
+    if len(df_cohort) == 0:
+        raise ValueError(f"The cohort of {position_filter}, {minutes_played_filter} minutes and {dribbles_filter} dribbles is empty.")
+
+    jobs = []
+    for _, player in df_cohort.head(n_players).iterrows():
+        player_id = int(player["player_id"])
+        content = get_radar_content(df_cohort, player_id, position_filter, minutes_played_filter, dribbles_filter)
+        jobs.append(("radar", ("radar", player_id), (content,)))
+        jobs.append(("pitch", ("pitch", player_id), (df_dribbles, player_id, player["player_short_name"], player["team_name"])))
+
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test rendering the radar and pitch plots from a thread pool.")
+    parser.add_argument("--players", type=int, default=50, help="Players of the cohort to render.")
+    parser.add_argument("--repeats", type=int, default=3, help="Concurrent renders of every plot.")
+    parser.add_argument("--threads", type=int, default=8, help="Threads of the thread pool.")
+    parser.add_argument("--position", default="All", choices=["All", "Defenders", "Midfielders", "Forwards"])
+    parser.add_argument("--minutes", type=int, default=0, help="Minimum minutes played of the cohort.")
+    parser.add_argument("--dribbles", type=int, default=1, help="Minimum dribbles of the cohort (pitch plots need a dribble).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the render order.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="render_stress_") as directory:
+        # Render in a temporary image directory, the plot modules read it on import
+        os.environ["APP_IMAGES_DIR"] = directory
+        for plots_dir in ["radar_plots", "pitch_plots"]:
+            (Path(directory) / plots_dir).mkdir()
+
+        import matplotlib
+        import matplotlib.pyplot as plt
+
+        df_player_stats = read_data("player_stats", DATA_DIR / "player_stats.parquet")
+        df_dribbles = read_data("dribbles", DATA_DIR / "dribbles.parquet")
+        jobs = get_jobs(df_player_stats, df_dribbles, args.position, args.minutes, args.dribbles, args.players)
+        rc_params = dict(matplotlib.rcParams)
+
+        # Serial reference
+        start_time = time.perf_counter()
+        reference = {key: render_plot(plot, plot_args) for plot, key, plot_args in jobs}
+        serial_seconds = time.perf_counter() - start_time
+        print(f"Rendered {len(jobs)} plots serially in {serial_seconds:.1f}s")
+
+        # Concurrent renders of every plot, in random order
+        renders = jobs * args.repeats
+        random.Random(args.seed).shuffle(renders)
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            hashes = list(pool.map(lambda job: render_plot(job[0], job[2]), renders))
+        concurrent_seconds = time.perf_counter() - start_time
+        print(f"Rendered {len(renders)} plots in {args.threads} threads in {concurrent_seconds:.1f}s")
+
+        # Compare every render with its reference and check the global state of matplotlib
+        differences = sorted({key for (_, key, _), image_hash in zip(renders, hashes) if image_hash != reference[key]})
+        changed_params = sorted(key for key, value in matplotlib.rcParams.items() if rc_params.get(key) != value)
+        figures = plt.get_fignums()
+
+    for plot, player_id in differences:
+        print(f"Different {plot} plot of player {player_id}")
+    if changed_params:
+        print(f"Changed rcParams: {changed_params}")
+    if figures:
+        print(f"{len(figures)} figures registered with pyplot")
+
+    if differences or changed_params or figures:
+        sys.exit(1)
+    print(f"All {len(renders)} concurrent renders match their serial reference")
+
+
+if __name__ == "__main__":
+    main()
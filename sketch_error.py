@@ -0,0 +1,141 @@
+"""
+Measure the error of the percentile sketches against the exact percentiles (see src/percentile_sketch.py).
+
+The player stats are split into partitions like competitions, every partition is sketched and the sketches are merged.
+Every player of every reference cohort is then ranked in the merged sketches and exactly, like
+scipy.stats.percentileofscore (kind="rank") on the player stats of all partitions. The report has the guaranteed
+error bound of the sketches and the measured error in percentile points.
+
+Usage:
+    python sketch_error.py                                              # data/player_stats.parquet as one partition
+    python sketch_error.py --partitions 8                               # split into 8 partitions by team
+    python sketch_error.py --data synthetic --partitions 40 --players 2000
+    python sketch_error.py --k 50 100 200 400                           # compare sketch sizes
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.bootstrap import calculate_percentile_ranks
+from src.data_plots import INVERTED_COLUMNS, RADAR_COLUMNS
+from src.percentile_sketch import SKETCH_K, build_partition_sketches, get_rank_error_bound, get_sketch_percentiles, merge_sketches
+from src.positions import get_position_filter_mask
+from src.schema import read_data
+
+
+def get_partitions(data, n_partitions, n_players, seed=0):
+    """
+    Get the player stats of every partition.
+
+    Parameters
+    ----------
+    data: str
+        "real" to split data/player_stats.parquet by team, "synthetic" for synthetic competitions.
+    n_partitions: int
+        The number of partitions.
+    n_players: int
+        The number of players of a synthetic partition.
+    seed: int
+        The seed of the synthetic data.
+
+    Returns
+    -------
+    list
+        The player stats of every partition.
+    """
+    if data == "real":
+        df_player_stats = read_data("player_stats", Path(__file__).parent / "data" / "player_stats.parquet")
+        teams = np.array_split(np.random.default_rng(seed).permutation(df_player_stats["team_name"].unique()), n_partitions)
+        return [df_player_stats[df_player_stats["team_name"].isin(partition_teams)] for partition_teams in teams]
+
+    # Synthetic competitions with their own players
+    from load_test import create_synthetic_data
+
+    partitions = []
+    with tempfile.TemporaryDirectory(prefix="sketch_error_") as directory:
+        for i in range(n_partitions):
+            create_synthetic_data(Path(directory), n_players, seed=seed + i)
+            df_player_stats = read_data("player_stats", Path(directory) / "player_stats.parquet")
+            partitions.append(df_player_stats.assign(player_id=df_player_stats["player_id"] + i * n_players))
+
+    return partitions
+
+
+def measure_error(partitions, k):
+    """
+    Measure the error of the merged sketches of the partitions.
+
+    Parameters
+    ----------
+    partitions: list
+        The player stats of every partition.
+    k: int
+        The size of the sketches.
+
+    Returns
+    -------
+    report: dict
+        The guaranteed and measured errors in percentile points, the values per sketch and the build and merge time.
+    """
+    # Sketch every partition, then merge the sketches of every cohort and stat
+    start_time = time.perf_counter()
+    partition_sketches = [build_partition_sketches(df, k, seed) for seed, df in enumerate(partitions)]
+    build_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    sketches = {key: merge_sketches([sketches[key] for sketches in partition_sketches]) for key in partition_sketches[0]}
+    merge_seconds = time.perf_counter() - start_time
+
+    # Rank every player of every cohort in the merged sketch and exactly
+    df_player_stats = pd.concat(partitions, ignore_index=True)
+    errors = []
+    for (position_filter, minutes, dribbles, column), sketch in sketches.items():
+        df = df_player_stats[get_position_filter_mask(df_player_stats, position_filter)]
+        values = df.loc[(df["playing_time"] >= minutes * 60) & (df["attempted_dribbles"] >= dribbles), column].to_numpy(dtype=float)
+        if len(values) == 0:
+            continue
+        if column in INVERTED_COLUMNS:
+            values = -values
+        errors.append(np.abs(get_sketch_percentiles(sketch, values) - calculate_percentile_ranks(values)))
+    errors = np.concatenate(errors)
+
+    return {
+        "k": k,
+        "players": len(df_player_stats),
+        "values": np.mean([sum(len(values) for values in sketch["levels"]) for sketch in sketches.values()]),
+        "bound": max(get_rank_error_bound(sketch) for sketch in sketches.values()),
+        "max": errors.max(),
+        "p99": np.percentile(errors, 99),
+        "mean": errors.mean(),
+        "build_seconds": build_seconds,
+        "merge_seconds": merge_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the error of the percentile sketches against the exact percentiles.")
+    parser.add_argument("--data", choices=["real", "synthetic"], default="real")
+    parser.add_argument("--partitions", type=int, default=1, help="Number of partitions (competitions).")
+    parser.add_argument("--players", type=int, default=2000, help="Players per synthetic partition.")
+    parser.add_argument("--k", type=int, nargs="+", default=[SKETCH_K], help="Sketch sizes to measure.")
+    args = parser.parse_args()
+
+    partitions = get_partitions(args.data, args.partitions, args.players)
+    print(f"{len(partitions)} partitions, {sum(len(df) for df in partitions)} players, {len(RADAR_COLUMNS)} stats")
+    print(f"{'k':>5} {'values':>7} {'bound':>7} {'max':>7} {'p99':>7} {'mean':>7} {'build':>8} {'merge':>8}")
+    for k in args.k:
+        report = measure_error(partitions, k)
+        print(
+            f"{report['k']:>5} {report['values']:>7.0f} {report['bound']:>7.2f} {report['max']:>7.2f} {report['p99']:>7.2f} "
+            f"{report['mean']:>7.3f} {report['build_seconds']:>7.2f}s {report['merge_seconds']:>7.2f}s"
+        )
+    print("Errors in percentile points: bound is guaranteed, max, p99 and mean are measured against the exact percentiles.")
+
+
+if __name__ == "__main__":
+    main()
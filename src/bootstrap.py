@@ -0,0 +1,163 @@
+"""
+This module contains functions to calculate bootstrap confidence intervals for per 90 stats and their percentiles.
+
+Per 90 stats of players with few minutes are noisy. The bootstrap resamples the matches of every player with
+replacement, recalculates the stats from the resampled match totals and ranks all players of the cohort within
+every replicate. All replicates of all players are calculated at once as (replicates x players) arrays.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.data_plots import INVERTED_COLUMNS, RADAR_COLUMNS
+from src.metrics import METRICS, resolve_metrics
+
+
+def calculate_percentile_ranks(values):
+    """
+    Calculate the percentile rank of every value within its row, like scipy.stats.percentileofscore (kind="rank").
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The values, ranked along the last axis (e.g. stats x replicates x players).
+
+    Returns
+    -------
+    np.ndarray
+        The percentile ranks (0-100) with the same shape as values.
+    """
+    n = values.shape[-1]
+    order = np.argsort(values, axis=-1, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+    positions = np.broadcast_to(np.arange(n), values.shape)
+
+    # Tied values share the first (left) and one past the last (right) position of their block
+    block_start = np.ones(values.shape, dtype=bool)
+    block_start[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    block_end = np.ones(values.shape, dtype=bool)
+    block_end[..., :-1] = block_start[..., 1:]
+
+    left_sorted = np.maximum.accumulate(np.where(block_start, positions, 0), axis=-1)
+    right_sorted = np.flip(np.minimum.accumulate(np.flip(np.where(block_end, positions + 1, n), axis=-1), axis=-1), axis=-1)
+
+    # Put the positions back in the original order
+    left = np.empty_like(left_sorted)
+    right = np.empty_like(right_sorted)
+    np.put_along_axis(left, order, left_sorted, axis=-1)
+    np.put_along_axis(right, order, right_sorted, axis=-1)
+
+    # Values below count fully, tied values (including the value itself) count half
+    return (left + right + 1) * 50 / n
+
+
+def resample_player_totals(df_player_match_stats, player_ids, metrics, n_replicates=1000, seed=0):
+    """
+    Resample the matches of every player and sum the resampled matches per player.
+
+    Parameters
+    ----------
+    df_player_match_stats: pd.DataFrame
+        A dataframe with the stats of players per match (see calculate_player_match_stats).
+    player_ids: array-like
+        The players of the cohort.
+    metrics: list
+        The aggregated metrics to resample (columns of df_player_match_stats).
+    n_replicates: int
+        The number of bootstrap replicates.
+    seed: int
+        The seed of the random generator, so the intervals don't change between reruns.
+
+    Returns
+    -------
+    totals: dict
+        The resampled totals of every metric, as (replicates x players) arrays. Players without matches are NaN.
+    """
+    player_index = pd.Index(player_ids)
+    codes = player_index.get_indexer(df_player_match_stats["player_id"])
+    rows = np.flatnonzero(codes >= 0)
+
+    # Sort the match rows by player, so the matches of every player are a contiguous block
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    counts = np.bincount(codes[rows], minlength=len(player_index))
+    starts = np.cumsum(counts) - counts
+    sampled = counts > 0
+
+    # Draw every player's number of matches from their own block, for all replicates at once
+    rng = np.random.default_rng(seed)
+    owner = np.repeat(np.flatnonzero(sampled), counts[sampled])
+    draws = starts[owner] + (rng.random((n_replicates, len(rows))) * counts[owner]).astype(int)
+
+    totals = {}
+    for name in metrics:
+        values = df_player_match_stats[name].to_numpy(dtype=float)[rows][draws]
+        totals[name] = np.full((n_replicates, len(player_index)), np.nan)
+        totals[name][:, sampled] = np.add.reduceat(values, starts[sampled], axis=1)
+
+    return totals
+
+
+def calculate_bootstrap_intervals(df_player_match_stats, player_ids, columns=RADAR_COLUMNS, inverted_columns=INVERTED_COLUMNS, n_replicates=1000, confidence=0.9, seed=0):
+    """
+    Calculate bootstrap confidence intervals for the stats and percentiles of all players in a cohort.
+
+    Parameters
+    ----------
+    df_player_match_stats: pd.DataFrame
+        A dataframe with the stats of players per match (see calculate_player_match_stats).
+    player_ids: array-like
+        The players of the cohort (e.g. the filtered player stats), percentiles are calculated within the cohort.
+    columns: list
+        The stats to calculate intervals for. Per 90 stats are named <metric>_per90.
+    inverted_columns: list
+        The stats where lower is better, their percentiles are inverted.
+    n_replicates: int
+        The number of bootstrap replicates.
+    confidence: float
+        The confidence level of the intervals.
+    seed: int
+        The seed of the random generator.
+
+    Returns
+    -------
+    df_intervals: pd.DataFrame
+        A dataframe with the lower and upper bound of the value and percentile of every player and stat.
+    """
+    # Resample the aggregated metrics, derived metrics are recalculated from the resampled totals
+    required = resolve_metrics(columns)
+    table = resample_player_totals(
+        df_player_match_stats,
+        player_ids,
+        [name for name in required if "formula" not in METRICS[name]],
+        n_replicates,
+        seed
+    )
+    for name in required:
+        if "formula" in METRICS[name]:
+            table[name] = np.asarray(METRICS[name]["formula"](table), dtype=float)
+
+    # Stack all stats into a (stats x replicates x players) array
+    playing_time = np.where(table["playing_time"] > 0, table["playing_time"], np.nan)
+    values = np.stack([
+        table[name[:-len("_per90")]] / playing_time * 5400 if name.endswith("_per90") else table[name]
+        for name in columns
+    ])
+
+    # Rank the players of the cohort within every replicate
+    signs = np.array([-1 if name in inverted_columns else 1 for name in columns])[:, None, None]
+    percentiles = calculate_percentile_ranks(values * signs)
+    percentiles[np.isnan(values)] = np.nan
+
+    # Get the bounds of the intervals over the replicates
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    value_bounds = np.quantile(values, quantiles, axis=1)
+    percentile_bounds = np.quantile(percentiles, quantiles, axis=1)
+
+    return pd.DataFrame({
+        "player_id": np.tile(np.asarray(player_ids), len(columns)),
+        "metric": np.repeat(columns, len(player_ids)),
+        "value_lower": value_bounds[0].ravel(),
+        "value_upper": value_bounds[1].ravel(),
+        "percentile_lower": percentile_bounds[0].ravel(),
+        "percentile_upper": percentile_bounds[1].ravel(),
+    })
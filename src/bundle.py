@@ -0,0 +1,407 @@
+"""
+This module contains the app bundle: the data the app and the render worker load, prebuilt into a single file.
+
+The bundle has the typed data tables, the percentile cube of the default shot window and optionally low resolution
+thumbnails of the radar and pitch plots of the default filters. The cube's arrays are also the index of every cohort
+the filters can select (a cohort is a prefix of the sweep order of its position and dribbles threshold, see
+src/percentile_cube.py), so a replica that starts from the bundle doesn't read parquet files or build anything.
+The worker answers image requests of the default filters with a thumbnail while the full plot renders.
+
+The file is a header with a JSON manifest, followed by the sections it points to: the tables as Arrow IPC streams,
+the cube arrays as raw bytes and the thumbnails as PNG. Sections are aligned to 64 bytes, so the bundle is opened
+with a single memory map and tables and arrays are read from the mapped pages without copies.
+Build it with `python build_bundle.py` and set APP_BUNDLE to its path to use it.
+"""
+
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from src.render_client import DATA_PATHS, get_data_version
+from src.schema import SCHEMA_VERSION, create_arrow_table, read_data
+from src.telemetry import observe
+
+# Bump when the layout of the bundle changes, bundles of other versions have to be rebuilt
+BUNDLE_VERSION = 1
+
+# First bytes of a bundle, followed by the length of the manifest
+MAGIC = b"DRIBBLES"
+HEADER_SIZE = 16
+
+# Sections start at a multiple of this, so Arrow buffers and numpy arrays are aligned
+ALIGNMENT = 64
+
+# Data files of the app in DATA_PATHS order, the player match stats and form series are optional
+DATA_FILES = dict(zip(["player_stats", "dribbles", "player_match_stats", "player_form"], DATA_PATHS))
+OPTIONAL_FILES = ["player_match_stats", "player_form"]
+
+# Reads of the data files are repeated until no publish (see src/live.py) changed them while they were read
+SNAPSHOT_RETRIES = 20
+SNAPSHOT_RETRY_SECONDS = 0.1
+
+# Thumbnails are rendered for the default filters of the app, at a fifth of the resolution of the plots
+THUMBNAIL_FILTERS = {"position_filter": "All", "minutes_played_filter": 270, "dribbles_filter": 10, "shot_window": 15}
+THUMBNAIL_DPI = 60
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def read_app_data(name, bundle=None):
+    """
+    Read a data file of the app, from the bundle or from its parquet file.
+
+    Parameters
+    ----------
+    name: str
+        The name of the data file (see DATA_FILES).
+    bundle: dict
+        Optional opened bundle (see open_bundle). By default the parquet file is read.
+
+    Returns
+    -------
+    pd.DataFrame
+        The data (see read_data), None if an optional data file doesn't exist.
+    """
+    if bundle is not None:
+        return read_bundle_data(bundle, name) if name in bundle["manifest"]["tables"] else None
+    if name in OPTIONAL_FILES and not os.path.exists(DATA_FILES[name]):
+        return None
+
+    return read_data(name, DATA_FILES[name])
+
+
+def read_app_snapshot(names, bundle=None):
+    """
+    Read data files of the app together with the data version of exactly those files.
+
+    A publish of a live match replaces the data files one after another. The version is taken before and after
+    the files are read and the files are read again until it didn't change, so the app and the render worker
+    never label data with the version of other files.
+
+    Parameters
+    ----------
+    names: list
+        The names of the data files (see DATA_FILES).
+    bundle: dict
+        Optional opened bundle (see open_bundle). By default the parquet files are read.
+
+    Returns
+    -------
+    data: dict
+        The data per name (see read_app_data).
+    data_version: str
+        The version of the data (see get_data_version).
+
+    Raises
+    ------
+    RuntimeError
+        If the data files kept changing while they were read.
+    """
+    for _ in range(SNAPSHOT_RETRIES):
+        data_version = get_data_version()
+        data = {name: read_app_data(name, bundle) for name in names}
+        if get_data_version() == data_version:
+            return data, data_version
+        time.sleep(SNAPSHOT_RETRY_SECONDS)
+
+    raise RuntimeError(f"The data files kept changing while they were read ({SNAPSHOT_RETRIES} times).")
+
+
+def has_app_data(name, bundle=None):
+    """
+    Check if a data file of the app exists, in the bundle or as a parquet file.
+
+    Parameters
+    ----------
+    name: str
+        The name of the data file (see DATA_FILES).
+    bundle: dict
+        Optional opened bundle (see open_bundle).
+
+    Returns
+    -------
+    bool
+        Whether the data file exists.
+    """
+    if bundle is not None:
+        return name in bundle["manifest"]["tables"]
+
+    return os.path.exists(DATA_FILES[name])
+
+
+def create_thumbnails(df_player_stats, df_dribbles, cube, df_player_match_stats=None):
+    """
+    Render low resolution radar and pitch plots of all players of the default filters.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        The player stats of all players.
+    df_dribbles: pd.DataFrame
+        The dribbles of all players.
+    cube: dict
+        The percentile cube of the player stats (see build_percentile_cube).
+    df_player_match_stats: pd.DataFrame
+        Optional stats per player and match, to draw the bootstrap intervals like the render worker.
+
+    Returns
+    -------
+    thumbnails: dict
+        The PNG bytes of the radar and pitch plot per player id.
+    """
+    # Plot modules are imported here, so reading a bundle never imports matplotlib
+    from src.bootstrap import calculate_bootstrap_intervals
+    from src.data_plots import filter_player_stats
+    from src.percentile_cube import lookup_percentiles
+    from src.pitch_plot import create_pitch_plot
+    from src.plot_style import BACKGROUND_COLOR
+    from src.radar_plot import create_radar_plot
+
+    # The cohort of the default filters, like the worker's cohort
+    filters = list(THUMBNAIL_FILTERS.values())
+    df_cohort = filter_player_stats(df_player_stats, *filters[:3])
+    df_intervals = None
+    if df_player_match_stats is not None:
+        df_intervals = calculate_bootstrap_intervals(df_player_match_stats, df_cohort["player_id"])
+
+    thumbnails = {"radar": {}, "pitch": {}}
+    for _, player in df_cohort.iterrows():
+        player_id = int(player["player_id"])
+        percentiles = lookup_percentiles(cube, player_id, *filters)
+        figures = {
+            "radar": create_radar_plot(df_cohort, player_id, *filters, df_intervals, percentiles)[0],
+            "pitch": create_pitch_plot(df_dribbles, player_id, player["player_short_name"], player["team_name"], filters[3])[0],
+        }
+        for plot, fig in figures.items():
+            image = io.BytesIO()
+            fig.savefig(image, format="png", bbox_inches="tight", pad_inches=0.25, facecolor=BACKGROUND_COLOR, dpi=THUMBNAIL_DPI)
+            thumbnails[plot][player_id] = image.getvalue()
+
+    return thumbnails
+
+
+def write_bundle(path, tables, cube, thumbnails=None):
+    """
+    Write the bundle.
+
+    Parameters
+    ----------
+    path: str or Path
+        The path of the bundle.
+    tables: dict
+        The data per data file name (see DATA_FILES), the player stats and dribbles are required.
+    cube: dict
+        The percentile cube of the player stats (see build_percentile_cube).
+    thumbnails: dict
+        Optional thumbnails of the default filters (see create_thumbnails).
+
+    Returns
+    -------
+    manifest: dict
+        The manifest of the bundle, with the offset and length of every section.
+
+    Raises
+    ------
+    ValueError
+        If the player stats or dribbles are missing or a table doesn't fit its schema.
+    """
+    missing = [name for name in DATA_FILES if name not in OPTIONAL_FILES and name not in tables]
+    if missing:
+        raise ValueError(f"Missing data for the bundle: {', '.join(missing)}.")
+
+    manifest = {
+        "bundle_version": BUNDLE_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tables": {},
+        "cube": {key: cube[key] for key in ("shot_window", "cohorts", "nbytes")},
+        "thumbnails": None,
+    }
+    sections = []
+
+    def add_section(data):
+        # Offsets are relative to the end of the header and manifest, sections start aligned
+        offset = _align(sections[-1][0] + len(sections[-1][1])) if sections else 0
+        sections.append((offset, data))
+        return {"offset": offset, "length": len(data)}
+
+    # Tables as Arrow IPC streams with the types of their schema
+    for name, df in tables.items():
+        sink = pa.BufferOutputStream()
+        table = create_arrow_table(df, name)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        manifest["tables"][name] = add_section(sink.getvalue())
+
+    # Cube arrays as raw bytes with their type and shape
+    manifest["cube"]["positions"] = {
+        position_filter: {
+            key: {**add_section(np.ascontiguousarray(array).tobytes()), "dtype": array.dtype.str, "shape": list(array.shape)}
+            for key, array in position.items()
+        }
+        for position_filter, position in cube["positions"].items()
+    }
+
+    if thumbnails is not None:
+        manifest["thumbnails"] = {
+            "filters": THUMBNAIL_FILTERS,
+            "dpi": THUMBNAIL_DPI,
+            **{plot: {str(player_id): add_section(image) for player_id, image in images.items()} for plot, images in thumbnails.items()},
+        }
+
+    # Write to a temporary file and replace the bundle in one step, like the data files
+    manifest_bytes = json.dumps(manifest).encode()
+    data_start = _align(HEADER_SIZE + len(manifest_bytes))
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as bundle_file:
+            bundle_file.write(MAGIC + len(manifest_bytes).to_bytes(8, "little") + manifest_bytes)
+            for offset, data in sections:
+                bundle_file.seek(data_start + offset)
+                bundle_file.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return manifest
+
+
+def open_bundle(path):
+    """
+    Open a bundle with a memory map.
+
+    Parameters
+    ----------
+    path: str or Path
+        The path of the bundle.
+
+    Returns
+    -------
+    bundle: dict
+        The manifest and the mapped buffer of the bundle.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a bundle or has another bundle or schema version.
+    """
+    start_time = time.perf_counter()
+    memory_map = pa.memory_map(str(path), "r")
+    buffer = memory_map.read_buffer()
+
+    header = buffer.slice(0, HEADER_SIZE).to_pybytes()
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an app bundle.")
+    manifest_length = int.from_bytes(header[len(MAGIC):], "little")
+    manifest = json.loads(buffer.slice(HEADER_SIZE, manifest_length).to_pybytes())
+    if manifest["bundle_version"] != BUNDLE_VERSION or manifest["schema_version"] != SCHEMA_VERSION:
+        raise ValueError(
+            f"{path} is bundle version {manifest['bundle_version']} with schema version {manifest['schema_version']}, "
+            f"expected bundle version {BUNDLE_VERSION} with schema version {SCHEMA_VERSION}. Rebuild it with build_bundle.py."
+        )
+    observe("data_load_seconds", time.perf_counter() - start_time, {"file": "bundle"})
+
+    return {"memory_map": memory_map, "buffer": buffer, "data_start": _align(HEADER_SIZE + manifest_length), "manifest": manifest}
+
+
+def _get_section(bundle, section):
+    return bundle["buffer"].slice(bundle["data_start"] + section["offset"], section["length"])
+
+
+def read_bundle_data(bundle, name):
+    """
+    Read a data table of a bundle.
+
+    Parameters
+    ----------
+    bundle: dict
+        The opened bundle (see open_bundle).
+    name: str
+        The name of the data file (see DATA_FILES).
+
+    Returns
+    -------
+    pd.DataFrame
+        The data, like read_data.
+
+    Raises
+    ------
+    ValueError
+        If the bundle doesn't have the table.
+    """
+    if name not in bundle["manifest"]["tables"]:
+        raise ValueError(f"Invalid table: {name}. The bundle has: {', '.join(bundle['manifest']['tables'])}.")
+
+    start_time = time.perf_counter()
+    df = pa.ipc.open_stream(_get_section(bundle, bundle["manifest"]["tables"][name])).read_all().to_pandas()
+    observe("data_load_seconds", time.perf_counter() - start_time, {"file": name})
+
+    return df
+
+
+def get_bundle_cube(bundle):
+    """
+    Get the percentile cube of a bundle, its arrays are read-only views of the mapped bundle.
+
+    Parameters
+    ----------
+    bundle: dict
+        The opened bundle (see open_bundle).
+
+    Returns
+    -------
+    cube: dict
+        The percentile cube (see build_percentile_cube), with the time to map it as build time.
+    """
+    start_time = time.perf_counter()
+    manifest = bundle["manifest"]["cube"]
+    cube = {key: manifest[key] for key in ("shot_window", "cohorts", "nbytes")}
+    cube["positions"] = {
+        position_filter: {
+            key: np.frombuffer(_get_section(bundle, section), dtype=section["dtype"]).reshape(section["shape"])
+            for key, section in position.items()
+        }
+        for position_filter, position in manifest["positions"].items()
+    }
+    cube["build_seconds"] = time.perf_counter() - start_time
+
+    return cube
+
+
+def get_bundle_thumbnail(bundle, plot, player_id, filters):
+    """
+    Get the thumbnail of a plot from a bundle.
+
+    Parameters
+    ----------
+    bundle: dict
+        The opened bundle (see open_bundle).
+    plot: str
+        The plot: radar or pitch.
+    player_id: int
+        The id of the player.
+    filters: dict
+        The filters of the request. Radar thumbnails need the default filters, pitch thumbnails the default shot window.
+
+    Returns
+    -------
+    bytes
+        The PNG image, None if the bundle has no thumbnail for the plot and filters.
+    """
+    thumbnails = bundle["manifest"]["thumbnails"]
+    if thumbnails is None:
+        return None
+
+    keys = list(THUMBNAIL_FILTERS) if plot == "radar" else ["shot_window"]
+    if any(filters.get(key) != thumbnails["filters"][key] for key in keys):
+        return None
+
+    section = thumbnails[plot].get(str(int(player_id)))
+    return None if section is None else _get_section(bundle, section).to_pybytes()
@@ -2,48 +2,56 @@
 This module contains functions to prepare the data for plotting.
 """
 
+from src.positions import get_position_filter_mask
 
-from scipy import stats
+# Stats on the radar plot, in slice order
+RADAR_COLUMNS = [
+    "goals_per90", "assists_per90", "shots_per90", "shots_xg_per90",
+    "completed_dribbles_per90", "failed_dribbles_per90", "attempted_dribbles_per90", "dribble_success_rate",
+    "danger_dribbles_per90", "danger_dribbles_xg_per90", "dribbles_to_goals_per90"
+]
 
+# Stats where lower is better
+INVERTED_COLUMNS = ["failed_dribbles_per90"]
 
-def filter_players_by_position(df, position):
+
+def filter_player_stats(df_player_stats, position_filter, minutes_played_filter, dribbles_filter):
     """
-    Filter players who have played in any of the specified positions.
-    
+    Filter the player stats with the filters of the app.
+
     Parameters
     ----------
-    df: pd.DataFrame
-        DataFrame with player stats including 'positions' column.
-    position: str
-        The position to filter by. Valid positions are: Defenders, Midfielders and Forwards.
-    
+    df_player_stats: pd.DataFrame
+        DataFrame with player stats.
+    position_filter: str
+        The position to filter by: All, Defenders, Midfielders or Forwards (see get_position_filter_mask).
+    minutes_played_filter: int
+        The minimum minutes played.
+    dribbles_filter: int
+        The minimum number of attempted dribbles.
+
     Returns
     -------
     pd.DataFrame
-        Filtered player stats DataFrame.
-    
-    Raises
-    ------
-    ValueError
-        If position is not one of the accepted values: "Defenders", "Midfielders" or "Forwards".
+        Filtered player stats DataFrame with the playing time in minutes.
     """
-    # Get position ids
-    match position:
-        case "Defenders":
-            position_ids = {2, 3, 4, 5, 6, 7, 8}
-        case "Midfielders":
-            position_ids = {9, 10, 11, 12, 13, 14, 15, 16}
-        case "Forwards":
-            position_ids = {17, 18, 19, 20, 21, 22, 23, 24, 25}
-        case _:
-            raise ValueError(f"Invalid position: {position}. Valid positions are: Defenders, Midfielders and Forwards.")
-    
-    print(position_ids)
-    
-    return df[df['positions'].apply(lambda x: bool(x & position_ids))]
-
-
-def calculate_radar_plot_data(df, player_id):
+    df = df_player_stats.copy()
+
+    # Apply filters
+    if position_filter != "All":
+        df = df[get_position_filter_mask(df, position_filter)]
+    if minutes_played_filter:
+        df = df[df["playing_time"] >= minutes_played_filter * 60]
+    if dribbles_filter:
+        df = df[df["attempted_dribbles"] >= dribbles_filter]
+
+    # Convert playing time to minutes for display
+    df["playing_time"] = df["playing_time"] / 60
+
+    return df
+
+
+def calculate_radar_plot_data(df, player_id, percentiles=None):
     """
     Calculate the data for the radar plot.
 
@@ -53,6 +61,8 @@ def calculate_radar_plot_data(df, player_id):
         The dataframe with the player stats filtered by position (defender, midfielder, forward).
     player_id: int
         The id of the player to calculate the data for.
+    percentiles: list
+        Optional percentiles of the player from the percentile cube (see lookup_percentiles), so they aren't recalculated.
 
     Returns
     -------
@@ -62,13 +72,17 @@ def calculate_radar_plot_data(df, player_id):
         The percentiles for the radar plot.
     """
 
-    plot_columns = [
-        "goals_per90", "assists_per90", "shots_per90", "shots_xg_per90",
-        "completed_dribbles_per90", "failed_dribbles_per90", "attempted_dribbles_per90", "dribble_success_rate",
-        "danger_dribbles_per90", "danger_dribbles_xg_per90", "dribbles_to_goals_per90"
-    ]
+    plot_columns = RADAR_COLUMNS
+
+    # Values for radar plot
+    values = [round(x, 2) for x in df.loc[df["player_id"] == player_id, plot_columns].values[0]]
+    if percentiles is not None:
+        return values, list(percentiles)
+
+    columns_to_invert = INVERTED_COLUMNS
 
-    columns_to_invert = ["failed_dribbles_per90"]
+    # Import scipy only when percentiles are needed, filtering doesn't need it
+    from scipy import stats
 
     # Create copy for percentile calculation
     df_percentile = df.copy()
@@ -77,12 +91,8 @@ def calculate_radar_plot_data(df, player_id):
         df_percentile[column] = -df_percentile[column]
 
     # Filter for Doku
-    df_player = df.loc[df["player_id"] == player_id, plot_columns]
     df_player_percentile = df_percentile.loc[df_percentile["player_id"] == player_id, plot_columns]
 
-    # Values for radar plot
-    values = [round(x, 2) for x in df_player.values[0]]
-
     # Calculate percentiles
     percentiles = [
         int(stats.percentileofscore(df_percentile[column], df_player_percentile[column].iloc[0])) 
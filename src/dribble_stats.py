@@ -2,6 +2,12 @@
 This module contains functions to calculate the dribble stats for players.
 """
 
+import numpy as np
+import pandas as pd
+
+from src.dribbles import apply_shot_window
+
+
 def calculate_dribble_stats(df):
     """
     Calculate the number of dribbles for a player in a season.
@@ -68,4 +74,118 @@ def calculate_danger_dribble_stats(df):
     # Calculate xG per dribble
     df_danger_dribbles_stats['xg_per_danger_dribble'] = df_danger_dribbles_stats['danger_dribbles_xg'] / df_danger_dribbles_stats['danger_dribbles']
 
-    return df_danger_dribbles_stats
\ No newline at end of file
+    return df_danger_dribbles_stats
+
+
+def calculate_danger_dribble_sweep(df, shot_windows):
+    """
+    Calculate the danger dribble stats of players for several shot windows at once.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        A dataframe with all dribbles and their gap to the next shot (see get_dribble_shot_gaps).
+    shot_windows: list
+        The shot windows in seconds.
+
+    Returns
+    -------
+    df_danger_dribbles_sweep: pd.DataFrame
+        A dataframe with the danger dribble stats of every player for every shot window.
+    """
+    shot_windows = np.asarray(shot_windows)
+
+    # Danger flags for all windows from the single gap column: (dribbles x windows)
+    danger = df['shot_gap'].to_numpy()[:, None] <= shot_windows[None, :]
+    xg = np.where(danger, df['next_shot_xg'].to_numpy(dtype=float)[:, None], 0.0)
+    goals = danger & df['next_shot_goal'].to_numpy(dtype=bool)[:, None]
+
+    # Sum per player
+    player_codes, player_ids = pd.factorize(df['player_id'])
+    valid = player_codes >= 0
+    totals = np.zeros((3, len(player_ids), len(shot_windows)))
+    for i, values in enumerate([danger, xg, goals]):
+        np.add.at(totals[i], player_codes[valid], values[valid])
+
+    df_danger_dribbles_sweep = pd.DataFrame({
+        'shot_window': np.tile(shot_windows, len(player_ids)),
+        'player_id': np.repeat(player_ids.to_numpy(), len(shot_windows)),
+        'danger_dribbles': totals[0].ravel().astype(int),
+        'danger_dribbles_xg': totals[1].ravel(),
+        'dribbles_to_goals': totals[2].ravel().astype(int),
+    })
+
+    # Calculate xG per dribble
+    df_danger_dribbles_sweep['xg_per_danger_dribble'] = (
+        df_danger_dribbles_sweep['danger_dribbles_xg'] / df_danger_dribbles_sweep['danger_dribbles'].where(df_danger_dribbles_sweep['danger_dribbles'] > 0)
+    ).fillna(0)
+
+    return df_danger_dribbles_sweep
+
+
+def update_danger_dribble_stats(df_player_stats, df_dribbles, shot_window):
+    """
+    Replace the danger dribble stats (and their per 90 versions) of players with the stats for another shot window.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        A dataframe with player stats (see calculate_player_stats).
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles and their gap to the next shot (see get_dribble_shot_gaps).
+    shot_window: int
+        The shot window in seconds.
+
+    Returns
+    -------
+    df_player_stats: pd.DataFrame
+        A copy of the player stats with the danger dribble stats for the shot window.
+    """
+    df_sweep = calculate_danger_dribble_sweep(df_dribbles, [shot_window]).set_index('player_id')
+    df_player_stats = df_player_stats.copy()
+
+    danger_columns = ['danger_dribbles', 'danger_dribbles_xg', 'dribbles_to_goals', 'xg_per_danger_dribble']
+    for column in danger_columns:
+        values = df_sweep[column].reindex(df_player_stats['player_id'].to_numpy()).fillna(0).to_numpy()
+        df_player_stats[column] = values.astype(df_player_stats[column].dtype)
+        if f"{column}_per90" in df_player_stats.columns:
+            df_player_stats[f"{column}_per90"] = values / df_player_stats['playing_time'] * 5400
+
+    return df_player_stats
+
+
+def update_danger_dribble_match_stats(df_player_match_stats, df_dribbles, shot_window):
+    """
+    Replace the danger dribble stats of players per match with the stats for another shot window.
+
+    Parameters
+    ----------
+    df_player_match_stats: pd.DataFrame
+        A dataframe with player stats per match (see calculate_player_match_stats).
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles and their gap to the next shot (see get_dribble_shot_gaps).
+    shot_window: int
+        The shot window in seconds.
+
+    Returns
+    -------
+    df_player_match_stats: pd.DataFrame
+        A copy of the player stats per match with the danger dribble stats for the shot window.
+    """
+    df_danger = apply_shot_window(df_dribbles, shot_window)
+    df_danger_stats = (df_danger[df_danger['danger_dribble'] == True]
+                       .groupby(['player_id', 'match_id'])
+                       .agg(
+                           danger_dribbles=('player_id', 'count'),
+                           danger_dribbles_xg=('xg_from_dribble', 'sum'),
+                           dribbles_to_goals=('dribble_to_goal', 'sum')
+                       ))
+
+    # Align with the player match rows, matches without danger dribbles get 0
+    df_player_match_stats = df_player_match_stats.copy()
+    keys = pd.MultiIndex.from_frame(df_player_match_stats[['player_id', 'match_id']])
+    for column in df_danger_stats.columns:
+        values = df_danger_stats[column].reindex(keys).fillna(0).to_numpy()
+        df_player_match_stats[column] = values.astype(df_player_match_stats[column].dtype)
+
+    return df_player_match_stats
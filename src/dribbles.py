@@ -5,28 +5,37 @@ Module to get all (danger) dribbles
 import numpy as np
 import pandas as pd
 
-def get_dribbles_single_match(df, shot_window=15):
+from src.timeline import create_timeline, window_join
+
+# Dribble columns in the output
+dribble_columns = [
+    'match_id', 'type_name', 'player_id', 
+    'outcome_name', 'x', 'y', 
+    'danger_dribble', 'xg_from_dribble', 'dribble_to_goal',
+    'shot_gap', 'next_shot_xg', 'next_shot_goal'
+]
+
+
+def get_dribble_shot_gaps(df, df_timeline=None):
     """
-    Get all dribbles for a match and add xG from danger dribbles.
+    Get all dribbles and the time until the next shot of the same team in the same period.
+
+    The gap is calculated once for all matches with a window join on the event timeline (see src/timeline.py),
+    so danger dribbles for any shot window can be derived from it (see apply_shot_window).
 
     Parameters
     ----------
     df: pd.DataFrame
-        A dataframe with all Statsbomb event data for a single match.
+        A dataframe with Statsbomb event data for one or more matches.
+    df_timeline: pd.DataFrame
+        Optional timeline of df (see create_timeline), created when not given.
 
     Returns
     -------
     df_dribbles: pd.DataFrame
-        A dataframe with all dribbles for a single match and the xG for danger dribbles.
+        A dataframe with all dribbles, the gap in seconds to the next shot of the team (NaN for incomplete dribbles
+        or if the team doesn't shoot anymore in the period), the xG of that shot and whether it was a goal.
     """
-    
-    # Period start times in seconds
-    period_starts = {
-        1: 0,          # First half: start at 0:00
-        2: 45 * 60,    # Second half: start at 45:00
-        3: 90 * 60,    # First ET: start at 90:00
-        4: 105 * 60    # Second ET: start at 105:00
-    }
 
     # Relevant columns
     relevant_columns = [
@@ -35,90 +44,82 @@ def get_dribbles_single_match(df, shot_window=15):
         "outcome_name", "x", "y", "shot_statsbomb_xg"
     ]
 
-    # Init dribbles list
-    dribbles_list = []
-
-    # Iterate through periods
-    for period in [1, 2, 3, 4]:
-        # Get all dribbles
-        dribbles_mask = (
-            (df["type_name"] == "Dribble") &
-            (df["period"] == period)
-        )
-        
-        dribbles_df = df.loc[dribbles_mask, relevant_columns].copy()
-
-        if dribbles_df.empty:
-            continue
-
-        # Get all shots
-        shots_mask = (
-            (df["type_name"] == "Shot") &
-            (df["period"] == period)
-        )
-
-        shots_df = df.loc[shots_mask, relevant_columns].copy()
-
-        if shots_df.empty:
-            continue
-
-        # Init new columns
-        dribbles_df['danger_dribble'] = False
-        dribbles_df['xg_from_dribble'] = 0.0
-        dribbles_df['dribble_to_goal'] = False
-
-        # Look for danger dribbles
-        for idx, dribble in dribbles_df.iterrows():
-            # Skip if dribble is not successful
-            if dribble['outcome_name'] != 'Complete':
-                continue
-
-            dribble_time = dribble['minute'] * 60 + dribble['second']
-            dribble_team = dribble['team_name']
-
-            # Filter shots by team
-            df_team_shots = shots_df[shots_df['team_name'] == dribble_team]
-
-            # Skip if no shots for team
-            if df_team_shots.empty:
-                continue
-
-            # Calculate shot window
-            team_shots_times = df_team_shots["minute"] * 60 + df_team_shots["second"]
-            team_shots_start = team_shots_times - shot_window
-            team_shots_start = np.maximum(team_shots_start, period_starts[period])
-            
-            # Check if this dribble is within any shot window
-            is_dangerous = np.any((team_shots_start <= dribble_time) & (dribble_time <= team_shots_times))
-            
-            if is_dangerous:
-                # Find which shots match with this dribble
-                matching_shots = (team_shots_start <= dribble_time) & (dribble_time <= team_shots_times)
-                
-                # Get the matching shots data
-                df_matching_shots = df_team_shots.loc[matching_shots]
-                
-                # Update dataframe
-                dribbles_df.at[idx, 'danger_dribble'] = True
-                dribbles_df.at[idx, 'xg_from_dribble'] = df_matching_shots['shot_statsbomb_xg'].values[0]
-                dribbles_df.at[idx, 'dribble_to_goal'] = True if df_matching_shots['outcome_name'].values[0] == 'Goal' else False
-
-        dribbles_list.append(dribbles_df)
-
-    # Concatenate all dribbles
-    df_dribbles = pd.concat(dribbles_list)
-
-    # Filter out columns that are not needed
-    df_dribbles = df_dribbles[[
-        'match_id', 'type_name', 'player_id', 
-        'outcome_name', 'x', 'y', 
-        'danger_dribble', 'xg_from_dribble', 'dribble_to_goal'
-    ]]
-    
+    # Only check first half, second half and extra time but not penalties
+    periods_mask = df["period"].isin([1, 2, 3, 4]).to_numpy()
+    dribbles_mask = periods_mask & (df["type_name"] == "Dribble").to_numpy()
+    shots_mask = periods_mask & (df["type_name"] == "Shot").to_numpy()
+
+    # Find the first shot of the same team in the same period at or after each completed dribble
+    if df_timeline is None:
+        df_timeline = create_timeline(df)
+    completed_mask = dribbles_mask & (df["outcome_name"] == "Complete").to_numpy()
+    dribble_rows, shot_rows = window_join(df_timeline, completed_mask, shots_mask, before=0, after=None, team="same", first=True)
+
+    # Add gaps to all dribbles in event order
+    times = (df["minute"] * 60 + df["second"]).to_numpy()
+    shot_gap = pd.Series(np.nan, index=np.flatnonzero(dribbles_mask))
+    next_shot_xg = shot_gap.copy()
+    next_shot_goal = pd.Series(False, index=shot_gap.index)
+    shot_gap[dribble_rows] = times[shot_rows] - times[dribble_rows]
+    next_shot_xg[dribble_rows] = df["shot_statsbomb_xg"].to_numpy()[shot_rows]
+    next_shot_goal[dribble_rows] = (df["outcome_name"] == "Goal").to_numpy()[shot_rows]
+
+    df_dribbles = df.loc[dribbles_mask, relevant_columns].reset_index(drop=True)
+    df_dribbles["shot_gap"] = shot_gap.to_numpy()
+    df_dribbles["next_shot_xg"] = next_shot_xg.to_numpy()
+    df_dribbles["next_shot_goal"] = next_shot_goal.to_numpy()
+
+    return df_dribbles
+
+
+def apply_shot_window(df_dribbles, shot_window=15):
+    """
+    Flag danger dribbles for a shot window.
+
+    Parameters
+    ----------
+    df_dribbles: pd.DataFrame
+        A dataframe with dribbles and their gap to the next shot (see get_dribble_shot_gaps).
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+
+    Returns
+    -------
+    df_dribbles: pd.DataFrame
+        A copy of the dribbles with the danger_dribble, xg_from_dribble and dribble_to_goal columns for the shot window.
+    """
+    df_dribbles = df_dribbles.copy()
+
+    danger_mask = (df_dribbles["shot_gap"] <= shot_window).to_numpy()
+    df_dribbles["danger_dribble"] = danger_mask
+    df_dribbles["xg_from_dribble"] = np.where(danger_mask, df_dribbles["next_shot_xg"], 0.0)
+    df_dribbles["dribble_to_goal"] = danger_mask & df_dribbles["next_shot_goal"].to_numpy()
+
     return df_dribbles
 
 
-def get_all_dribbles(match_ids, df):
+def get_dribbles_single_match(df, shot_window=15):
+    """
+    Get all dribbles for a match and add xG from danger dribbles.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for a single match.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+
+    Returns
+    -------
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles for a single match and the xG for danger dribbles.
+    """
+    df_dribbles = apply_shot_window(get_dribble_shot_gaps(df), shot_window)
+
+    return df_dribbles[dribble_columns]
+
+
+def get_all_dribbles(match_ids, df, shot_window=15):
     """
 
     Get all dribbles for a season and add xG from danger dribbles.
@@ -129,6 +130,8 @@ def get_all_dribbles(match_ids, df):
         A list of match ids to get the dribbles for.
     df: pd.DataFrame
         A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
 
     Returns
     -------
@@ -136,16 +139,10 @@ def get_all_dribbles(match_ids, df):
         A dataframe with all dribbles for a season and the xG from danger dribbles.
     """
 
-    # Init empty list for dribbles
-    dribbles_list = []
-
-    # Loop through all matches and get dribbles
-    for match_id in match_ids:
-        df_match = df[df['match_id'] == match_id]
-        df_dribbles_match = get_dribbles_single_match(df_match)
-        dribbles_list.append(df_dribbles_match)
+    # Get dribbles of all matches at once, in the order of match_ids
+    df_matches = df[df['match_id'].isin(match_ids)]
+    df_dribbles = apply_shot_window(get_dribble_shot_gaps(df_matches), shot_window)[dribble_columns]
+    match_order = pd.Series(np.arange(len(match_ids)), index=match_ids)
+    df_dribbles = df_dribbles.iloc[np.argsort(match_order[df_dribbles['match_id']].to_numpy(), kind='stable')]
 
-    # Concatenate all dribbles
-    df_dribbles = pd.concat(dribbles_list)
-    
-    return df_dribbles
\ No newline at end of file
+    return df_dribbles.reset_index(drop=True)
@@ -0,0 +1,107 @@
+"""
+This module contains functions to calculate the form of players: their stats over the last matches, match by match.
+
+The form series has a row per player and match with the aggregated stats of the match (see
+calculate_player_match_stats), in the order the player played them. Rolling stats over the last N matches are
+differences of cumulative sums: every stat of all players is summed once along the series, and the total of a
+window is the cumulative sum at its last match minus the one before its first match. Per 90 stats and rates are
+calculated from the window totals, like the tournament stats.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import METRICS, get_per90_metrics
+
+# Aggregated stats of a match, the other stats are calculated from them
+FORM_COLUMNS = [name for name, metric in METRICS.items() if "formula" not in metric]
+
+
+def create_form_series(df_player_match_stats, df_matches, df_player_info):
+    """
+    Create the form series: the stats of every player in every match, in match order.
+
+    Parameters
+    ----------
+    df_player_match_stats: pd.DataFrame
+        The stats of every player in every match (see calculate_player_match_stats).
+    df_matches: pd.DataFrame
+        The matches with their date and teams (see get_all_matches).
+    df_player_info: pd.DataFrame
+        The team of every player (see get_player_info).
+
+    Returns
+    -------
+    df_form: pd.DataFrame
+        A dataframe with the player id, match id, match date, opponent and stats per player and match,
+        sorted by player and date.
+    """
+    df_matches = df_matches[["match_id", "match_date", "kick_off", "home_team_name", "away_team_name"]]
+    df_form = df_player_match_stats.merge(df_matches, on="match_id").merge(df_player_info[["player_id", "team_name"]], on="player_id")
+
+    # The opponent is the other team of the match
+    df_form["opponent"] = df_form["away_team_name"].where(df_form["team_name"] == df_form["home_team_name"], df_form["home_team_name"])
+    df_form["match_date"] = pd.to_datetime(df_form["match_date"]).dt.date
+
+    # Matches of a player in the order they were played
+    df_form = df_form.sort_values(["player_id", "match_date", "kick_off"], kind="stable")
+
+    return df_form[["player_id", "match_id", "match_date", "opponent", *FORM_COLUMNS]].reset_index(drop=True)
+
+
+def calculate_rolling_form(df_form, window=3):
+    """
+    Calculate the stats of every player over the last matches, at every match.
+
+    Parameters
+    ----------
+    df_form: pd.DataFrame
+        The form series (see create_form_series), sorted by player and match order.
+    window: int
+        The number of matches in the window, earlier matches of a player use the matches they played so far.
+
+    Returns
+    -------
+    df_rolling: pd.DataFrame
+        A dataframe with the player id, match id, match date, opponent, the number of matches and playing time
+        in the window and the per 90 and rate stats over the window.
+
+    Raises
+    ------
+    ValueError
+        If window is smaller than 1.
+    """
+    if window < 1:
+        raise ValueError(f"Invalid window: {window}. The window must be at least 1 match.")
+
+    # Cumulative sums of all stats, with a leading zero row so a window can start at the first match
+    values = df_form[FORM_COLUMNS].to_numpy(dtype=float)
+    cumulative = np.vstack([np.zeros((1, len(FORM_COLUMNS))), np.cumsum(values, axis=0)])
+
+    # A window starts at most window - 1 matches back, but not before the player's first match
+    rows = np.arange(len(df_form))
+    player_ids = df_form["player_id"].to_numpy()
+    first_rows = np.flatnonzero(np.r_[True, player_ids[1:] != player_ids[:-1]])
+    player_first_rows = first_rows[np.searchsorted(first_rows, rows, side="right") - 1]
+    window_starts = np.maximum(player_first_rows, rows - window + 1)
+    totals = cumulative[rows + 1] - cumulative[window_starts]
+    table = {name: totals[:, i] for i, name in enumerate(FORM_COLUMNS)}
+
+    # Derived stats from the window totals, in registry order
+    for name, metric in METRICS.items():
+        if "formula" in metric:
+            table[name] = np.asarray(metric["formula"](table), dtype=float)
+
+    df_rolling = df_form[["player_id", "match_id", "match_date", "opponent"]].copy()
+    df_rolling["matches"] = rows - window_starts + 1
+    df_rolling["playing_time"] = table["playing_time"]
+
+    # Windows without playing time have no per 90 stats
+    playing_time = np.where(table["playing_time"] > 0, table["playing_time"], np.nan)
+    for name in get_per90_metrics():
+        df_rolling[f"{name}_per90"] = table[name] / playing_time * 5400
+    for name, metric in METRICS.items():
+        if "formula" in metric and not metric["per90"]:
+            df_rolling[name] = table[name]
+
+    return df_rolling
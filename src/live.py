@@ -0,0 +1,541 @@
+"""
+This module contains a live mode that updates the player stats and dribbles while a match is being played.
+
+The events of the match are read in order from a feed: a JSON lines file with one StatsBomb event per line (the
+columns of the parser's event data), appended to while the match is played (see follow_feed). Every event updates
+the state of the match in constant (amortized) time:
+- the playing time of a player runs from the start of the match (or their substitution) until they go off
+- goals, assists, shots and dribbles are counted per player
+- completed dribbles wait in a queue per team until the team shoots or the longest shot window has passed, then
+  their danger flag is final. Shots resolve the queue immediately, so the danger dribble counts are always up to date
+The stats of the match are added to the data files as they were before the match and published to the data files
+of the app (see publish_live_match), which reloads them on the next rerun. When the match is over, the playing time
+is recalculated with the rules of calculate_playing_time_single_match (e.g. for added time), so the final stats are
+the same as the stats of create_data.py.
+"""
+
+import datetime
+import json
+import math
+import os
+import time
+from collections import deque
+
+import pandas as pd
+
+from src.dribbles import dribble_columns
+from src.metrics import METRICS, get_metric_dtypes, get_per90_metrics
+from src.player_stats import calculate_per90_columns
+from src.playing_time import calculate_playing_time_single_match
+from src.positions import create_position_matrix, get_position_labels, get_position_masks
+from src.render_client import DATA_PATHS
+from src.schema import read_data, write_data
+
+# Aggregated stats of a match, the other stats are calculated from them
+MATCH_COLUMNS = [name for name, metric in METRICS.items() if "formula" not in metric]
+
+# Type of the last event of a feed, written by write_feed when the match is over
+END_EVENT = "Match End"
+
+# Periods with playing time and danger dribbles (no penalty shootout)
+PLAY_PERIODS = (1, 2, 3, 4)
+
+# Cards that send a player off
+RED_CARDS = ("Red Card", "Second Yellow")
+
+# Columns of the events that decide the playing time (see calculate_playing_time_single_match)
+CLOCK_COLUMNS = [
+    "match_id", "period", "timestamp", "minute", "second", "type_name", "team_name", "player_id",
+    "substitution_replacement_id", "foul_committed_card_name", "bad_behaviour_card_name",
+]
+
+
+def _get_id(event, column):
+    # Ids are floats in the parser's event data and missing for some events
+    value = event.get(column)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return int(value)
+
+
+def _get_float(event, column):
+    value = event.get(column)
+    return math.nan if value is None else float(value)
+
+
+def _period_seconds(timestamp):
+    # Time since the start of the period, the timestamp is a time of day like "00:12:34.567"
+    timestamp = datetime.time.fromisoformat(timestamp)
+    return timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second + timestamp.microsecond / 1e6
+
+
+def create_live_match(match_id, shot_window=15, max_shot_window=30):
+    """
+    Create the state of a live match.
+
+    Parameters
+    ----------
+    match_id: int
+        The match id of the feed.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+    max_shot_window: int
+        The longest shot window of the app. The gap to the next shot is kept for dribbles up to this window, so the
+        danger dribbles of every shot window in the app can be derived from the published dribbles.
+
+    Returns
+    -------
+    live: dict
+        The state of the match.
+
+    Raises
+    ------
+    ValueError
+        If shot_window is not positive or longer than max_shot_window.
+    """
+    if not 0 < shot_window <= max_shot_window:
+        raise ValueError(f"Invalid shot window: {shot_window}. It must be positive and at most {max_shot_window} seconds.")
+
+    return {
+        "match_id": match_id,
+        "shot_window": shot_window,
+        "max_shot_window": max_shot_window,
+        "period": None,
+        "period_lengths": {},
+        "period_start": 0.0,
+        "elapsed": 0.0,
+        "players": {},
+        "sub_on_times": {},
+        "open_dribbles": {},
+        "last_shots": {},
+        "dribbles": [],
+        "positions": {},
+        "clock_events": [],
+        "events": 0,
+        "finished": False,
+    }
+
+
+def _get_player(live, player_id, event):
+    # Players are on the pitch from the start, unless they came on as a substitute
+    if player_id not in live["players"]:
+        live["players"][player_id] = {
+            "player_name": event.get("player_name"),
+            "team_name": event.get("team_name"),
+            "on_since": live["sub_on_times"].pop(player_id, 0.0),
+            "playing_time": 0.0,
+            "stats": {name: 0 for name in MATCH_COLUMNS if name != "playing_time"},
+        }
+    return live["players"][player_id]
+
+
+def _take_off(live, player):
+    if player["on_since"] is not None:
+        player["playing_time"] += live["elapsed"] - player["on_since"]
+        player["on_since"] = None
+
+
+def _resolve_dribble(live, dribble, gap, xg, goal):
+    # The dribble's window is closed by a shot of its team, a danger dribble if the shot is within the shot window
+    dribble["shot_gap"] = gap
+    dribble["next_shot_xg"] = xg
+    dribble["next_shot_goal"] = goal
+    if gap <= live["shot_window"]:
+        dribble["danger_dribble"] = True
+        dribble["xg_from_dribble"] = xg
+        dribble["dribble_to_goal"] = goal
+        stats = live["players"][dribble["player_id"]]["stats"]
+        stats["danger_dribbles"] += 1
+        stats["danger_dribbles_xg"] += 0.0 if math.isnan(xg) else xg
+        stats["dribbles_to_goals"] += int(goal)
+
+
+def _close_windows(live, period=None, match_time=None):
+    # Dribbles of another period or longer ago than the longest shot window stay no danger dribbles
+    for queue in live["open_dribbles"].values():
+        while queue and (period is None or queue[0][1] != period or match_time - queue[0][2] > live["max_shot_window"]):
+            queue.popleft()
+
+
+def ingest_event(live, event):
+    """
+    Update the state of a live match with the next event of the feed.
+
+    Parameters
+    ----------
+    live: dict
+        The state of the match (see create_live_match).
+    event: dict
+        The event, with the columns of the parser's event data (see write_feed).
+
+    Raises
+    ------
+    ValueError
+        If the match is over or the event is of another match.
+    """
+    if live["finished"]:
+        raise ValueError(f"Match {live['match_id']} is over, it can't ingest more events.")
+    if _get_id(event, "match_id") not in (None, live["match_id"]):
+        raise ValueError(f"Invalid event: it is of match {event['match_id']}, the feed is of match {live['match_id']}.")
+
+    type_name = event.get("type_name")
+    if type_name == END_EVENT:
+        finish_live_match(live)
+        return
+
+    live["events"] += 1
+    period = event["period"]
+    team_name = event.get("team_name")
+    match_time = event["minute"] * 60 + event["second"]
+
+    # A new period closes the windows of the previous one and starts where the played periods end
+    if period != live["period"]:
+        _close_windows(live)
+        live["period"] = period
+        live["period_start"] = float(sum(live["period_lengths"].values()))
+    if period in PLAY_PERIODS and event.get("timestamp") is not None:
+        live["elapsed"] = live["period_start"] + _period_seconds(event["timestamp"])
+    _close_windows(live, period, match_time)
+
+    player_id = _get_id(event, "player_id")
+    player = None
+    if player_id is not None:
+        player = _get_player(live, player_id, event)
+        position_id = _get_id(event, "position_id")
+        if position_id is not None:
+            live["positions"][(player_id, position_id)] = live["positions"].get((player_id, position_id), 0) + 1
+
+    # Playing time: period lengths, substitutions and red cards
+    if type_name == "Half End" and period in PLAY_PERIODS and period not in live["period_lengths"]:
+        timestamp = datetime.time.fromisoformat(event["timestamp"])
+        live["period_lengths"][period] = (timestamp.hour * 60 + timestamp.minute) * 60 + timestamp.second
+        live["clock_events"].append(event)
+    if type_name == "Substitution" and player is not None:
+        _take_off(live, player)
+        replacement_id = _get_id(event, "substitution_replacement_id")
+        if replacement_id in live["players"]:
+            live["players"][replacement_id]["on_since"] = live["elapsed"]
+        elif replacement_id is not None:
+            live["sub_on_times"][replacement_id] = live["elapsed"]
+        live["clock_events"].append(event)
+    if player is not None and (event.get("foul_committed_card_name") in RED_CARDS or event.get("bad_behaviour_card_name") in RED_CARDS):
+        _take_off(live, player)
+        live["clock_events"].append(event)
+
+    if player is None:
+        return
+
+    # Goals (no penalty shootout, own goals don't have an outcome id), assists and shots
+    stats = player["stats"]
+    if _get_id(event, "outcome_id") == 97 and period != 5:
+        stats["goals"] += 1
+    if event.get("pass_goal_assist") is True:
+        stats["assists"] += 1
+    if type_name == "Shot":
+        xg = _get_float(event, "shot_statsbomb_xg")
+        goal = event.get("outcome_name") == "Goal"
+        stats["shots"] += 1
+        stats["shots_xg"] += 0.0 if math.isnan(xg) else xg
+
+        # The shot closes the windows of all waiting dribbles of the team
+        if period in PLAY_PERIODS:
+            queue = live["open_dribbles"].setdefault(team_name, deque())
+            while queue:
+                dribble, _, dribble_time = queue.popleft()
+                _resolve_dribble(live, dribble, match_time - dribble_time, xg, goal)
+            live["last_shots"][team_name] = (period, match_time, xg, goal)
+
+    # Dribbles: counted at once, completed dribbles wait for a shot of the team
+    if type_name == "Dribble" and period in PLAY_PERIODS:
+        outcome_name = event.get("outcome_name")
+        stats["completed_dribbles"] += outcome_name == "Complete"
+        stats["failed_dribbles"] += outcome_name == "Incomplete"
+        dribble = {
+            "match_id": live["match_id"],
+            "type_name": type_name,
+            "player_id": player_id,
+            "outcome_name": outcome_name,
+            "x": _get_float(event, "x"),
+            "y": _get_float(event, "y"),
+            "danger_dribble": False,
+            "xg_from_dribble": 0.0,
+            "dribble_to_goal": False,
+            "shot_gap": math.nan,
+            "next_shot_xg": math.nan,
+            "next_shot_goal": False,
+        }
+        live["dribbles"].append(dribble)
+
+        if outcome_name == "Complete":
+            # A shot at the same second counts, even if it came first in the feed
+            last_shot = live["last_shots"].get(team_name)
+            if last_shot is not None and last_shot[:2] == (period, match_time):
+                _resolve_dribble(live, dribble, 0, last_shot[2], last_shot[3])
+            else:
+                live["open_dribbles"].setdefault(team_name, deque()).append((dribble, period, match_time))
+
+
+def finish_live_match(live):
+    """
+    Close all dribble windows and calculate the final playing time of a live match.
+
+    Parameters
+    ----------
+    live: dict
+        The state of the match (see create_live_match).
+    """
+    _close_windows(live)
+
+    # The period lengths, substitutions and red cards decide the playing time, like in the full event data
+    rows = [{column: event.get(column) for column in CLOCK_COLUMNS} for event in live["clock_events"]]
+    for row in rows:
+        if row["type_name"] == "Half End":
+            row["timestamp"] = datetime.time.fromisoformat(row["timestamp"])
+    rows += [{"match_id": live["match_id"], "player_id": player_id} for player_id in live["players"]]
+    df_playing_time = calculate_playing_time_single_match(pd.DataFrame(rows, columns=CLOCK_COLUMNS))
+
+    for player_id, playing_time in zip(df_playing_time["player_id"], df_playing_time["playing_time"]):
+        player = live["players"][int(player_id)]
+        player["playing_time"] = float(playing_time)
+        player["on_since"] = None
+
+    live["finished"] = True
+
+
+def get_live_match_stats(live):
+    """
+    Get the stats of every player in a live match so far.
+
+    Parameters
+    ----------
+    live: dict
+        The state of the match (see create_live_match).
+
+    Returns
+    -------
+    df_match_stats: pd.DataFrame
+        A dataframe with the aggregated stats per player of the match, like calculate_player_match_stats.
+    """
+    rows = []
+    for player_id, player in live["players"].items():
+        # Players on the pitch have played until the last event
+        playing_time = player["playing_time"]
+        if player["on_since"] is not None:
+            playing_time += live["elapsed"] - player["on_since"]
+        rows.append({"player_id": player_id, "match_id": live["match_id"], "playing_time": round(playing_time), **player["stats"]})
+
+    return pd.DataFrame(rows, columns=["player_id", "match_id", *MATCH_COLUMNS])
+
+
+def get_live_dribbles(live):
+    """
+    Get the dribbles of a live match so far.
+
+    Parameters
+    ----------
+    live: dict
+        The state of the match (see create_live_match).
+
+    Returns
+    -------
+    df_dribbles: pd.DataFrame
+        A dataframe with the dribbles of the match, like get_all_dribbles. Dribbles in an open window are no
+        danger dribbles (yet), dribbles without a shot within the longest shot window have no shot gap.
+    """
+    return pd.DataFrame(live["dribbles"], columns=dribble_columns)
+
+
+def update_player_stats(df_player_stats, df_match_stats, live):
+    """
+    Add the stats of a live match to the player stats of the earlier matches.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        The player stats before the match (see calculate_player_stats).
+    df_match_stats: pd.DataFrame
+        The stats of the players in the match (see get_live_match_stats).
+    live: dict
+        The state of the match (see create_live_match), for the names, teams and positions of new players.
+
+    Returns
+    -------
+    df_player_stats: pd.DataFrame
+        The player stats with the match, with the same columns.
+    """
+    info_columns = [column for column in df_player_stats.columns if column not in METRICS and not column.endswith("_per90")]
+
+    # Sum the aggregated stats of the earlier matches and the match
+    df_totals = (
+        pd.concat([df_player_stats[["player_id", *MATCH_COLUMNS]], df_match_stats[["player_id", *MATCH_COLUMNS]]])
+        .astype({column: "float64" for column in MATCH_COLUMNS})
+        .groupby("player_id")
+        .sum()
+        .reset_index()
+    )
+
+    # Players of their first match get the name, team and position of the feed
+    base_ids = set(df_player_stats["player_id"])
+    new_ids = [player_id for player_id in live["players"] if player_id not in base_ids]
+    df_positions = pd.DataFrame([(player_id, position_id, count) for (player_id, position_id), count in live["positions"].items()], columns=["player_id", "position_id", "count"])
+    position_matrix = create_position_matrix(df_positions, new_ids)
+    df_new_players = pd.DataFrame({
+        "player_id": new_ids,
+        "player_name": [live["players"][player_id]["player_name"] for player_id in new_ids],
+        "player_short_name": [live["players"][player_id]["player_name"] for player_id in new_ids],
+        "team_name": [live["players"][player_id]["team_name"] for player_id in new_ids],
+        "position": get_position_labels(position_matrix),
+        "position_mask": get_position_masks(position_matrix),
+    })
+    df_info = pd.concat([df_player_stats[info_columns], df_new_players[info_columns]], ignore_index=True)
+    df = df_info.merge(df_totals, on="player_id").sort_values("player_id")
+
+    # Derived stats in registry order
+    for name, metric in METRICS.items():
+        if "formula" in metric:
+            df[name] = metric["formula"](df)
+    df = df.astype(get_metric_dtypes(list(METRICS)))
+
+    # Players without playing time are filtered out, like in create_data.py
+    df = calculate_per90_columns(df, get_per90_metrics())
+
+    return df[list(df_player_stats.columns)].reset_index(drop=True)
+
+
+def read_base_data(match_id, paths=DATA_PATHS):
+    """
+    Read the data files as they are before a live match.
+
+    Parameters
+    ----------
+    match_id: int
+        The match id of the live match.
+    paths: list
+        The data files (see DATA_PATHS): player stats, dribbles and the optional player match stats.
+
+    Returns
+    -------
+    base: dict
+        The player stats, dribbles and player match stats (None if the file doesn't exist).
+
+    Raises
+    ------
+    ValueError
+        If the match is already in the data.
+    """
+    base = {
+        "player_stats": read_data("player_stats", paths[0]),
+        "dribbles": read_data("dribbles", paths[1]),
+        "player_match_stats": read_data("player_match_stats", paths[2]) if os.path.exists(paths[2]) else None,
+    }
+    if (base["dribbles"]["match_id"] == match_id).any() or (base["player_match_stats"] is not None and (base["player_match_stats"]["match_id"] == match_id).any()):
+        raise ValueError(f"Match {match_id} is already in the data, create the data without it to follow it live.")
+
+    return base
+
+
+def publish_live_match(live, base, paths=DATA_PATHS):
+    """
+    Write the data files of the app with the stats of a live match so far.
+
+    Every file is replaced in one step (see write_data). The player stats are written last, so a rerun that sees
+    the new player stats also sees the new dribbles. The app and the render worker read the files again when a
+    publish replaced them while they were read (see read_app_snapshot).
+
+    Parameters
+    ----------
+    live: dict
+        The state of the match (see create_live_match).
+    base: dict
+        The data before the match (see read_base_data).
+    paths: list
+        The data files (see DATA_PATHS).
+    """
+    df_match_stats = get_live_match_stats(live)
+    df_dribbles = get_live_dribbles(live)
+
+    # Dribbles of data created before the shot gaps keep their columns, instead of getting NaN gaps for all base dribbles
+    df_dribbles = df_dribbles[list(base["dribbles"].columns)]
+
+    write_data(pd.concat([base["dribbles"], df_dribbles], ignore_index=True), "dribbles", paths[1])
+    if base["player_match_stats"] is not None:
+        write_data(pd.concat([base["player_match_stats"], df_match_stats], ignore_index=True), "player_match_stats", paths[2])
+    write_data(update_player_stats(base["player_stats"], df_match_stats, live), "player_stats", paths[0])
+
+
+def follow_feed(path, poll_interval=0.5, idle_timeout=None):
+    """
+    Read the events of a feed as they are appended, until the end of the match.
+
+    Parameters
+    ----------
+    path: str or Path
+        The JSON lines feed, one event per line.
+    poll_interval: float
+        The seconds to wait for new events at the end of the feed.
+    idle_timeout: float
+        Optional seconds without new events after which the feed is considered over.
+
+    Yields
+    ------
+    events: list
+        The events appended since the last batch, empty when the feed had no new events within the poll interval.
+        The last batch ends with the end event (see END_EVENT), unless the feed timed out.
+    """
+    with open(path, encoding="utf-8") as feed:
+        partial_line = ""
+        last_event_time = time.monotonic()
+        while True:
+            # Read all complete lines, a line without newline is still being written
+            events = []
+            for line in iter(feed.readline, ""):
+                partial_line += line
+                if partial_line.endswith("\n"):
+                    if partial_line.strip():
+                        events.append(json.loads(partial_line))
+                    partial_line = ""
+
+            if events:
+                last_event_time = time.monotonic()
+                end = [i for i, event in enumerate(events) if event.get("type_name") == END_EVENT]
+                if end:
+                    yield events[:end[0] + 1]
+                    return
+                yield events
+            elif idle_timeout is not None and time.monotonic() - last_event_time > idle_timeout:
+                return
+            else:
+                yield events
+                time.sleep(poll_interval)
+
+
+def write_feed(df_events, path, speed=None):
+    """
+    Write the events of a match to a feed, like a live provider would (e.g. to replay a match).
+
+    Parameters
+    ----------
+    df_events: pd.DataFrame
+        A dataframe with the Statsbomb event data of a single match, in event order.
+    path: str or Path
+        The JSON lines feed, appended to.
+    speed: float
+        Optional replay speed: 60 writes a minute of the match per second. All events are written at once by default.
+    """
+    df_events = df_events.copy()
+    df_events["timestamp"] = df_events["timestamp"].map(lambda timestamp: timestamp.isoformat())
+    lines = df_events.to_json(orient="records", lines=True).splitlines()
+
+    # Time of every event since the kick off, the periods are played one after the other
+    period_seconds = df_events["timestamp"].map(_period_seconds)
+    period_lengths = period_seconds.groupby(df_events["period"]).max()
+    match_seconds = (period_seconds + df_events["period"].map(period_lengths.cumsum() - period_lengths)).to_numpy()
+
+    start_time = time.monotonic()
+    with open(path, "a", encoding="utf-8") as feed:
+        for line, seconds in zip(lines, match_seconds):
+            if speed is not None:
+                time.sleep(max(0.0, start_time + seconds / speed - time.monotonic()))
+            feed.write(line + "\n")
+            feed.flush()
+        feed.write(json.dumps({"match_id": int(df_events["match_id"].iloc[0]), "type_name": END_EVENT}) + "\n")
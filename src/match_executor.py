@@ -0,0 +1,212 @@
+"""
+This module contains an executor that maps per match functions over the event data on all cores.
+
+The per match stages of the pipeline (dribbles, playing time and positions) are independent between matches.
+The executor puts the events in shared memory once, as an Arrow IPC stream with the matches in contiguous row
+ranges. Worker processes attach to it when they start and read their matches as zero-copy slices, so the event
+table is never pickled to the workers. Matches are mapped in chunks and the results are concatenated in match
+order, so the result doesn't depend on the number of workers, the chunk size or which worker finishes first.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from src.dribbles import get_dribbles_single_match
+from src.player_info import count_player_positions
+from src.playing_time import calculate_playing_time_single_match
+
+# Per match stages: the function of a match's events, its result has a row per player or event of the match
+MATCH_STAGES = {
+    "dribbles": get_dribbles_single_match,
+    "playing_time": calculate_playing_time_single_match,
+    "positions": count_player_positions,
+}
+
+# Columns of the events the per match stages read, the card columns are optional (see get_red_card_events)
+MATCH_STAGE_COLUMNS = [
+    "match_id", "period", "minute", "second", "timestamp", "type_name", "team_name", "player_id", "position_id",
+    "outcome_name", "x", "y", "shot_statsbomb_xg", "substitution_replacement_id",
+    "foul_committed_card_name", "bad_behaviour_card_name",
+]
+
+# Events and row ranges of the matches in a worker process, set when the worker starts
+_worker = {}
+
+
+def share_events(df_events, match_ids, columns=None):
+    """
+    Put the events of the matches in shared memory as an Arrow IPC stream, with every match in a contiguous row range.
+
+    Parameters
+    ----------
+    df_events: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    match_ids: list
+        The match ids to share, in the order of the results.
+    columns: list
+        Optional columns to share, all columns by default.
+
+    Returns
+    -------
+    memory: multiprocessing.shared_memory.SharedMemory
+        The shared memory block, unlink it when the workers are done.
+    handle: dict
+        The name and size of the block and the match ids and row offsets, passed to the workers.
+
+    Raises
+    ------
+    ValueError
+        If a column can't be converted to Arrow (e.g. an object column with mixed types).
+    """
+    import pyarrow as pa
+
+    # Sort the events by match, keeping the event order within every match
+    match_order = pd.Series(np.arange(len(match_ids)), index=match_ids)
+    df = df_events[df_events["match_id"].isin(match_ids)]
+    df = df.iloc[np.argsort(match_order[df["match_id"]].to_numpy(), kind="stable")]
+    if columns is not None:
+        df = df[columns]
+    counts = df["match_id"].value_counts().reindex(match_ids, fill_value=0).to_numpy()
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+        raise ValueError(f"The events can't be shared as Arrow, select the needed columns with columns: {error}") from error
+
+    # Measure the stream first, so it can be written straight into the shared block
+    sizer = pa.MockOutputStream()
+    with pa.ipc.new_stream(sizer, table.schema) as writer:
+        writer.write_table(table)
+    size = sizer.size()
+
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(memory.buf)), table.schema) as writer:
+        writer.write_table(table)
+
+    handle = {"name": memory.name, "size": size, "match_ids": list(match_ids), "offsets": offsets.tolist()}
+
+    return memory, handle
+
+
+def _attach_events(handle):
+    import pyarrow as pa
+
+    # Keep the shared memory open for the lifetime of the worker, the table's buffers point into it
+    memory = shared_memory.SharedMemory(name=handle["name"])
+    _worker["memory"] = memory
+    _worker["events"] = pa.ipc.open_stream(pa.py_buffer(memory.buf)[:handle["size"]]).read_all()
+    _worker["offsets"] = handle["offsets"]
+
+
+def _run_chunk(stage, match_indices, kwargs):
+    # Convert only the rows of the match to pandas and run the stage on them
+    results = []
+    for i in match_indices:
+        start, end = _worker["offsets"][i], _worker["offsets"][i + 1]
+        df_match = _worker["events"].slice(start, end - start).to_pandas()
+        results.append(MATCH_STAGES[stage](df_match, **kwargs))
+
+    return results
+
+
+def create_match_executor(df_events, match_ids, max_workers=None, chunk_size=None, columns=None, start_method="spawn"):
+    """
+    Share the events and start the worker processes.
+
+    Parameters
+    ----------
+    df_events: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    match_ids: list
+        The match ids to map over, in the order of the results.
+    max_workers: int
+        The number of worker processes, the number of cores by default.
+    chunk_size: int
+        The number of matches per task, by default about 4 tasks per worker.
+    columns: list
+        Optional columns of the events to share (see share_events).
+    start_method: str
+        The multiprocessing start method. Use "fork" when the caller is a script that can't be re-imported by spawned workers.
+
+    Returns
+    -------
+    executor: dict
+        The process pool, the shared memory and the chunks of match indices.
+
+    Raises
+    ------
+    ValueError
+        If max_workers or chunk_size is not positive.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers < 1:
+        raise ValueError(f"Invalid max_workers: {max_workers}. It must be at least 1.")
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(match_ids) // (max_workers * 4)))
+    if chunk_size < 1:
+        raise ValueError(f"Invalid chunk_size: {chunk_size}. It must be at least 1.")
+
+    memory, handle = share_events(df_events, match_ids, columns)
+    context = multiprocessing.get_context(start_method)
+
+    return {
+        "pool": ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_attach_events, initargs=(handle,)),
+        "memory": memory,
+        "match_ids": handle["match_ids"],
+        "chunks": [list(range(i, min(i + chunk_size, len(match_ids)))) for i in range(0, len(match_ids), chunk_size)],
+    }
+
+
+def map_matches(executor, stage, **kwargs):
+    """
+    Map a per match stage over all matches and concatenate the results in match order.
+
+    Parameters
+    ----------
+    executor: dict
+        The match executor (see create_match_executor).
+    stage: str
+        The per match stage: dribbles, playing_time or positions (see MATCH_STAGES).
+    **kwargs:
+        Extra arguments of the stage function (e.g. shot_window for dribbles).
+
+    Returns
+    -------
+    pd.DataFrame
+        The results of all matches.
+
+    Raises
+    ------
+    ValueError
+        If stage is not one of the per match stages.
+    """
+    if stage not in MATCH_STAGES:
+        raise ValueError(f"Invalid stage: {stage}. Valid stages are: {', '.join(MATCH_STAGES)}.")
+
+    # Results come back in the order of the chunks, whichever worker finishes first
+    results = []
+    for chunk_results in executor["pool"].map(_run_chunk, [stage] * len(executor["chunks"]), executor["chunks"], [kwargs] * len(executor["chunks"])):
+        results += chunk_results
+
+    return pd.concat(results, ignore_index=True)
+
+
+def close_match_executor(executor):
+    """
+    Stop the worker processes and free the shared memory.
+
+    Parameters
+    ----------
+    executor: dict
+        The match executor (see create_match_executor).
+    """
+    executor["pool"].shutdown()
+    executor["memory"].close()
+    executor["memory"].unlink()
@@ -1,11 +1,46 @@
 """
 Module to load data from StatsBomb.
 """
+from functools import lru_cache
+
 import pandas as pd
-from mplsoccer import Sbopen
 
-# Init StatsBomb parser
-parser = Sbopen()
+
+@lru_cache(maxsize=None)
+def get_parser():
+    """
+    Get the StatsBomb parser, created on first use so importing this module stays fast.
+
+    Returns
+    -------
+    parser: mplsoccer.Sbopen
+        The StatsBomb parser.
+    """
+    from mplsoccer import Sbopen
+
+    return Sbopen()
+
+
+def get_all_matches(competition_id, season_id):
+    """
+    Get all matches for a given competition and season.
+
+    Parameters
+    ----------
+    competition_id: int
+        The id of the competition
+    season_id: int
+        The id of the season
+
+    Returns
+    -------
+    df_all_matches: pd.DataFrame
+        A dataframe with the match id, date, kick off time and teams of all matches
+    """
+    df_all_matches = get_parser().match(competition_id=competition_id, season_id=season_id)
+
+    return df_all_matches[['match_id', 'match_date', 'kick_off', 'home_team_name', 'away_team_name']]
+
 
 def get_all_match_ids(competition_id, season_id):
     """
@@ -23,7 +58,7 @@ def get_all_match_ids(competition_id, season_id):
     match_ids: list
         A list of all match ids for a given competition and season
     """
-    df_all_matches = parser.match(competition_id=competition_id, season_id=season_id)
+    df_all_matches = get_all_matches(competition_id, season_id)
     match_ids = df_all_matches['match_id'].tolist()
     
     return match_ids
@@ -49,7 +84,7 @@ def load_all_events(match_ids):
 
     # Loop through all matches
     for match_id in match_ids:
-        df_match = parser.event(match_id)[0]
+        df_match = get_parser().event(match_id)[0]
         all_events.append(df_match)
 
     # Concatenate all events
@@ -0,0 +1,291 @@
+"""
+This module contains a declarative registry of player metrics and functions to compute any set of them.
+
+Every metric declares where it comes from (source and event filter), how it is aggregated per player and
+whether it has a per 90 version. Requesting a set of metrics only computes the sources, filters and
+aggregations those metrics need. Metrics that use the same source and filter share a single mask.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.dribbles import get_all_dribbles
+from src.playing_time import calculate_playing_time, calculate_playing_time_per_match
+
+
+# Event filters, referenced by name so metrics with the same filter share a scan
+FILTERS = {
+    "goals": lambda df: (df["outcome_id"] == 97) & (df["period"] != 5),    # goal id is 97, don't count penalties, own goals don't have a outcome_id
+    "assists": lambda df: df["pass_goal_assist"] == True,
+    "shots": lambda df: df["type_name"] == "Shot",
+    "completed_dribbles": lambda df: df["outcome_name"] == "Complete",
+    "failed_dribbles": lambda df: df["outcome_name"] == "Incomplete",
+    "danger_dribbles": lambda df: df["danger_dribble"] == True,
+}
+
+
+def _ratio(numerator, denominator):
+    # Divide two columns, 0 where the denominator is 0
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+# Metric registry
+# - source: the frame the metric is aggregated from ("events", "dribbles" or "playing_time")
+# - filter: name of the event filter in FILTERS (optional)
+# - agg: "count" (number of filtered rows) or "sum" (sum of column)
+# - depends/formula: derived metrics are calculated from other metrics instead of a source
+# - per90: whether the metric has a <metric>_per90 version
+# - dtype: the dtype of the metric in the player stats
+METRICS = {
+    "playing_time": {"source": "playing_time", "agg": "sum", "column": "playing_time", "per90": False, "dtype": "int64"},
+    "goals": {"source": "events", "filter": "goals", "agg": "count", "per90": True, "dtype": "int64"},
+    "assists": {"source": "events", "filter": "assists", "agg": "count", "per90": True, "dtype": "int64"},
+    "shots": {"source": "events", "filter": "shots", "agg": "count", "per90": True, "dtype": "int64"},
+    "shots_xg": {"source": "events", "filter": "shots", "agg": "sum", "column": "shot_statsbomb_xg", "per90": True, "dtype": "float64"},
+    "completed_dribbles": {"source": "dribbles", "filter": "completed_dribbles", "agg": "count", "per90": True, "dtype": "int64"},
+    "failed_dribbles": {"source": "dribbles", "filter": "failed_dribbles", "agg": "count", "per90": True, "dtype": "int64"},
+    "attempted_dribbles": {
+        "depends": ["completed_dribbles", "failed_dribbles"],
+        "formula": lambda df: df["completed_dribbles"] + df["failed_dribbles"],
+        "per90": True,
+        "dtype": "int64"
+    },
+    "dribble_success_rate": {
+        "depends": ["completed_dribbles", "attempted_dribbles"],
+        "formula": lambda df: _ratio(df["completed_dribbles"], df["attempted_dribbles"]),
+        "per90": False,
+        "dtype": "float64"
+    },
+    "danger_dribbles": {"source": "dribbles", "filter": "danger_dribbles", "agg": "count", "per90": True, "dtype": "int64"},
+    "danger_dribbles_xg": {"source": "dribbles", "filter": "danger_dribbles", "agg": "sum", "column": "xg_from_dribble", "per90": True, "dtype": "float64"},
+    "dribbles_to_goals": {"source": "dribbles", "filter": "danger_dribbles", "agg": "sum", "column": "dribble_to_goal", "per90": True, "dtype": "int64"},
+    "xg_per_danger_dribble": {
+        "depends": ["danger_dribbles_xg", "danger_dribbles"],
+        "formula": lambda df: _ratio(df["danger_dribbles_xg"], df["danger_dribbles"]),
+        "per90": False,
+        "dtype": "float64"
+    },
+}
+
+
+def get_per90_metrics():
+    """
+    Get the names of all metrics that have a per 90 version.
+
+    Returns
+    -------
+    list
+        The metric names, in registry order.
+    """
+    return [name for name, metric in METRICS.items() if metric["per90"]]
+
+
+def get_metric_dtypes(metrics):
+    """
+    Get the dtypes of a set of metrics.
+
+    Parameters
+    ----------
+    metrics: list
+        The metric names (per 90 names are allowed).
+
+    Returns
+    -------
+    dict
+        The dtype of each metric.
+    """
+    return {name: "float64" if name.endswith("_per90") else METRICS[name]["dtype"] for name in metrics}
+
+
+def resolve_metrics(metrics):
+    """
+    Resolve a set of requested metrics into all registry metrics that have to be computed.
+
+    Parameters
+    ----------
+    metrics: list
+        The requested metric names. Per 90 metrics are named <metric>_per90.
+
+    Returns
+    -------
+    required: list
+        All metrics that have to be computed (requested metrics and their dependencies), in registry order.
+
+    Raises
+    ------
+    ValueError
+        If a metric is not in the registry or has no per 90 version.
+    """
+    required = set()
+    stack = []
+
+    for name in metrics:
+        if name.endswith("_per90"):
+            base = name[:-len("_per90")]
+            if base not in METRICS or not METRICS[base]["per90"]:
+                raise ValueError(f"Invalid metric: {name}. {base} has no per 90 version.")
+            stack += [base, "playing_time"]
+        elif name in METRICS:
+            stack.append(name)
+        else:
+            raise ValueError(f"Invalid metric: {name}. Valid metrics are: {', '.join(METRICS)}.")
+
+    # Add all dependencies of derived metrics
+    while stack:
+        name = stack.pop()
+        if name not in required:
+            required.add(name)
+            stack += METRICS[name].get("depends", [])
+
+    # Registry order guarantees dependencies are computed before derived metrics
+    return [name for name in METRICS if name in required]
+
+
+def plan_metrics(metrics):
+    """
+    Compile a set of requested metrics into the minimal set of scans.
+
+    Parameters
+    ----------
+    metrics: list
+        The requested metric names.
+
+    Returns
+    -------
+    scans: dict
+        The aggregated metrics per (source, filter) pair. Each pair is evaluated as a single mask.
+    derived: list
+        The derived metrics, in the order they have to be calculated.
+    """
+    scans = {}
+    derived = []
+
+    for name in resolve_metrics(metrics):
+        metric = METRICS[name]
+        if "formula" in metric:
+            derived.append(name)
+        else:
+            scans.setdefault((metric["source"], metric.get("filter")), []).append(name)
+
+    return scans, derived
+
+
+def calculate_metrics(metrics, match_ids, df_all_events, df_dribbles=None, df_playing_time=None, player_ids=None, shot_window=15, by_match=False):
+    """
+    Calculate a set of metrics for all players (or for all players per match).
+
+    Only the sources and filters needed for the requested metrics are computed. Every relevant row is classified
+    once into its contributions to the aggregated metrics, and all per player totals are computed in a single
+    grouped reduction keyed by integer player codes.
+
+    Parameters
+    ----------
+    metrics: list
+        The requested metric names. Per 90 metrics are named <metric>_per90.
+    match_ids: list
+        A list of match ids to calculate the metrics for.
+    df_all_events: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    df_dribbles: pd.DataFrame
+        Optional dataframe with all dribbles (see get_all_dribbles), computed when needed and not given.
+    df_playing_time: pd.DataFrame
+        Optional dataframe with the playing time of players (see calculate_playing_time), computed when needed and not given.
+        Per match (see calculate_playing_time_per_match) when by_match is True.
+    player_ids: array-like
+        Optional player ids that define the rows of the result, in order. Players that are not in a source get 0
+        and rows of other players are ignored. By default every player that appears in a source gets a row.
+        When by_match is True, only rows of other players are ignored.
+    shot_window: int
+        The shot window in seconds for danger dribbles, used when the dribbles are computed.
+    by_match: bool
+        Whether to calculate the metrics per player and match instead of per player.
+
+    Returns
+    -------
+    df_metrics: pd.DataFrame
+        A dataframe with the player id (and match id when by_match is True) and the requested metrics.
+    """
+    scans, derived = plan_metrics(metrics)
+    aggregated = [name for names in scans.values() for name in names]
+
+    # Sources are only computed when a scan needs them
+    sources = {
+        "events": lambda: df_all_events,
+        "dribbles": lambda: df_dribbles if df_dribbles is not None else get_all_dribbles(match_ids, df_all_events, shot_window),
+        "playing_time": lambda: df_playing_time if df_playing_time is not None else (
+            calculate_playing_time_per_match(match_ids, df_all_events) if by_match else calculate_playing_time(match_ids, df_all_events)
+        ),
+    }
+
+    # Classify the relevant rows of every source into a (rows x aggregated metrics) contribution matrix
+    row_player_ids = []
+    row_match_ids = []
+    row_contributions = []
+    for source in dict.fromkeys(source for source, _ in scans):
+        df = sources[source]()
+        source_scans = {filter_name: names for (scan_source, filter_name), names in scans.items() if scan_source == source}
+
+        # Evaluate every filter once, rows that match no filter are dropped
+        masks = {
+            filter_name: np.ones(len(df), dtype=bool) if filter_name is None else FILTERS[filter_name](df).to_numpy(dtype=bool)
+            for filter_name in source_scans
+        }
+        relevant = np.logical_or.reduce(list(masks.values())) & df["player_id"].notna().to_numpy()
+
+        contributions = np.zeros((relevant.sum(), len(aggregated)))
+        for filter_name, names in source_scans.items():
+            mask = masks[filter_name][relevant]
+            for name in names:
+                metric = METRICS[name]
+                if metric["agg"] == "count":
+                    values = mask
+                else:
+                    values = np.nan_to_num(df[metric["column"]].to_numpy(dtype=float)[relevant]) * mask
+                contributions[:, aggregated.index(name)] = values
+
+        row_player_ids.append(df["player_id"].to_numpy()[relevant])
+        if by_match:
+            row_match_ids.append(df["match_id"].to_numpy()[relevant])
+        row_contributions.append(contributions)
+
+    # Encode players (or players and matches) as integer codes
+    all_player_ids = np.concatenate(row_player_ids)
+    if by_match:
+        all_keys = pd.MultiIndex.from_arrays([all_player_ids.astype(int), np.concatenate(row_match_ids)], names=["player_id", "match_id"])
+        player_index = all_keys.unique().sort_values()
+        if player_ids is not None:
+            player_index = player_index[player_index.get_level_values("player_id").isin(player_ids)]
+        codes = player_index.get_indexer(all_keys)
+    else:
+        player_index = pd.Index(np.unique(all_player_ids)) if player_ids is None else pd.Index(player_ids)
+        codes = player_index.get_indexer(all_player_ids)
+    known = codes >= 0
+
+    # Sum all contributions per player in a single reduction into a preallocated table
+    totals = np.zeros((len(player_index), len(aggregated)))
+    np.add.at(totals, codes[known], np.concatenate(row_contributions)[known])
+    table = {name: totals[:, i] for i, name in enumerate(aggregated)}
+
+    # Calculate derived metrics
+    for name in derived:
+        table[name] = np.asarray(METRICS[name]["formula"](table), dtype=float)
+
+    # Calculate per 90 metrics, players without playing time have no per 90 values
+    for name in metrics:
+        if name.endswith("_per90"):
+            base = name[:-len("_per90")]
+            playing_time = np.where(table["playing_time"] > 0, table["playing_time"], np.nan)
+            table[name] = table[base] / playing_time * 5400
+
+    # Keep requested metrics only
+    dtypes = get_metric_dtypes(metrics)
+    if by_match:
+        df_metrics = player_index.to_frame(index=False)
+    else:
+        df_metrics = pd.DataFrame({"player_id": player_index.to_numpy().astype(int)})
+    for name in metrics:
+        df_metrics[name] = table[name].astype(dtypes[name])
+
+    return df_metrics
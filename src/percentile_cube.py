@@ -0,0 +1,161 @@
+"""
+This module contains the percentile cube: the radar percentiles of every player in every cohort the app can select.
+
+A cohort is a position filter with a minimum of minutes and attempted dribbles. The thresholds only matter at the
+values players actually have, so the grid of 4 positions x 901 minutes x 101 dribbles has a few thousand distinct
+cohorts. For a position and dribbles threshold, the cohorts of all minutes thresholds are prefixes of one order of
+the players (most minutes first). The cube sweeps that order, adds one player at a time to the counts of every
+value and stores the percentiles of all members at every minutes threshold. A radar query is then a lookup.
+"""
+
+import time
+
+import numpy as np
+
+from src.data_plots import INVERTED_COLUMNS, RADAR_COLUMNS
+from src.positions import POSITION_FILTERS, get_position_filter_mask
+
+# Position filters of the app and the position of their players (None for all players)
+CUBE_POSITIONS = {"All": None, **POSITION_FILTERS}
+
+
+def _get_value_ranks(values):
+    # Dense rank of every value per stat, tied values share a rank
+    ranks = np.empty(values.shape, dtype=np.int64)
+    n_ranks = 0
+    for i, column in enumerate(values.T):
+        unique_values, ranks[:, i] = np.unique(column, return_inverse=True)
+        n_ranks = max(n_ranks, len(unique_values))
+
+    return ranks, n_ranks
+
+
+def _build_position(df, minutes, dribbles):
+    # Minutes and dribbles thresholds where the cohort changes, a filter selects the first threshold at or above it
+    minutes_thresholds = np.unique(minutes)
+    dribbles_thresholds = np.unique(dribbles)
+
+    # Percentiles are ranked on the values, with stats where lower is better inverted
+    values = df[RADAR_COLUMNS].to_numpy(dtype=float, copy=True)
+    values[:, [RADAR_COLUMNS.index(column) for column in INVERTED_COLUMNS]] *= -1
+    ranks, n_ranks = _get_value_ranks(values)
+    n_players, n_stats = values.shape
+    stat_offsets = np.arange(n_stats) * n_ranks
+
+    # Players with the most minutes first, so every cohort of a dribbles threshold is a prefix
+    order = np.argsort(-minutes, kind="stable")
+
+    blocks = []
+    offsets = np.zeros((len(dribbles_thresholds), len(minutes_thresholds)), dtype=np.int64)
+    sizes = np.zeros((len(dribbles_thresholds), len(minutes_thresholds)), dtype=np.int64)
+    positions = np.full((len(dribbles_thresholds), n_players), -1, dtype=np.int32)
+    n_rows = 0
+    for j, dribbles_threshold in enumerate(dribbles_thresholds):
+        members = order[dribbles[order] >= dribbles_threshold]
+        positions[j, members] = np.arange(len(members))
+        member_ranks = ranks[members] + stat_offsets
+
+        # Sweep from the highest minutes threshold down, adding the players that reach it to the value counts
+        counts = np.zeros(n_stats * n_ranks, dtype=np.int64)
+        size = 0
+        for i in range(len(minutes_thresholds) - 1, -1, -1):
+            added = size + np.count_nonzero(minutes[members[size:]] >= minutes_thresholds[i])
+            np.add.at(counts, member_ranks[size:added].ravel(), 1)
+            size = added
+            offsets[j, i], sizes[j, i] = n_rows, size
+            if size == 0:
+                continue
+
+            # Values below count fully, tied values (including the value itself) count half, like percentileofscore
+            cumulative = np.cumsum(counts.reshape(n_stats, n_ranks), axis=1).ravel()
+            right = cumulative[member_ranks[:size]]
+            left = right - counts[member_ranks[:size]]
+            blocks.append(np.floor((left + right + 1) * (50.0 / size)).astype(np.uint8))
+            n_rows += size
+
+    return {
+        "minutes_thresholds": minutes_thresholds,
+        "dribbles_thresholds": dribbles_thresholds,
+        "player_ids": df["player_id"].to_numpy(),
+        "positions": positions,
+        "offsets": offsets,
+        "sizes": sizes,
+        "percentiles": np.concatenate(blocks) if blocks else np.zeros((0, n_stats), dtype=np.uint8),
+    }
+
+
+def build_percentile_cube(df_player_stats, shot_window=15):
+    """
+    Build the percentile cube of the player stats.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        The player stats of all players (see calculate_player_stats).
+    shot_window: int
+        The shot window of the danger dribbles in the player stats.
+
+    Returns
+    -------
+    cube: dict
+        The cube per position filter, with the shot window, number of cohorts, size in bytes and build time in seconds.
+    """
+    start_time = time.perf_counter()
+
+    # Same thresholds as filter_player_stats: whole minutes played and attempted dribbles
+    cube = {"shot_window": shot_window, "positions": {}}
+    for position_filter in CUBE_POSITIONS:
+        df = df_player_stats[get_position_filter_mask(df_player_stats, position_filter)]
+        minutes = (df["playing_time"].to_numpy() // 60).astype(np.int64)
+        dribbles = df["attempted_dribbles"].to_numpy().astype(np.int64)
+        cube["positions"][position_filter] = _build_position(df, minutes, dribbles)
+
+    cube["cohorts"] = sum(int((position["sizes"] > 0).sum()) for position in cube["positions"].values())
+    cube["nbytes"] = sum(array.nbytes for position in cube["positions"].values() for array in position.values())
+    cube["build_seconds"] = time.perf_counter() - start_time
+
+    return cube
+
+
+def lookup_percentiles(cube, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15):
+    """
+    Look up the radar percentiles of a player in a cohort.
+
+    Parameters
+    ----------
+    cube: dict
+        The percentile cube (see build_percentile_cube).
+    player_id: int
+        The id of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort (see filter_player_stats).
+
+    Returns
+    -------
+    percentiles: list
+        The percentiles in the order of RADAR_COLUMNS, like calculate_radar_plot_data. None if the cube has another
+        shot window or the player is not in the cohort.
+
+    Raises
+    ------
+    ValueError
+        If position_filter is not one of the position filters of the app.
+    """
+    if position_filter not in CUBE_POSITIONS:
+        raise ValueError(f"Invalid position filter: {position_filter}. Valid position filters are: {', '.join(CUBE_POSITIONS)}.")
+    if shot_window != cube["shot_window"]:
+        return None
+
+    position = cube["positions"][position_filter]
+    player_index = np.flatnonzero(position["player_ids"] == player_id)
+    i = np.searchsorted(position["minutes_thresholds"], minutes_played_filter)
+    j = np.searchsorted(position["dribbles_thresholds"], dribbles_filter)
+    if len(player_index) == 0 or i == len(position["minutes_thresholds"]) or j == len(position["dribbles_thresholds"]):
+        return None
+
+    # Players are a prefix of the cohort's block in the order of the sweep
+    row = position["positions"][j, player_index[0]]
+    if row < 0 or row >= position["sizes"][j, i]:
+        return None
+
+    return position["percentiles"][position["offsets"][j, i] + row].tolist()
@@ -0,0 +1,416 @@
+"""
+This module contains mergeable quantile sketches of the radar stats, for percentiles against players of many competitions.
+
+The percentile cube (see src/percentile_cube.py) ranks a player exactly within a cohort of one competition. Comparing
+a player with every player of dozens of competitions and seasons would need all their player stats in memory.
+Instead every competition is summarized once per position filter, reference cohort and radar stat in a KLL sketch:
+a few hundred values that each stand for 2^level players. Sketches of different competitions are merged by stacking
+their levels and compacting again, so the worker only reads the sketches of all competitions and merges them.
+
+A reference cohort is a minimum of minutes and attempted dribbles on a small grid (SKETCH_MINUTES x SKETCH_DRIBBLES),
+a filter of the app is rounded down to the grid. Sketches are built for danger dribbles with a 15 second window.
+
+Error bound: a compaction sorts a level, keeps every other value (with a random offset) and doubles its weight, which
+changes the rank of any value by at most the weight of the level. A sketch keeps the sum of these weights of all its
+compactions (and those of the sketches it was merged from) as its rank error, so its percentiles are at most
+100 * rank_error / n percentile points from the exact percentiles (kind="rank" of scipy.stats.percentileofscore).
+The offsets are random, so the errors mostly cancel out and the measured error is far below the bound (see
+sketch_error.py). Sketches with fewer values than their capacity are never compacted and exact.
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data_plots import INVERTED_COLUMNS, RADAR_COLUMNS
+from src.percentile_cube import CUBE_POSITIONS
+from src.positions import get_position_filter_mask
+from src.schema import read_data, write_data
+
+# Size of the top level of a sketch, lower levels get 2/3 of the level above (at least 2 values)
+SKETCH_K = 200
+LEVEL_RATIO = 2 / 3
+MIN_CAPACITY = 2
+
+# Reference cohorts of the sketches: minimum minutes played and attempted dribbles
+SKETCH_MINUTES = [0, 90, 270, 450]
+SKETCH_DRIBBLES = [0, 5, 10, 20]
+
+# Shot window of the danger dribbles in the sketches
+SKETCH_SHOT_WINDOW = 15
+
+# Seed of the compactions when sketches are merged, so every worker merges to the same sketch
+MERGE_SEED = 0
+
+
+def create_sketch(k=SKETCH_K):
+    """
+    Create an empty quantile sketch.
+
+    Parameters
+    ----------
+    k: int
+        The capacity of the top level, a larger k is more accurate and stores more values.
+
+    Returns
+    -------
+    sketch: dict
+        The sketch, with the values of every level, the number of values n and the rank error.
+
+    Raises
+    ------
+    ValueError
+        If k is smaller than the minimum capacity of a level.
+    """
+    if k < MIN_CAPACITY:
+        raise ValueError(f"Invalid sketch size: {k}. The size has to be at least {MIN_CAPACITY}.")
+
+    return {"k": k, "levels": [np.zeros(0)], "n": 0, "rank_error": 0}
+
+
+def _get_capacity(k, n_levels, level):
+    # The top level holds k values, every level below 2/3 of the level above
+    return max(MIN_CAPACITY, int(np.ceil(k * LEVEL_RATIO ** (n_levels - 1 - level))))
+
+
+def _compress(sketch, rng):
+    levels = sketch["levels"]
+    while sum(len(values) for values in levels) > sum(_get_capacity(sketch["k"], len(levels), level) for level in range(len(levels))):
+        # Compact the lowest level that is over its capacity
+        level = next(level for level, values in enumerate(levels) if len(values) > _get_capacity(sketch["k"], len(levels), level))
+        if level == len(levels) - 1:
+            levels.append(np.zeros(0))
+
+        # Keep the largest value of an odd level, every other value of the rest moves up with double the weight
+        values = np.sort(levels[level])
+        n_pairs = len(values) // 2 * 2
+        levels[level + 1] = np.concatenate([levels[level + 1], values[rng.integers(2):n_pairs:2]])
+        levels[level] = values[n_pairs:]
+        sketch["rank_error"] += 2 ** level
+
+    # Sorted values and cumulative weights are recalculated on the next query
+    sketch.pop("sorted", None)
+
+
+def update_sketch(sketch, values, seed=0):
+    """
+    Add values to a sketch.
+
+    Parameters
+    ----------
+    sketch: dict
+        The sketch (see create_sketch), updated in place.
+    values: np.ndarray
+        The values to add.
+    seed: int
+        The seed of the random offsets of the compactions.
+    """
+    values = np.asarray(values, dtype=float)
+    sketch["levels"][0] = np.concatenate([sketch["levels"][0], values])
+    sketch["n"] += len(values)
+    _compress(sketch, np.random.default_rng(seed))
+
+
+def merge_sketches(sketches, seed=MERGE_SEED):
+    """
+    Merge sketches into one sketch of all their values.
+
+    Parameters
+    ----------
+    sketches: list
+        The sketches (see create_sketch), all with the same k.
+    seed: int
+        The seed of the random offsets of the compactions.
+
+    Returns
+    -------
+    sketch: dict
+        The merged sketch, its rank error is the sum of the rank errors and the compactions of the merge.
+
+    Raises
+    ------
+    ValueError
+        If there are no sketches or they have different sizes.
+    """
+    if not sketches:
+        raise ValueError("Can't merge an empty list of sketches.")
+    sizes = {sketch["k"] for sketch in sketches}
+    if len(sizes) > 1:
+        raise ValueError(f"Can't merge sketches of different sizes: {sorted(sizes)}.")
+
+    # Stack the values of every level, the weights of a level are the same in all sketches
+    n_levels = max(len(sketch["levels"]) for sketch in sketches)
+    merged = create_sketch(sketches[0]["k"])
+    merged["levels"] = [
+        np.concatenate([sketch["levels"][level] for sketch in sketches if level < len(sketch["levels"])])
+        for level in range(n_levels)
+    ]
+    merged["n"] = sum(sketch["n"] for sketch in sketches)
+    merged["rank_error"] = sum(sketch["rank_error"] for sketch in sketches)
+    _compress(merged, np.random.default_rng(seed))
+
+    return merged
+
+
+def _get_sorted(sketch):
+    # All values with the cumulative weight of the values before them, cached until the sketch changes
+    if "sorted" not in sketch:
+        values = np.concatenate(sketch["levels"])
+        weights = np.concatenate([np.full(len(level_values), 2 ** level) for level, level_values in enumerate(sketch["levels"])])
+        order = np.argsort(values, kind="stable")
+        sketch["sorted"] = (values[order], np.concatenate([[0], np.cumsum(weights[order])]))
+
+    return sketch["sorted"]
+
+
+def get_sketch_percentiles(sketch, values):
+    """
+    Estimate the percentile ranks of values in a sketch, like scipy.stats.percentileofscore (kind="rank").
+
+    Parameters
+    ----------
+    sketch: dict
+        The sketch (see create_sketch).
+    values: np.ndarray
+        The values to rank.
+
+    Returns
+    -------
+    np.ndarray
+        The percentile ranks (0-100), at most get_rank_error_bound(sketch) from the exact ranks.
+
+    Raises
+    ------
+    ValueError
+        If the sketch is empty.
+    """
+    if sketch["n"] == 0:
+        raise ValueError("Can't rank values in an empty sketch.")
+
+    # Values below count fully, tied values count half and the value itself counts once
+    sorted_values, cumulative_weights = _get_sorted(sketch)
+    values = np.asarray(values, dtype=float)
+    left = cumulative_weights[np.searchsorted(sorted_values, values, side="left")]
+    right = cumulative_weights[np.searchsorted(sorted_values, values, side="right")]
+
+    return (left + right + (right > left)) * 50.0 / sketch["n"]
+
+
+def get_rank_error_bound(sketch):
+    """
+    Get the maximum error of the percentiles of a sketch.
+
+    Parameters
+    ----------
+    sketch: dict
+        The sketch (see create_sketch).
+
+    Returns
+    -------
+    float
+        The maximum difference with the exact percentile ranks, in percentile points.
+    """
+    return 100.0 * sketch["rank_error"] / sketch["n"] if sketch["n"] else 0.0
+
+
+def get_reference_cohort(minutes_played_filter, dribbles_filter):
+    """
+    Get the reference cohort of the sketches for the filters of the app.
+
+    Parameters
+    ----------
+    minutes_played_filter: int
+        The minimum minutes played.
+    dribbles_filter: int
+        The minimum number of attempted dribbles.
+
+    Returns
+    -------
+    minutes, dribbles: int
+        The highest minimum minutes and dribbles of the sketch grid that are at most the filters.
+    """
+    minutes = max(minutes for minutes in SKETCH_MINUTES if minutes <= minutes_played_filter)
+    dribbles = max(dribbles for dribbles in SKETCH_DRIBBLES if dribbles <= dribbles_filter)
+
+    return minutes, dribbles
+
+
+def build_partition_sketches(df_player_stats, k=SKETCH_K, seed=0):
+    """
+    Build the sketches of one competition partition.
+
+    Parameters
+    ----------
+    df_player_stats: pd.DataFrame
+        The player stats of all players of the competition (see calculate_player_stats), with a 15 second window.
+    k: int
+        The size of the sketches (see create_sketch).
+    seed: int
+        The seed of the random offsets of the compactions.
+
+    Returns
+    -------
+    sketches: dict
+        The sketch of every (position filter, minimum minutes, minimum dribbles, stat), stats where lower is better
+        are inverted like in the percentile cube.
+    """
+    sketches = {}
+    for position_filter in CUBE_POSITIONS:
+        df = df_player_stats[get_position_filter_mask(df_player_stats, position_filter)]
+        for minutes in SKETCH_MINUTES:
+            for dribbles in SKETCH_DRIBBLES:
+                df_cohort = df[(df["playing_time"] >= minutes * 60) & (df["attempted_dribbles"] >= dribbles)]
+                for column in RADAR_COLUMNS:
+                    values = df_cohort[column].to_numpy(dtype=float)
+                    sketch = create_sketch(k)
+                    update_sketch(sketch, -values if column in INVERTED_COLUMNS else values, seed)
+                    sketches[(position_filter, minutes, dribbles, column)] = sketch
+
+    return sketches
+
+
+def write_partition_sketches(sketches, path):
+    """
+    Write the sketches of a competition partition to a data file.
+
+    Parameters
+    ----------
+    sketches: dict
+        The sketches of the partition (see build_partition_sketches).
+    path: str or Path
+        The path of the parquet file, named after the partition (e.g. data/percentile_sketches/55_282.parquet).
+    """
+    # One row per value, with the key, level and rank error of its sketch
+    frames = []
+    for (position_filter, minutes, dribbles, column), sketch in sketches.items():
+        for level, values in enumerate(sketch["levels"]):
+            frames.append(pd.DataFrame({
+                "position": position_filter,
+                "metric": column,
+                "min_minutes": minutes,
+                "min_dribbles": dribbles,
+                "level": level,
+                "value": values,
+                "k": sketch["k"],
+                "rank_error": sketch["rank_error"],
+            }))
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    write_data(pd.concat(frames, ignore_index=True), "percentile_sketches", path)
+
+
+def read_partition_sketches(path):
+    """
+    Read the sketches of a competition partition.
+
+    Parameters
+    ----------
+    path: str or Path
+        The path of the parquet file (see write_partition_sketches).
+
+    Returns
+    -------
+    sketches: dict
+        The sketches of the partition (see build_partition_sketches), cohorts without players have no sketch.
+    """
+    df = read_data("percentile_sketches", path)
+    level_array = df["level"].to_numpy()
+    value_array = df["value"].to_numpy(dtype=float)
+    k_array = df["k"].to_numpy()
+    rank_error_array = df["rank_error"].to_numpy()
+
+    # Split the rows of every sketch by level
+    sketches = {}
+    for (position_filter, minutes, dribbles, column), rows in df.groupby(["position", "min_minutes", "min_dribbles", "metric"], observed=True, sort=False).indices.items():
+        sketch_levels = level_array[rows]
+        levels = [value_array[rows[sketch_levels == level]] for level in range(int(sketch_levels.max()) + 1)]
+        sketches[(position_filter, int(minutes), int(dribbles), column)] = {
+            "k": int(k_array[rows[0]]),
+            "levels": levels,
+            "n": sum(len(values) * 2 ** level for level, values in enumerate(levels)),
+            "rank_error": int(rank_error_array[rows[0]]),
+        }
+
+    return sketches
+
+
+def read_percentile_sketches(directory):
+    """
+    Read the sketches of every competition partition in a directory and merge them.
+
+    Parameters
+    ----------
+    directory: str or Path
+        The directory with a parquet file per partition.
+
+    Returns
+    -------
+    percentile_sketches: dict
+        The merged sketch of every (position filter, minimum minutes, minimum dribbles, stat), the partitions, the
+        maximum error bound in percentile points and the read time in seconds. None if there are no partitions.
+    """
+    start_time = time.perf_counter()
+    paths = sorted(Path(directory).glob("*.parquet"))
+    if not paths:
+        return None
+
+    # Merge the sketches of every key in partition order, so the merge is the same in every process
+    partitions = [read_partition_sketches(path) for path in paths]
+    keys = list(dict.fromkeys(key for sketches in partitions for key in sketches))
+    sketches = {key: merge_sketches([sketches[key] for sketches in partitions if key in sketches]) for key in keys}
+
+    return {
+        "shot_window": SKETCH_SHOT_WINDOW,
+        "partitions": [path.stem for path in paths],
+        "sketches": sketches,
+        "error_bound": max((get_rank_error_bound(sketch) for sketch in sketches.values()), default=0.0),
+        "read_seconds": time.perf_counter() - start_time,
+    }
+
+
+def lookup_sketch_percentiles(percentile_sketches, player, position_filter, minutes_played_filter, dribbles_filter, shot_window=15):
+    """
+    Estimate the radar percentiles of a player against the players of all partitions.
+
+    Parameters
+    ----------
+    percentile_sketches: dict
+        The merged sketches (see read_percentile_sketches).
+    player: pd.Series
+        The player stats of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the app (see filter_player_stats).
+
+    Returns
+    -------
+    percentiles: list
+        The percentiles in the order of RADAR_COLUMNS, like lookup_percentiles.
+    reference: dict
+        The reference cohort: minimum minutes, minimum dribbles and number of competitions.
+    None if the sketches have another shot window or no players in the reference cohort.
+
+    Raises
+    ------
+    ValueError
+        If position_filter is not one of the position filters of the app.
+    """
+    if position_filter not in CUBE_POSITIONS:
+        raise ValueError(f"Invalid position filter: {position_filter}. Valid position filters are: {', '.join(CUBE_POSITIONS)}.")
+    if shot_window != percentile_sketches["shot_window"]:
+        return None
+
+    minutes, dribbles = get_reference_cohort(minutes_played_filter, dribbles_filter)
+    sketches = [percentile_sketches["sketches"].get((position_filter, minutes, dribbles, column)) for column in RADAR_COLUMNS]
+    if any(sketch is None for sketch in sketches):
+        return None
+
+    # Same truncation as calculate_radar_plot_data
+    percentiles = [
+        int(get_sketch_percentiles(sketch, -player[column] if column in INVERTED_COLUMNS else player[column]))
+        for sketch, column in zip(sketches, RADAR_COLUMNS)
+    ]
+    reference = {"minutes_played_filter": minutes, "dribbles_filter": dribbles, "competitions": len(percentile_sketches["partitions"])}
+
+    return percentiles, reference
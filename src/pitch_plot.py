@@ -2,25 +2,45 @@
 This module contains functions to create pitch plots.
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-import matplotlib.image as mpimg
-from matplotlib import font_manager
-from mplsoccer import Pitch
+import hashlib
+import json
+import os
+import time
 import numpy as np
 from pathlib import Path
 
+from src.plot_style import BACKGROUND_COLOR, DARK_COLOR, create_figure, plot_style, save_figure
+from src.telemetry import observe, timer
+
 # Get project root directory
 project_root = Path(__file__).parent.parent
 
-def create_pitch_path(player_id):
-    output_path = project_root / 'generated_images' / 'pitch_plots' / f'{player_id}.png'
+# Directory of the rendered plots, set APP_IMAGES_DIR to render somewhere else (e.g. a cold cache for a load test)
+IMAGES_DIR = Path(os.environ.get("APP_IMAGES_DIR", project_root / "generated_images"))
+
+# Plot colors, the background and dark color are shared by all plots (see src/plot_style.py)
+DANGER_DRIBBLE_COLOR = "#CA2E55"
+
+# Bump when the drawing of the pitch plot changes, so images of the old drawing aren't reused
+PITCH_VERSION = 1
+
+
+def create_pitch_path(df_dribbles, player_id, player_name, team_name, shot_window=15):
+    # The image is saved under a hash of the dribbles of the player, so a render of old data never replaces a newer plot
+    import pandas as pd
+    df_player_dribbles = df_dribbles[df_dribbles['player_id'] == player_id]
+    content_hash = hashlib.sha1(json.dumps([PITCH_VERSION, int(player_id), str(player_name), str(team_name), int(shot_window)]).encode())
+    content_hash.update(pd.util.hash_pandas_object(df_player_dribbles, index=False).to_numpy().tobytes())
+    output_path = IMAGES_DIR / 'pitch_plots' / f'{content_hash.hexdigest()[:20]}.png'
     return str(output_path)
 
-def create_pitch_plot(df_dribbles, player_id, player_name, team_name):
+
+def create_pitch_plot(df_dribbles, player_id, player_name, team_name, shot_window=15):
     """
     Create a pitch plot for a player.
 
+    The plot is drawn without pyplot (see src/plot_style.py), so it can be drawn from a thread pool.
+
     Parameters
     ----------
     df_dribbles: pd.DataFrame
@@ -31,7 +51,22 @@ def create_pitch_plot(df_dribbles, player_id, player_name, team_name):
         The name of the player to create the pitch plot for.
     team_name: str
         The name of the team of the player to create the pitch plot for.
+    shot_window: int
+        The shot window in seconds used for the danger dribbles.
+
+    Returns
+    -------
+    fig: matplotlib.figure.Figure
+        The pitch plot, not registered with pyplot.
+    output_path: str
+        The path of the saved image (see create_pitch_path).
     """
+    start_time = time.perf_counter()
+
+    # Import plotting libraries on first use, so the paths can be created without loading matplotlib
+    from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+    import matplotlib.image as mpimg
+    from mplsoccer import Pitch
 
     # Filter dribbles for player
     df_player_dribbles = df_dribbles[df_dribbles['player_id'] == player_id]
@@ -43,9 +78,9 @@ def create_pitch_plot(df_dribbles, player_id, player_name, team_name):
     #figsize = (10, 8)
     
     # Plot colors
-    background_color = "#f2f4ee"
-    dark_color = "#053225"
-    danger_dribble_color = "#CA2E55"
+    background_color = BACKGROUND_COLOR
+    dark_color = DARK_COLOR
+    danger_dribble_color = DANGER_DRIBBLE_COLOR
 
     # Text styles
     h1_size = 18
@@ -55,132 +90,118 @@ def create_pitch_plot(df_dribbles, player_id, player_name, team_name):
     label_size = 10
     alpha = 0.4
 
-    # Load font
-    font_manager.fontManager.addfont('assets/Futura.ttc')
-    prop = font_manager.FontProperties(fname='assets/Futura.ttc')
-
-    # Apply styling
-    plt.rcParams['font.family'] = prop.get_name()
-    plt.rcParams.update({
-        'text.color': dark_color,
-        'axes.labelcolor': dark_color,
-        'axes.edgecolor': dark_color,
-        'xtick.color': dark_color,
-        'ytick.color': dark_color,
-        'grid.color': dark_color,
-    })
-
-    # Create figure
-    fig = plt.figure(figsize=figsize)
-    gs = fig.add_gridspec(3, 1, height_ratios=[title_height_ratio, 1-title_height_ratio-legend_height_ratio, legend_height_ratio])
-    
-    # Set background
-    fig.set_facecolor(background_color)
-    
-    # Title axis
-    heading_ax = fig.add_subplot(gs[0])
-    heading_ax.axis('off')
-    
-    # Main plot axis
-    main_ax = fig.add_subplot(gs[1])
-
-    # Legend axis
-    legend_ax = fig.add_subplot(gs[2])
-    legend_ax.axis('off')
-
-
-
-    # HEADING AXIS
-    heading_ax.text(0.055, 0.8, f"{player_name} - {team_name}", fontsize=h1_size, ha='left', va='center')
-    heading_ax.text(0.055, -0.1, f'All dribbles at Euro 2024', fontsize=p_size, ha='left', va='center', alpha=alpha)
-
-    # Add Euros 2024 logo
-    logo = mpimg.imread(project_root / 'assets' / 'euro_2024_logo.png')
-    imagebox = OffsetImage(logo, zoom=0.2)
-    ab = AnnotationBbox(
-        imagebox, 
-        (0.95, 0.5),                # Position of the logo (x, y)
-        xycoords='axes fraction',   # Coordinate system for the position (fraction of the axes)
-        box_alignment=(1, 0.5),     # Alignment of the logo relative to the position (x, y) (0, 0) is top left, (1, 1) is bottom right
-        frameon=False,              # Remove frame
-        zorder=100                  # Ensure the logo is on top of other elements
-    )
-    heading_ax.add_artist(ab)
-
-
-
-    # MAIN AXIS
-    pitch = Pitch(
-        line_color=dark_color, 
-        linewidth=0.5, 
-        half=False, 
-        goal_type='box', 
-        corner_arcs=True,
-        pad_bottom=0.1
-    )
-    pitch.draw(ax=main_ax)
-    main_ax.set_facecolor(background_color)
-
-    # Create style arrays based on conditions
-    colors = np.where(
-        (df_player_dribbles['outcome_name'] == "Complete") & 
-        (df_player_dribbles['danger_dribble'] == True),
-        danger_dribble_color,
-        dark_color
-    )
-
-    alphas = np.where(
-        df_player_dribbles['outcome_name'] == "Complete",
-        1.0,
-        0.4
-    )
-
-    # Size points based on xG
-    sizes = 100 + (df_player_dribbles['xg_from_dribble'] * 1500)
-
-    # Plot all points at once
-    pitch.scatter(
-        df_player_dribbles['x'], 
-        df_player_dribbles['y'], 
-        c=colors, 
-        s=sizes, 
-        alpha=alphas, 
-        edgecolors="none", 
-        ax=main_ax
-    )
-
-
-
-    # LEGEND AXIS
-    legend_ax.scatter(0, 0, c=dark_color, s=300, alpha=0)
-    legend_ax.scatter(1, 1, c=dark_color, s=300, alpha=0)
-
-    legend_ax.text(0.0, 1.4, f'Danger dribbles: dribbles that end in a shot within 15 seconds', fontsize=label_size-2, ha='left', va='center', alpha=alpha)
-    legend_ax.text(1, 1.4, f'Data provided by StatsBomb', fontsize=label_size-2, ha='right', va='center', alpha=alpha)
-
-    # Completed dribbles
-    total_completed_dribbles = len(df_player_dribbles[df_player_dribbles['outcome_name'] == "Complete"])
-    legend_ax.scatter(0.05, 0.84, c=dark_color, s=400)
-    legend_ax.text(0.05, 0.8275, total_completed_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
-    legend_ax.text(0.08, 0.8275, 'Completed dribbles', fontsize=p_size, ha='left', va='center', color=dark_color)
-    
-    # Danger dribbles
-    total_danger_dribbles = len(df_player_dribbles[df_player_dribbles['danger_dribble'] == True])
-    legend_ax.scatter(0.43, 0.84, c=danger_dribble_color, s=400)
-    legend_ax.text(0.43, 0.8275, total_danger_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
-    legend_ax.text(0.46, 0.8275, 'Danger dribbles', fontsize=p_size, ha='left', va='center', color=danger_dribble_color)
-    
-    # Failed dribbles
-    total_failed_dribbles = len(df_player_dribbles[df_player_dribbles['outcome_name'] == "Incomplete"])
-    legend_ax.scatter(0.795, 0.84, c=dark_color, s=400, alpha=alpha, edgecolors='none')
-    legend_ax.text(0.7945, 0.8275, total_failed_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
-    legend_ax.text(0.825, 0.8275, 'Failed dribbles', fontsize=p_size, ha='left', va='center', color=dark_color, alpha=alpha)
-
-    # xG
-    legend_ax.scatter(0.385, 0.2, c=danger_dribble_color, s=100)
-    legend_ax.scatter(0.415, 0.2, c=danger_dribble_color, s=200)
-    legend_ax.scatter(0.4525, 0.2, c=danger_dribble_color, s=400)
-    legend_ax.text(0.56, 0.2, 'xG from dribble', fontsize=p_size, ha='center', va='center', color=danger_dribble_color)
+    # Create the figure and its artists in the style of the plots, the figure isn't registered with pyplot
+    with plot_style():
+        fig = create_figure(figsize)
+        gs = fig.add_gridspec(3, 1, height_ratios=[title_height_ratio, 1-title_height_ratio-legend_height_ratio, legend_height_ratio])
+
+        # Set background
+        fig.set_facecolor(background_color)
+
+        # Title axis
+        heading_ax = fig.add_subplot(gs[0])
+        heading_ax.axis('off')
+
+        # Main plot axis
+        main_ax = fig.add_subplot(gs[1])
+
+        # Legend axis
+        legend_ax = fig.add_subplot(gs[2])
+        legend_ax.axis('off')
+
+
+
+        # HEADING AXIS
+        heading_ax.text(0.055, 0.8, f"{player_name} - {team_name}", fontsize=h1_size, ha='left', va='center')
+        heading_ax.text(0.055, -0.1, f'All dribbles at Euro 2024', fontsize=p_size, ha='left', va='center', alpha=alpha)
+
+        # Add Euros 2024 logo
+        logo = mpimg.imread(project_root / 'assets' / 'euro_2024_logo.png')
+        imagebox = OffsetImage(logo, zoom=0.2)
+        ab = AnnotationBbox(
+            imagebox, 
+            (0.95, 0.5),                # Position of the logo (x, y)
+            xycoords='axes fraction',   # Coordinate system for the position (fraction of the axes)
+            box_alignment=(1, 0.5),     # Alignment of the logo relative to the position (x, y) (0, 0) is top left, (1, 1) is bottom right
+            frameon=False,              # Remove frame
+            zorder=100                  # Ensure the logo is on top of other elements
+        )
+        heading_ax.add_artist(ab)
+
+
+
+        # MAIN AXIS
+        pitch = Pitch(
+            line_color=dark_color, 
+            linewidth=0.5, 
+            half=False, 
+            goal_type='box', 
+            corner_arcs=True,
+            pad_bottom=0.1
+        )
+        pitch.draw(ax=main_ax)
+        main_ax.set_facecolor(background_color)
+
+        # Create style arrays based on conditions
+        colors = np.where(
+            (df_player_dribbles['outcome_name'] == "Complete") & 
+            (df_player_dribbles['danger_dribble'] == True),
+            danger_dribble_color,
+            dark_color
+        )
+
+        alphas = np.where(
+            df_player_dribbles['outcome_name'] == "Complete",
+            1.0,
+            0.4
+        )
+
+        # Size points based on xG
+        sizes = 100 + (df_player_dribbles['xg_from_dribble'] * 1500)
+
+        # Plot all points at once
+        pitch.scatter(
+            df_player_dribbles['x'], 
+            df_player_dribbles['y'], 
+            c=colors, 
+            s=sizes, 
+            alpha=alphas, 
+            edgecolors="none", 
+            ax=main_ax
+        )
+
+
+
+        # LEGEND AXIS
+        legend_ax.scatter(0, 0, c=dark_color, s=300, alpha=0)
+        legend_ax.scatter(1, 1, c=dark_color, s=300, alpha=0)
+
+        legend_ax.text(0.0, 1.4, f'Danger dribbles: dribbles that end in a shot within {shot_window} seconds', fontsize=label_size-2, ha='left', va='center', alpha=alpha)
+        legend_ax.text(1, 1.4, f'Data provided by StatsBomb', fontsize=label_size-2, ha='right', va='center', alpha=alpha)
+
+        # Completed dribbles
+        total_completed_dribbles = len(df_player_dribbles[df_player_dribbles['outcome_name'] == "Complete"])
+        legend_ax.scatter(0.05, 0.84, c=dark_color, s=400)
+        legend_ax.text(0.05, 0.8275, total_completed_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
+        legend_ax.text(0.08, 0.8275, 'Completed dribbles', fontsize=p_size, ha='left', va='center', color=dark_color)
+
+        # Danger dribbles
+        total_danger_dribbles = len(df_player_dribbles[df_player_dribbles['danger_dribble'] == True])
+        legend_ax.scatter(0.43, 0.84, c=danger_dribble_color, s=400)
+        legend_ax.text(0.43, 0.8275, total_danger_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
+        legend_ax.text(0.46, 0.8275, 'Danger dribbles', fontsize=p_size, ha='left', va='center', color=danger_dribble_color)
+
+        # Failed dribbles
+        total_failed_dribbles = len(df_player_dribbles[df_player_dribbles['outcome_name'] == "Incomplete"])
+        legend_ax.scatter(0.795, 0.84, c=dark_color, s=400, alpha=alpha, edgecolors='none')
+        legend_ax.text(0.7945, 0.8275, total_failed_dribbles, fontsize=label_size, ha='center', va='center', color=background_color)
+        legend_ax.text(0.825, 0.8275, 'Failed dribbles', fontsize=p_size, ha='left', va='center', color=dark_color, alpha=alpha)
+
+        # xG
+        legend_ax.scatter(0.385, 0.2, c=danger_dribble_color, s=100)
+        legend_ax.scatter(0.415, 0.2, c=danger_dribble_color, s=200)
+        legend_ax.scatter(0.4525, 0.2, c=danger_dribble_color, s=400)
+        legend_ax.text(0.56, 0.2, 'xG from dribble', fontsize=p_size, ha='center', va='center', color=danger_dribble_color)
 
     # Save plot
     default_kwargs = {
@@ -191,7 +212,9 @@ def create_pitch_plot(df_dribbles, player_id, player_name, team_name):
     }
 
     # Generate output path, save figure and return figure and path
-    output_path = create_pitch_path(player_id)
-    fig.savefig(output_path, **default_kwargs)
+    output_path = create_pitch_path(df_dribbles, player_id, player_name, team_name, shot_window)
+    with timer("plot_save_seconds", {"plot": "pitch"}):
+        save_figure(fig, output_path, **default_kwargs)
+    observe("plot_render_seconds", time.perf_counter() - start_time, {"plot": "pitch"})
     
     return fig, output_path
\ No newline at end of file
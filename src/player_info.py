@@ -3,84 +3,70 @@ This module contains functions to get the player info from the StatsBomb API.
 """
 
 import pandas as pd
-from collections import Counter
-from mplsoccer import Sbopen
 
-# Init StatsBomb parser
-parser = Sbopen()
+from src.matches import get_parser
+from src.positions import create_position_matrix, get_position_labels, get_position_masks
 
 
-def get_player_positions(match_id):
+def count_player_positions(df):
     """
-    Get the positions of players in a game.
+    Count the events of every player in every position in a game.
 
     Parameters
     ----------
-    match_id: int
-        The match id of the game to get the player positions for.
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for a single match.
 
     Returns
     -------
     df_player_positions: pd.DataFrame
-        A dataframe with the player id and all the positions they played in a game.
+        A dataframe with the player id, position id and the number of events of the player in that position.
     """
-    # Get match event data and filter for player events
-    df = parser.event(match_id)[0]
+    # Filter for player events
     df = df[df['player_id'].notna() & df['position_id'].notna()]
 
-    # Group by player and collect unique positions
+    # Count events per player and position
     df_player_positions = (
-        df.groupby('player_id')['position_id']
-        .agg(lambda x: x.astype(int).value_counts().to_dict())
-        .reset_index()
-        .rename(columns={'position_id': 'positions'})
+        df.groupby(['player_id', 'position_id'])
+        .size()
+        .reset_index(name='count')
     )
+    df_player_positions['position_id'] = df_player_positions['position_id'].astype(int)
     
     return df_player_positions
 
 
-def get_position_label(positions):
+def get_player_positions(match_id):
     """
-    Get the position label for a player based on the positions they played in a game.
+    Get the positions of players in a game.
 
     Parameters
     ----------
-    positions: dict
-        A dictionary with the positions and the count of how many events the player has in certain positions.
+    match_id: int
+        The match id of the game to get the player positions for.
 
     Returns
     -------
-    str
-        The position label for the player.
+    df_player_positions: pd.DataFrame
+        A dataframe with the player id, position id and the number of events of the player in that position.
     """
-    keeper_ids = {1}
-    defender_ids = {2, 3, 4, 5, 6, 7, 8}
-    midfielder_ids = {9, 10, 11, 12, 13, 14, 15, 16}
-    forward_ids = {17, 18, 19, 20, 21, 22, 23, 24, 25}
-
-    scores = {
-        "keeper": sum(count for pos, count in positions.items() if pos in keeper_ids),
-        "defender": sum(count for pos, count in positions.items() if pos in defender_ids),
-        "midfielder": sum(count for pos, count in positions.items() if pos in midfielder_ids),
-        "forward": sum(count for pos, count in positions.items() if pos in forward_ids),
-    }
-
-    # If the player has no events in any position, return "dnp" (did not play)
-    if sum(scores.values()) == 0:
-        return "dnp"
+    # Get match event data
+    df = get_parser().event(match_id)[0]
 
-    # Get the label with the highest score
-    return max(scores, key=scores.get)
+    return count_player_positions(df)
 
 
-def get_player_info(match_ids):
+def get_player_info(match_ids, df_player_positions=None):
     """
-    Get player info (id, short name and position) from the Statsbomb lineups and tactics data.
+    Get player info (id, short name, position and position mask) from the Statsbomb lineups and tactics data.
 
     Parameters
     ----------
     match_ids: list
         A list of all match ids for a given competition and season
+    df_player_positions: pd.DataFrame
+        Optional positions of the players in all matches (see count_player_positions), so the events of the
+        matches don't have to be downloaded again.
 
     Returns
     -------
@@ -88,51 +74,45 @@ def get_player_info(match_ids):
         A dataframe with all basic player info.
     """
 
-    # Init empty list to store all players
+    # Init empty lists to store all players and their positions
     all_players_data = []
+    all_positions_data = []
 
-    # Loop through all matches and add relevant player info to all_players_data
+    # Loop through all matches and add relevant player info and positions
     for match_id in match_ids:
         # Get basic player info
-        df_lineup = parser.lineup(match_id)[
+        df_lineup = get_parser().lineup(match_id)[
             ['match_id', 'player_id', 'player_name', 'player_nickname', 'team_name']
         ]
-        
-        # Get positions of all players in the game
-        df_player_positions = get_player_positions(match_id)
+        all_players_data.append(df_lineup)
 
-        # Merge player info with player positions
-        match_player_data = pd.merge(
-            df_lineup, 
-            df_player_positions, 
-            on='player_id', 
-            how='left'
-        )
-
-        all_players_data.append(match_player_data)
+        # Get positions of all players in the game
+        if df_player_positions is None:
+            all_positions_data.append(get_player_positions(match_id))
 
-    # Create dataframe with all data
+    # Create dataframes with all data
     df_all_players = pd.concat(all_players_data, ignore_index=True)
+    df_all_positions = pd.concat(all_positions_data, ignore_index=True) if df_player_positions is None else df_player_positions
 
     # Rename nickname to short_name
     df_all_players.rename(columns={'player_nickname': 'player_short_name'}, inplace=True)
 
-    # Group by player_id and combine all positions into a single set
+    # Group by player_id and keep the first name and team
     df_unique_players = (
         df_all_players.groupby('player_id')
         .agg({
             'player_name': 'first',
             'player_short_name': 'first', 
-            'team_name': 'first',
-            'positions': lambda x: dict(sum((Counter(d) for d in x if isinstance(d, dict)), Counter()))
+            'team_name': 'first'
         })
         .reset_index()
     )
 
-    # Add position label
-    df_unique_players['position'] = df_unique_players['positions'].apply(get_position_label)
+    # Count events per player and position over all matches
+    position_matrix = create_position_matrix(df_all_positions, df_unique_players['player_id'])
 
-    # Drop positions column
-    df_unique_players.drop(columns=['positions'], inplace=True)
+    # Add position label and position group mask
+    df_unique_players['position'] = get_position_labels(position_matrix)
+    df_unique_players['position_mask'] = get_position_masks(position_matrix)
 
-    return df_unique_players
\ No newline at end of file
+    return df_unique_players
@@ -2,15 +2,17 @@
 This module contains functions to calculate the full player stats for a given player.
 """
 
-from src.dribbles import get_all_dribbles
-from src.basic_stats import calculate_goals_assists, calculate_shots_xg
-from src.dribble_stats import calculate_dribble_stats, calculate_danger_dribble_stats
+import pandas as pd
+
+from src.match_executor import map_matches
+from src.metrics import METRICS, calculate_metrics, get_per90_metrics
 from src.player_info import get_player_info
-from src.playing_time import calculate_playing_time
+from src.playing_time import sum_playing_time
+from src.possessions import get_possession_dribbles
 
 def calculate_per90_columns(df, columns, playing_time_column="playing_time"):
     """
-    Convert certainplayer stats to per 90 minutes.
+    Convert certain player stats to per 90 minutes.
 
     Parameters
     ----------
@@ -31,7 +33,7 @@ def calculate_per90_columns(df, columns, playing_time_column="playing_time"):
     return df_filtered
 
 
-def calculate_player_stats(match_ids, df_all_events, min_playing_time=16200, min_attempted_dribbles=10):
+def calculate_player_stats(match_ids, df_all_events, min_playing_time=16200, min_attempted_dribbles=10, shot_window=15, danger_definition="time", executor=None):
     """ 
     Create a dataframe with all player stats needed for the radar plot.
 
@@ -45,72 +47,87 @@ def calculate_player_stats(match_ids, df_all_events, min_playing_time=16200, min
         The minimum playing time in seconds.
     min_attempted_dribbles: int
         The minimum attempted dribbles.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+    danger_definition: str
+        "time": danger dribbles are followed by a shot of the team within the shot window.
+        "possession": danger dribbles are followed by a shot of the team in the same possession.
+    executor: dict
+        Optional match executor of the same match ids (see create_match_executor) to run the per match stages
+        (positions, playing time and dribbles) on all cores.
 
     Returns
     -------
     df_player_stats: pd.DataFrame
         A dataframe with all relevant player stats.
+
+    Raises
+    ------
+    ValueError
+        If danger_definition is not "time" or "possession".
     """
+    if danger_definition not in ("time", "possession"):
+        raise ValueError(f"Invalid danger definition: {danger_definition}. Valid definitions are: time and possession.")
+
+    # Run the per match stages in the executor, otherwise they are computed serially below
+    df_player_positions, df_playing_time, df_dribbles = None, None, None
+    if executor is not None:
+        df_player_positions = map_matches(executor, "positions")
+        df_playing_time = sum_playing_time(map_matches(executor, "playing_time"))
+        if danger_definition == "time":
+            df_dribbles = map_matches(executor, "dribbles", shot_window=shot_window)
 
     # Get all players in the tournament
-    df_player_info = get_player_info(match_ids)
+    df_player_info = get_player_info(match_ids, df_player_positions)
 
-    # Init player stats dataframe based as a copy of the players info
-    df_player_stats = df_player_info.copy()
+    # Dribbles for the time definition are computed by calculate_metrics
+    if danger_definition == "possession":
+        df_dribbles = get_possession_dribbles(match_ids, df_all_events)
 
-    # Calculate playing time
-    df_playing_time = calculate_playing_time(match_ids, df_all_events)
+    # Calculate all metrics in the registry, aligned with the player info rows
+    df_metrics = calculate_metrics(list(METRICS), match_ids, df_all_events, df_dribbles=df_dribbles, df_playing_time=df_playing_time, player_ids=df_player_info['player_id'], shot_window=shot_window)
 
-    # Calculate goals and assists
-    df_goals_assists = calculate_goals_assists(df_all_events)
+    # Add metrics to the player info
+    df_player_stats = pd.concat([df_player_info, df_metrics.drop(columns=['player_id'])], axis=1)
+
+    # Filter out players
+    df_player_stats = df_player_stats[(df_player_stats["playing_time"] >= min_playing_time) & (df_player_stats["attempted_dribbles"] >= min_attempted_dribbles)]
 
-    # Calculate xG from shots
-    df_xg_shots = calculate_shots_xg(df_all_events)
+    # Calculate per 90 columns
+    df_player_stats = calculate_per90_columns(df_player_stats, get_per90_metrics())
 
-    # Get all dribbles
-    df_dribbles = get_all_dribbles(match_ids, df_all_events)
+    return df_player_stats.reset_index(drop=True)
 
-    # Calculate dribbles
-    df_dribble_stats = calculate_dribble_stats(df_dribbles)
 
-    # Calculate danger dribbles
-    df_danger_dribbles = calculate_danger_dribble_stats(df_dribbles)
+def calculate_player_match_stats(match_ids, df_all_events, shot_window=15, executor=None):
+    """
+    Create a dataframe with the stats of every player in every match, used to resample matches (see src/bootstrap.py).
 
-    # Merge dataframes into df_player_stats
-    df_player_stats = (
-        df_player_stats
-            .merge(df_playing_time, on='player_id', how='left')
-            .merge(df_goals_assists, on='player_id', how='left')
-            .merge(df_xg_shots, on='player_id', how='left')
-            .merge(df_dribble_stats, on='player_id', how='left')
-            .merge(df_danger_dribbles, on='player_id', how='left')
-    )
+    Parameters
+    ----------
+    match_ids: list
+        A list of match ids to get the player stats for.
+    df_all_events: pd.DataFrame
+        A dataframe with all events for all matches.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+    executor: dict
+        Optional match executor of the same match ids (see create_match_executor) to run the per match stages
+        (playing time and dribbles) on all cores.
 
-    # Fill missing values with 0
-    df_player_stats.fillna(0, inplace=True)             # Each column that can be empty is a number, so we can use fillna with 0
+    Returns
+    -------
+    df_player_match_stats: pd.DataFrame
+        A dataframe with the aggregated stats (no derived or per 90 stats) per player and match.
+    """
 
-    # Filter out players
-    df_player_stats = df_player_stats[(df_player_stats["playing_time"] >= min_playing_time) & (df_player_stats["attempted_dribbles"] >= min_attempted_dribbles)]
-    
-    # Convert int columns
-    df_player_stats["playing_time"] = df_player_stats["playing_time"].astype(int)
-    df_player_stats["goals"] = df_player_stats["goals"].astype(int)
-    df_player_stats["assists"] = df_player_stats["assists"].astype(int)
-    df_player_stats["shots"] = df_player_stats["shots"].astype(int)
-    df_player_stats["completed_dribbles"] = df_player_stats["completed_dribbles"].astype(int)
-    df_player_stats["failed_dribbles"] = df_player_stats["failed_dribbles"].astype(int)
-    df_player_stats["attempted_dribbles"] = df_player_stats["attempted_dribbles"].astype(int)
-    df_player_stats["danger_dribbles"] = df_player_stats["danger_dribbles"].astype(int)
-    df_player_stats["dribbles_to_goals"] = df_player_stats["dribbles_to_goals"].astype(int)
-
-    # Columns to convert to per 90 minutes
-    convert_to_per90_columns = [
-        "goals", "assists", "shots", "shots_xg",
-        "completed_dribbles", "failed_dribbles", "attempted_dribbles",
-        "danger_dribbles", "danger_dribbles_xg", "dribbles_to_goals"
-    ]
+    # Derived and per 90 stats are recalculated from the (resampled) match totals
+    aggregated_metrics = [name for name, metric in METRICS.items() if "formula" not in metric]
 
-    # Calculate per 90 columns
-    df_player_stats = calculate_per90_columns(df_player_stats, convert_to_per90_columns)
+    # Run the per match stages in the executor, otherwise they are computed serially by calculate_metrics
+    df_playing_time, df_dribbles = None, None
+    if executor is not None:
+        df_playing_time = map_matches(executor, "playing_time")
+        df_dribbles = map_matches(executor, "dribbles", shot_window=shot_window)
 
-    return df_player_stats.reset_index(drop=True)
\ No newline at end of file
+    return calculate_metrics(aggregated_metrics, match_ids, df_all_events, df_dribbles=df_dribbles, df_playing_time=df_playing_time, shot_window=shot_window, by_match=True)
@@ -215,9 +215,9 @@ def calculate_playing_time_single_match(df):
     return df_players.reset_index(drop=True)
 
 
-def calculate_playing_time(match_ids, df):
+def calculate_playing_time_per_match(match_ids, df):
     """
-    Calculate the playing time (in seconds) of players for the whole season.
+    Calculate the playing time (in seconds) of players in every match.
 
     Parameters
     ----------
@@ -229,7 +229,7 @@ def calculate_playing_time(match_ids, df):
     Returns
     -------
     df_playing_time: pd.DataFrame
-        A dataframe with the playing time of players for the whole season.
+        A dataframe with the playing time of players in every match they played.
     """
 
     # Init empty list for playing time dataframes
@@ -241,7 +241,45 @@ def calculate_playing_time(match_ids, df):
         df_playing_time_match = calculate_playing_time_single_match(df_match)
         playing_time_list.append(df_playing_time_match)
 
-    df_playing_time = pd.concat(playing_time_list)
+    return pd.concat(playing_time_list).reset_index(drop=True)
+
+
+def calculate_playing_time(match_ids, df):
+    """
+    Calculate the playing time (in seconds) of players for the whole season.
+
+    Parameters
+    ----------
+    match_ids: list
+        A list of match ids to calculate the playing time for.
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+
+    Returns
+    -------
+    df_playing_time: pd.DataFrame
+        A dataframe with the playing time of players for the whole season.
+    """
+
+    df_playing_time = calculate_playing_time_per_match(match_ids, df)
+
+    return sum_playing_time(df_playing_time)
+
+
+def sum_playing_time(df_playing_time):
+    """
+    Sum the playing time of players over all matches.
+
+    Parameters
+    ----------
+    df_playing_time: pd.DataFrame
+        A dataframe with the playing time of players in every match they played (see calculate_playing_time_per_match).
+
+    Returns
+    -------
+    df_playing_time: pd.DataFrame
+        A dataframe with the playing time of players for the whole season.
+    """
 
     # Group by player_id and sum the playing time
     df_playing_time = df_playing_time.groupby('player_id').sum().reset_index()
@@ -249,4 +287,4 @@ def calculate_playing_time(match_ids, df):
     # Drop match_id column
     df_playing_time = df_playing_time.drop(columns=['match_id'])
 
-    return df_playing_time
\ No newline at end of file
+    return df_playing_time
@@ -0,0 +1,278 @@
+"""
+This module contains functions to get the data of the radar and pitch plots as a compact payload.
+
+Instead of a rendered PNG, a payload has the plotted data: the values, percentiles, labels and colors of the radar
+slices and the location, outcome, danger and xG of every dribble on the pitch. The app draws it with a chart in the
+browser (see src/vega_plots.py), so a view doesn't need matplotlib on the server.
+
+The form chart payload has the rolling stats of a player at every match (see src/form.py).
+
+A payload is a dict with scalar fields (player, texts, colors) and a table of columns (the slices, dribbles or matches).
+It can be encoded as JSON or as an Arrow IPC stream with the scalar fields in the schema metadata.
+"""
+
+import json
+import math
+
+from src.data_plots import RADAR_COLUMNS
+from src.form import calculate_rolling_form
+from src.pitch_plot import DANGER_DRIBBLE_COLOR
+from src.plot_style import BACKGROUND_COLOR, DARK_COLOR
+from src.radar_plot import RADAR_COLORS, RADAR_PARAMS, get_radar_content
+
+# Payload formats
+PLOT_DATA_FORMATS = ["json", "arrow"]
+
+# Stats on the form chart by default
+FORM_METRICS = ["attempted_dribbles_per90", "danger_dribbles_xg_per90", "dribble_success_rate"]
+
+
+def get_radar_plot_data(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, df_intervals=None, percentiles=None, reference=None):
+    """
+    Get the data of a radar plot.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort.
+    player_id: int
+        The id of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort (see create_radar_plot).
+    df_intervals: pd.DataFrame
+        Optional bootstrap intervals of the cohort (see calculate_bootstrap_intervals).
+    percentiles: list
+        Optional percentiles of the player from the percentile cube (see lookup_percentiles).
+    reference: dict
+        The reference cohort if the percentiles are against all competitions (see lookup_sketch_percentiles).
+
+    Returns
+    -------
+    data: dict
+        The radar payload, with a slice per stat in the "table" field.
+    """
+    # Same content as the radar plot
+    content = get_radar_content(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals, percentiles, reference)
+    notes = [
+        content["footnote"],
+        f"Danger dribbles: dribbles that end in a shot within {shot_window} seconds",
+    ]
+
+    table = {
+        "label": [param.replace("\n", " ") for param in RADAR_PARAMS],
+        "value": content["values"],
+        "percentile": content["percentiles"],
+        "color": RADAR_COLORS,
+    }
+
+    # Percentile intervals of the player, in slice order
+    if content["intervals"] is not None:
+        table["percentile_lower"] = content["intervals"]["lower"]
+        table["percentile_upper"] = content["intervals"]["upper"]
+        notes.append("Lines: 90% interval of the percentile when matches are resampled")
+
+    return {
+        "plot": "radar",
+        "player_id": int(player_id),
+        "player_name": content["player_name"],
+        "team_name": content["team_name"],
+        "title": f"{content['player_name']} - {content['team_name']}",
+        "subtitle": content["subtitle"],
+        "notes": notes,
+        "background_color": BACKGROUND_COLOR,
+        "dark_color": DARK_COLOR,
+        "table": table,
+    }
+
+
+def get_pitch_plot_data(df_dribbles, player_id, player_name, team_name, shot_window=15):
+    """
+    Get the data of a pitch plot.
+
+    Parameters
+    ----------
+    df_dribbles: pd.DataFrame
+        The dataframe with all dribbles of the season.
+    player_id: int
+        The id of the player.
+    player_name, team_name, shot_window:
+        See create_pitch_plot.
+
+    Returns
+    -------
+    data: dict
+        The pitch payload, with a row per dribble in the "table" field (StatsBomb coordinates).
+    """
+    df_player_dribbles = df_dribbles[df_dribbles["player_id"] == player_id]
+    completed = (df_player_dribbles["outcome_name"] == "Complete").to_numpy()
+    danger = completed & (df_player_dribbles["danger_dribble"] == True).to_numpy()
+
+    # Round to what a chart can show, so the payload stays small
+    table = {
+        "x": df_player_dribbles["x"].astype(float).round(1).tolist(),
+        "y": df_player_dribbles["y"].astype(float).round(1).tolist(),
+        "outcome": df_player_dribbles["outcome_name"].astype(str).tolist(),
+        "danger": danger.tolist(),
+        "xg": df_player_dribbles["xg_from_dribble"].astype(float).round(3).tolist(),
+    }
+
+    return {
+        "plot": "pitch",
+        "player_id": int(player_id),
+        "player_name": str(player_name),
+        "team_name": str(team_name),
+        "title": f"{player_name} - {team_name}",
+        "subtitle": "All dribbles at Euro 2024",
+        "notes": [f"Danger dribbles: dribbles that end in a shot within {shot_window} seconds"],
+        "totals": {
+            "completed": int(completed.sum()),
+            "danger": int(danger.sum()),
+            "failed": int((df_player_dribbles["outcome_name"] == "Incomplete").sum()),
+        },
+        "background_color": BACKGROUND_COLOR,
+        "dark_color": DARK_COLOR,
+        "danger_color": DANGER_DRIBBLE_COLOR,
+        "table": table,
+    }
+
+
+def get_form_plot_data(df_form, player_id, player_name, team_name, window=3, metrics=None):
+    """
+    Get the data of a form chart.
+
+    Parameters
+    ----------
+    df_form: pd.DataFrame
+        The form series of all players (see create_form_series).
+    player_id: int
+        The id of the player.
+    player_name, team_name: str
+        The name and team of the player, shown in the title.
+    window: int
+        The number of matches in the rolling window.
+    metrics: list
+        The stats to show (columns of the radar plot), FORM_METRICS by default.
+
+    Returns
+    -------
+    data: dict
+        The form payload, with a row per match and stat in the "table" field.
+
+    Raises
+    ------
+    ValueError
+        If a stat is not on the radar plot.
+    """
+    metrics = metrics or FORM_METRICS
+    invalid = [metric for metric in metrics if metric not in RADAR_COLUMNS]
+    if invalid:
+        raise ValueError(f"Invalid metrics: {', '.join(invalid)}. Valid metrics are: {', '.join(RADAR_COLUMNS)}.")
+
+    # Only the matches of the player are needed for the rolling window
+    df_rolling = calculate_rolling_form(df_form[df_form["player_id"] == player_id], window)
+
+    # One row per match and stat, so every stat gets its own line
+    table = {"match": [], "match_date": [], "opponent": [], "matches": [], "minutes": [], "label": [], "value": [], "color": []}
+    for metric in metrics:
+        i = RADAR_COLUMNS.index(metric)
+        table["match"] += list(range(1, len(df_rolling) + 1))
+        table["match_date"] += [str(match_date) for match_date in df_rolling["match_date"]]
+        table["opponent"] += df_rolling["opponent"].astype(str).tolist()
+        table["matches"] += df_rolling["matches"].astype(int).tolist()
+        table["minutes"] += (df_rolling["playing_time"] / 60).round().astype(int).tolist()
+        table["label"] += [RADAR_PARAMS[i].replace("\n", " ")] * len(df_rolling)
+        table["value"] += [None if math.isnan(value) else round(float(value), 3) for value in df_rolling[metric]]
+        table["color"] += [RADAR_COLORS[i]] * len(df_rolling)
+
+    return {
+        "plot": "form",
+        "player_id": int(player_id),
+        "player_name": str(player_name),
+        "team_name": str(team_name),
+        "title": f"{player_name} - {team_name}",
+        "subtitle": f"Form over the last {window} matches at Euro 2024",
+        "notes": [
+            f"Per 90 stats and rates over the last {window} matches at every match, the first matches use the matches played so far",
+            "Danger dribbles: dribbles that end in a shot within 15 seconds",
+        ],
+        "background_color": BACKGROUND_COLOR,
+        "dark_color": DARK_COLOR,
+        "table": table,
+    }
+
+
+def encode_plot_data(data, data_format="json"):
+    """
+    Encode a radar or pitch payload.
+
+    Parameters
+    ----------
+    data: dict
+        The payload (see get_radar_plot_data and get_pitch_plot_data).
+    data_format: str
+        "json" or "arrow".
+
+    Returns
+    -------
+    bytes
+        The encoded payload.
+
+    Raises
+    ------
+    ValueError
+        If data_format is not "json" or "arrow".
+    """
+    if data_format not in PLOT_DATA_FORMATS:
+        raise ValueError(f"Invalid format: {data_format}. Valid formats are: json and arrow.")
+
+    if data_format == "json":
+        return json.dumps(data, separators=(",", ":")).encode()
+
+    # Import pyarrow only for Arrow payloads
+    import pyarrow as pa
+
+    # The table becomes the record batch, the other fields go into the schema metadata
+    fields = {key: value for key, value in data.items() if key != "table"}
+    table = pa.table(data["table"]).replace_schema_metadata({"plot_data": json.dumps(fields, separators=(",", ":"))})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def decode_plot_data(payload, data_format="json"):
+    """
+    Decode a radar or pitch payload.
+
+    Parameters
+    ----------
+    payload: bytes
+        The encoded payload (see encode_plot_data).
+    data_format: str
+        "json" or "arrow".
+
+    Returns
+    -------
+    data: dict
+        The payload.
+
+    Raises
+    ------
+    ValueError
+        If data_format is not "json" or "arrow".
+    """
+    if data_format not in PLOT_DATA_FORMATS:
+        raise ValueError(f"Invalid format: {data_format}. Valid formats are: json and arrow.")
+
+    if data_format == "json":
+        return json.loads(payload)
+
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(payload).read_all()
+    data = json.loads(table.schema.metadata[b"plot_data"])
+    data["table"] = table.to_pydict()
+
+    return data
@@ -0,0 +1,132 @@
+"""
+This module contains the shared style of the radar and pitch plots and functions to draw them without pyplot.
+
+Plots are drawn on explicit Figure objects with an Agg canvas, so they never touch the global figure manager of pyplot
+and can be rendered from a thread pool. The font is registered once from the assets of the project, independent of the
+working directory. Matplotlib reads the style (rcParams) when the artists are created, the rcParams are global, so the
+artists of a plot are created in a style context that holds a lock. Saving and drawing the figure don't read the style
+and run concurrently.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Get project root directory
+project_root = Path(__file__).parent.parent
+
+# Font of all plots
+FONT_PATH = project_root / "assets" / "Futura.ttc"
+
+# Background color of all plots
+BACKGROUND_COLOR = "#f2f4ee"
+
+# Text and line color of all plots
+DARK_COLOR = "#053225"
+
+# Guards the font registration and the global rcParams while a style context is active
+_style_lock = threading.RLock()
+_font_name = None
+
+
+def register_font():
+    """
+    Register the font of the plots with matplotlib, once per process.
+
+    Returns
+    -------
+    str
+        The name of the font family.
+    """
+    global _font_name
+
+    with _style_lock:
+        if _font_name is None:
+            from matplotlib import font_manager
+
+            font_manager.fontManager.addfont(str(FONT_PATH))
+            _font_name = font_manager.FontProperties(fname=str(FONT_PATH)).get_name()
+
+    return _font_name
+
+
+def get_plot_style():
+    """
+    Get the rcParams of the plots.
+
+    Returns
+    -------
+    dict
+        The font family and the colors of texts, labels, edges, ticks and grid lines.
+    """
+    return {
+        "font.family": register_font(),
+        "text.color": DARK_COLOR,
+        "axes.labelcolor": DARK_COLOR,
+        "axes.edgecolor": DARK_COLOR,
+        "xtick.color": DARK_COLOR,
+        "ytick.color": DARK_COLOR,
+        "grid.color": DARK_COLOR,
+    }
+
+
+@contextmanager
+def plot_style():
+    """
+    Create the artists of a plot in the style of the plots.
+
+    The rcParams are only changed within the context, other threads wait until the context exits.
+    """
+    import matplotlib
+
+    with _style_lock, matplotlib.rc_context(get_plot_style()):
+        yield
+
+
+def create_figure(figsize):
+    """
+    Create a figure with an Agg canvas, without pyplot.
+
+    Parameters
+    ----------
+    figsize: tuple
+        The width and height of the figure in inches.
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+        The figure. It isn't registered with pyplot, so it doesn't have to be closed.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+
+    return fig
+
+
+def save_figure(fig, path, **kwargs):
+    """
+    Save a figure as PNG.
+
+    The image is written next to the path and renamed over it, so renders of the same plot in other threads or
+    processes never write into the same file and readers never see a partly written image.
+
+    Parameters
+    ----------
+    fig: matplotlib.figure.Figure
+        The figure.
+    path: str or Path
+        The path of the image.
+    kwargs:
+        Keyword arguments of Figure.savefig (e.g. bbox_inches, facecolor and dpi).
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fig.savefig(temp_path, format="png", **kwargs)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
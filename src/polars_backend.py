@@ -0,0 +1,387 @@
+"""
+This module contains a Polars backend for the player stats and dribbles pipeline.
+
+The same pipeline as the pandas modules (src/dribbles.py, src/playing_time.py, src/metrics.py and
+src/player_stats.py) is expressed as lazy Polars queries. Only the columns the pipeline needs are converted,
+filters are pushed down into the scans and the independent queries (playing time, event stats and dribbles)
+are collected together on all cores. Inputs and outputs are pandas dataframes, so the backend can be selected
+when the data is built (see create_data.py) without changing anything else.
+
+Polars is an optional dependency, it is imported on first use.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import get_metric_dtypes, get_per90_metrics, METRICS
+from src.dribbles import dribble_columns
+
+# Columns of the event data used by the pipeline
+EVENT_COLUMNS = [
+    "match_id", "period", "minute", "second", "timestamp", "type_name", "team_name", "player_id",
+    "outcome_id", "outcome_name", "x", "y", "shot_statsbomb_xg", "pass_goal_assist", "substitution_replacement_id",
+    "foul_committed_card_name", "bad_behaviour_card_name",
+]
+
+# Length of every period in minutes, used for the additional time (penalties are not counted)
+PERIOD_LENGTHS = {1: 45, 2: 90, 3: 105, 4: 120}
+
+
+def _import_polars():
+    try:
+        import polars as pl
+    except ImportError as error:
+        raise ImportError("The Polars backend needs polars, install it with `pip install polars`.") from error
+
+    return pl
+
+
+def to_lazy_events(df, match_ids):
+    """
+    Convert the columns of the event data that the pipeline needs to a lazy Polars frame.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    match_ids: list
+        The match ids to keep.
+
+    Returns
+    -------
+    lf_events: pl.LazyFrame
+        The events with a row column (the event order) and the time in seconds.
+    """
+    pl = _import_polars()
+
+    # Convert only the needed columns, mixed object columns are normalized first
+    df_events = pd.DataFrame({column: df[column] for column in EVENT_COLUMNS if column in df.columns})
+    if "timestamp" in df_events.columns:
+        timestamps = df_events["timestamp"]
+        df_events["timestamp"] = [
+            np.nan if pd.isna(timestamp) else (timestamp.hour * 60 + timestamp.minute) * 60 + timestamp.second
+            for timestamp in timestamps
+        ]
+    if "pass_goal_assist" in df_events.columns:
+        df_events["pass_goal_assist"] = df_events["pass_goal_assist"] == True
+    for column in ["foul_committed_card_name", "bad_behaviour_card_name"]:
+        if column in df_events.columns:
+            df_events[column] = df_events[column].astype("string")
+        else:
+            df_events[column] = pd.Series(pd.NA, index=df_events.index, dtype="string")
+
+    return (pl.from_pandas(df_events)
+            .lazy()
+            .with_row_index("row")
+            .filter(pl.col("match_id").is_in(list(match_ids)))
+            .with_columns((pl.col("minute") * 60 + pl.col("second")).alias("time")))
+
+
+def get_dribble_shot_gaps(lf_events):
+    """
+    Get all dribbles and the time until the next shot of the same team in the same period (see src/dribbles.py).
+
+    Parameters
+    ----------
+    lf_events: pl.LazyFrame
+        The events (see to_lazy_events).
+
+    Returns
+    -------
+    lf_dribbles: pl.LazyFrame
+        The dribbles in event order with the shot_gap, next_shot_xg and next_shot_goal columns.
+    """
+    pl = _import_polars()
+
+    # Only check first half, second half and extra time but not penalties
+    lf_periods = lf_events.filter(pl.col("period").is_in([1, 2, 3, 4]))
+    lf_dribbles = lf_periods.filter(pl.col("type_name") == "Dribble")
+    lf_shots = (lf_periods
+                .filter(pl.col("type_name") == "Shot")
+                .select(
+                    "match_id", "period", "team_name", "time",
+                    pl.col("time").alias("shot_time"),
+                    pl.col("shot_statsbomb_xg").alias("next_shot_xg"),
+                    (pl.col("outcome_name") == "Goal").alias("next_shot_goal"),
+                )
+                .sort("time", maintain_order=True))
+
+    # Find the first shot of the same team in the same period at or after each completed dribble,
+    # both sides are sorted by time above (the sortedness can't be checked within groups)
+    lf_gaps = (lf_dribbles
+               .filter(pl.col("outcome_name") == "Complete")
+               .select("row", "match_id", "period", "team_name", "time")
+               .sort("time", maintain_order=True)
+               .join_asof(lf_shots, on="time", by=["match_id", "period", "team_name"], strategy="forward", check_sortedness=False)
+               .select(
+                   "row",
+                   (pl.col("shot_time") - pl.col("time")).cast(pl.Float64).alias("shot_gap"),
+                   "next_shot_xg",
+                   "next_shot_goal",
+               ))
+
+    return (lf_dribbles
+            .join(lf_gaps, on="row", how="left")
+            .with_columns(pl.col("next_shot_goal").fill_null(False))
+            .sort("row"))
+
+
+def apply_shot_window(lf_dribbles, shot_window=15):
+    """
+    Flag danger dribbles for a shot window (see src/dribbles.py).
+
+    Parameters
+    ----------
+    lf_dribbles: pl.LazyFrame
+        The dribbles with their gap to the next shot (see get_dribble_shot_gaps).
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+
+    Returns
+    -------
+    lf_dribbles: pl.LazyFrame
+        The dribbles with the danger_dribble, xg_from_dribble and dribble_to_goal columns.
+    """
+    pl = _import_polars()
+
+    danger = (pl.col("shot_gap") <= shot_window).fill_null(False)
+
+    return lf_dribbles.with_columns(
+        danger.alias("danger_dribble"),
+        pl.when(danger).then(pl.col("next_shot_xg")).otherwise(0.0).alias("xg_from_dribble"),
+        (danger & pl.col("next_shot_goal")).alias("dribble_to_goal"),
+    )
+
+
+def calculate_playing_time(lf_events):
+    """
+    Calculate the playing time (in seconds) of players per match (see src/playing_time.py).
+
+    Parameters
+    ----------
+    lf_events: pl.LazyFrame
+        The events (see to_lazy_events).
+
+    Returns
+    -------
+    lf_playing_time: pl.LazyFrame
+        The playing time of every player in every match.
+    """
+    pl = _import_polars()
+
+    # Length and additional time of every period, from the first half end event of the period
+    lf_periods = (lf_events
+                  .filter((pl.col("type_name") == "Half End") & pl.col("period").is_in(list(PERIOD_LENGTHS)))
+                  .group_by("match_id", "period")
+                  .agg(pl.all().sort_by("row").first())
+                  .select(
+                      "match_id", "period",
+                      pl.col("timestamp").alias("length"),
+                      (pl.col("time") - pl.col("period").replace_strict(PERIOD_LENGTHS) * 60).alias("additional_time"),
+                  ))
+    lf_full_time = lf_periods.group_by("match_id").agg(pl.col("length").sum().alias("full_game_time"))
+
+    def with_additional_time(lf, event_period, before):
+        # Add the additional time of the periods before (or from) the event period, without extra time end
+        lf_joined = lf.join(lf_periods.select("match_id", "period", "additional_time"), on="match_id", how="left")
+        in_range = pl.col("period") < pl.col(event_period) if before else (pl.col("period") >= pl.col(event_period)) & (pl.col("period") < 4)
+        return (lf_joined
+                .group_by(lf.collect_schema().names())
+                .agg(pl.col("additional_time").filter(in_range).sum().alias("missed_additional_time")))
+
+    # First substitution on, substitution off and red card of every player
+    lf_subs = lf_events.filter(pl.col("type_name") == "Substitution")
+    lf_on = (lf_subs
+             .select("match_id", pl.col("substitution_replacement_id").alias("player_id"), pl.col("period").alias("on_period"), pl.col("time").alias("on_time"), "row")
+             .sort("row").unique(["match_id", "player_id"], keep="first").drop("row"))
+    lf_off = (lf_subs
+              .select("match_id", "player_id", pl.col("period").alias("off_period"), pl.col("time").alias("off_time"), "row")
+              .sort("row").unique(["match_id", "player_id"], keep="first").drop("row"))
+    red_cards = ["Red Card", "Second Yellow"]
+    lf_red = (lf_events
+              .filter(pl.col("foul_committed_card_name").is_in(red_cards).fill_null(False) | pl.col("bad_behaviour_card_name").is_in(red_cards).fill_null(False))
+              .select("match_id", "player_id", pl.col("period").alias("red_period"), pl.col("time").alias("red_time"), "row")
+              .sort("row").unique(["match_id", "player_id"], keep="first").drop("row"))
+
+    lf_on = with_additional_time(lf_on, "on_period", before=True).rename({"missed_additional_time": "on_additional"})
+    lf_off = with_additional_time(lf_off, "off_period", before=False).rename({"missed_additional_time": "off_additional"})
+    lf_red = with_additional_time(lf_red, "red_period", before=False).rename({"missed_additional_time": "red_additional"})
+
+    # Players who played in the match, a red card overrides a substitution off, which overrides a substitution on
+    full_game_time = pl.col("full_game_time")
+    return (lf_events
+            .filter(pl.col("player_id").is_not_null())
+            .select("match_id", "player_id")
+            .unique()
+            .join(lf_full_time, on="match_id", how="left")
+            .join(lf_on, on=["match_id", "player_id"], how="left")
+            .join(lf_off, on=["match_id", "player_id"], how="left")
+            .join(lf_red, on=["match_id", "player_id"], how="left")
+            .select(
+                "match_id", "player_id",
+                pl.when(pl.col("red_time").is_not_null()).then(pl.col("red_time") - pl.col("red_additional"))
+                .when(pl.col("off_time").is_not_null()).then(pl.col("off_time") - pl.col("off_additional"))
+                .when(pl.col("on_time").is_not_null()).then(full_game_time - pl.col("on_time") - pl.col("on_additional"))
+                .otherwise(full_game_time)
+                .alias("playing_time"),
+            ))
+
+
+def calculate_event_stats(lf_events):
+    """
+    Calculate the goals, assists, shots and shot xG of players.
+
+    Parameters
+    ----------
+    lf_events: pl.LazyFrame
+        The events (see to_lazy_events).
+
+    Returns
+    -------
+    lf_event_stats: pl.LazyFrame
+        The event stats per player.
+    """
+    pl = _import_polars()
+
+    # goal id is 97, don't count penalties, own goals don't have a outcome_id
+    is_goal = ((pl.col("outcome_id") == 97) & (pl.col("period") != 5)).fill_null(False)
+    is_shot = pl.col("type_name") == "Shot"
+
+    return (lf_events
+            .filter(pl.col("player_id").is_not_null())
+            .group_by("player_id")
+            .agg(
+                is_goal.sum().alias("goals"),
+                pl.col("pass_goal_assist").sum().alias("assists"),
+                is_shot.sum().alias("shots"),
+                pl.col("shot_statsbomb_xg").fill_nan(None).filter(is_shot).sum().alias("shots_xg"),
+            ))
+
+
+def calculate_dribble_stats(lf_dribbles):
+    """
+    Calculate the (danger) dribble stats of players.
+
+    Parameters
+    ----------
+    lf_dribbles: pl.LazyFrame
+        The dribbles with the danger dribble columns (see apply_shot_window).
+
+    Returns
+    -------
+    lf_dribble_stats: pl.LazyFrame
+        The dribble stats per player.
+    """
+    pl = _import_polars()
+
+    danger = pl.col("danger_dribble")
+
+    return (lf_dribbles
+            .filter(pl.col("player_id").is_not_null())
+            .group_by("player_id")
+            .agg(
+                (pl.col("outcome_name") == "Complete").sum().alias("completed_dribbles"),
+                (pl.col("outcome_name") == "Incomplete").sum().alias("failed_dribbles"),
+                danger.sum().alias("danger_dribbles"),
+                pl.col("xg_from_dribble").fill_nan(None).filter(danger).sum().alias("danger_dribbles_xg"),
+                pl.col("dribble_to_goal").filter(danger).sum().alias("dribbles_to_goals"),
+            ))
+
+
+def get_all_dribbles(match_ids, df, shot_window=15):
+    """
+    Get all dribbles for a season and add xG from danger dribbles (see src/dribbles.py).
+
+    Parameters
+    ----------
+    match_ids: list
+        A list of match ids to get the dribbles for.
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+
+    Returns
+    -------
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles for a season and the xG from danger dribbles, in the order of match_ids.
+    """
+    pl = _import_polars()
+
+    lf_dribbles = apply_shot_window(get_dribble_shot_gaps(to_lazy_events(df, match_ids)), shot_window)
+    match_order = pl.LazyFrame({"match_id": list(match_ids), "match_order": np.arange(len(match_ids))})
+
+    df_dribbles = (lf_dribbles
+                   .join(match_order, on="match_id", how="left")
+                   .sort("match_order", "row")
+                   .select(dribble_columns)
+                   .collect()
+                   .to_pandas())
+
+    return df_dribbles
+
+
+def calculate_player_stats(match_ids, df_all_events, min_playing_time=16200, min_attempted_dribbles=10, shot_window=15):
+    """
+    Create a dataframe with all player stats needed for the radar plot (see src/player_stats.py).
+
+    Parameters
+    ----------
+    match_ids: list
+        A list of match ids to get the player stats for.
+    df_all_events: pd.DataFrame
+        A dataframe with all events for all matches.
+    min_playing_time: int
+        The minimum playing time in seconds.
+    min_attempted_dribbles: int
+        The minimum attempted dribbles.
+    shot_window: int
+        A completed dribble is a danger dribble if the team shoots within this many seconds.
+
+    Returns
+    -------
+    df_player_stats: pd.DataFrame
+        A dataframe with all relevant player stats.
+    """
+    from src.player_info import get_player_info
+
+    pl = _import_polars()
+
+    # Player info comes from the lineups, the stats from the events
+    df_player_info = get_player_info(match_ids)
+    lf_events = to_lazy_events(df_all_events, match_ids)
+    lf_dribbles = apply_shot_window(get_dribble_shot_gaps(lf_events), shot_window)
+
+    # Collect the independent queries together, so they run in parallel
+    df_playing_time, df_event_stats, df_dribble_stats = pl.collect_all([
+        calculate_playing_time(lf_events).group_by("player_id").agg(pl.col("playing_time").sum()),
+        calculate_event_stats(lf_events),
+        calculate_dribble_stats(lf_dribbles),
+    ])
+
+    # Align all stats with the player info rows, players without stats get 0
+    df_stats = pl.DataFrame({"player_id": df_player_info["player_id"].to_numpy().astype(float)})
+    for df_source in [df_playing_time, df_event_stats, df_dribble_stats]:
+        df_stats = df_stats.join(df_source.with_columns(pl.col("player_id").cast(pl.Float64)), on="player_id", how="left", maintain_order="left")
+    df_stats = df_stats.fill_null(0)
+
+    # Derived metrics
+    df_stats = df_stats.with_columns((pl.col("completed_dribbles") + pl.col("failed_dribbles")).alias("attempted_dribbles"))
+    df_stats = df_stats.with_columns(
+        pl.when(pl.col("attempted_dribbles") > 0).then(pl.col("completed_dribbles") / pl.col("attempted_dribbles")).otherwise(0.0).alias("dribble_success_rate"),
+        pl.when(pl.col("danger_dribbles") > 0).then(pl.col("danger_dribbles_xg") / pl.col("danger_dribbles")).otherwise(0.0).alias("xg_per_danger_dribble"),
+    )
+
+    # Same columns and dtypes as the pandas backend
+    df_metrics = df_stats.select(list(METRICS)).to_pandas().astype(get_metric_dtypes(list(METRICS)))
+    df_player_stats = pd.concat([df_player_info, df_metrics], axis=1)
+
+    # Filter out players
+    df_player_stats = df_player_stats[(df_player_stats["playing_time"] >= min_playing_time) & (df_player_stats["attempted_dribbles"] >= min_attempted_dribbles)]
+    df_player_stats = df_player_stats[df_player_stats["playing_time"] > 0].copy()
+
+    # Calculate per 90 columns
+    for column in get_per90_metrics():
+        df_player_stats[f"{column}_per90"] = df_player_stats[column] / df_player_stats["playing_time"] * 5400
+
+    return df_player_stats.reset_index(drop=True)
@@ -0,0 +1,161 @@
+"""
+This module contains the StatsBomb position groups and vectorized helpers to label and filter players by position.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Number of StatsBomb position ids (1 = goalkeeper, ..., 25 = secondary striker)
+N_POSITIONS = 25
+
+# Position ids per position group
+POSITION_GROUPS = {
+    "keeper": [1],
+    "defender": [2, 3, 4, 5, 6, 7, 8],
+    "midfielder": [9, 10, 11, 12, 13, 14, 15, 16],
+    "forward": [17, 18, 19, 20, 21, 22, 23, 24, 25],
+}
+
+# Bit of every position group in the position mask
+POSITION_BITS = {group: 1 << i for i, group in enumerate(POSITION_GROUPS)}
+
+# Position filters used in the app and plots
+POSITION_FILTERS = {
+    "Defenders": "defender",
+    "Midfielders": "midfielder",
+    "Forwards": "forward",
+}
+
+# Indicator matrix with shape (groups, positions): 1 if the position id belongs to the group
+_group_matrix = np.zeros((len(POSITION_GROUPS), N_POSITIONS), dtype=np.int64)
+for _i, _ids in enumerate(POSITION_GROUPS.values()):
+    _group_matrix[_i, np.asarray(_ids) - 1] = 1
+
+
+def create_position_matrix(df_positions, player_ids):
+    """
+    Create a dense player x position count matrix.
+
+    Parameters
+    ----------
+    df_positions: pd.DataFrame
+        A dataframe with player_id, position_id and count columns (one row per player and position, can repeat over matches).
+    player_ids: array-like
+        The player ids that define the rows of the matrix.
+
+    Returns
+    -------
+    position_matrix: np.ndarray
+        An array with shape (len(player_ids), 25) with the number of events of each player in each position.
+    """
+    player_ids = pd.Index(player_ids)
+
+    # Encode players as row numbers, unknown players get -1
+    player_codes = player_ids.get_indexer(df_positions["player_id"])
+    position_codes = df_positions["position_id"].to_numpy(dtype=np.int64) - 1
+    valid = (player_codes >= 0) & (position_codes >= 0) & (position_codes < N_POSITIONS)
+
+    # Count all (player, position) pairs in a single bincount
+    flat_codes = player_codes[valid] * N_POSITIONS + position_codes[valid]
+    counts = np.bincount(
+        flat_codes,
+        weights=df_positions["count"].to_numpy()[valid],
+        minlength=len(player_ids) * N_POSITIONS
+    )
+
+    return counts.astype(np.int64).reshape(len(player_ids), N_POSITIONS)
+
+
+def get_group_scores(position_matrix):
+    """
+    Sum the position counts per position group.
+
+    Parameters
+    ----------
+    position_matrix: np.ndarray
+        A player x position count matrix (see create_position_matrix).
+
+    Returns
+    -------
+    group_scores: np.ndarray
+        An array with shape (players, 4) with the number of events per position group (keeper, defender, midfielder, forward).
+    """
+    return np.asarray(position_matrix) @ _group_matrix.T
+
+
+def get_position_labels(position_matrix):
+    """
+    Get the position label for every player: the position group with the most events.
+
+    Parameters
+    ----------
+    position_matrix: np.ndarray
+        A player x position count matrix (see create_position_matrix).
+
+    Returns
+    -------
+    labels: np.ndarray
+        The position label for every player, "dnp" (did not play) for players without any events.
+    """
+    group_scores = get_group_scores(position_matrix)
+    labels = np.array(list(POSITION_GROUPS), dtype=object)[group_scores.argmax(axis=1)]
+
+    # Players without events in any position did not play
+    labels[group_scores.sum(axis=1) == 0] = "dnp"
+
+    return labels
+
+
+def get_position_masks(position_matrix):
+    """
+    Get a bitmask of all position groups a player has played in.
+
+    Parameters
+    ----------
+    position_matrix: np.ndarray
+        A player x position count matrix (see create_position_matrix).
+
+    Returns
+    -------
+    masks: np.ndarray
+        The position mask for every player, with one bit per position group (see POSITION_BITS).
+    """
+    group_bits = np.array(list(POSITION_BITS.values()), dtype=np.int64)
+
+    return (get_group_scores(position_matrix) > 0) @ group_bits
+
+
+def get_position_filter_mask(df, position_filter):
+    """
+    Select the players of a position filter with a bitwise test on their position mask.
+
+    A player is in the position filter if they played in any position of its group. Player stats without a
+    position_mask column (created before the masks) are filtered on the position label instead.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with player stats including a 'position_mask' or 'position' column.
+    position_filter: str
+        The position filter: All, Defenders, Midfielders or Forwards.
+
+    Returns
+    -------
+    mask: np.ndarray
+        A boolean array, True for the players in the position filter.
+
+    Raises
+    ------
+    ValueError
+        If position_filter is not one of the accepted values: "All", "Defenders", "Midfielders" or "Forwards".
+    """
+    if position_filter == "All":
+        return np.ones(len(df), dtype=bool)
+    if position_filter not in POSITION_FILTERS:
+        raise ValueError(f"Invalid position filter: {position_filter}. Valid position filters are: All, {', '.join(POSITION_FILTERS)}.")
+
+    group = POSITION_FILTERS[position_filter]
+    if "position_mask" in df.columns:
+        return (df["position_mask"].to_numpy() & POSITION_BITS[group]) != 0
+
+    return (df["position"] == group).to_numpy()
@@ -0,0 +1,143 @@
+"""
+This module contains functions to index possessions and attribute events to the possession chain they belong to.
+
+StatsBomb numbers the possessions of every match and tags every event with its possession and possession team.
+The possession index is built once per set of events: every possession gets its event row range and its terminal
+shot. Chain metrics (e.g. dribbles that lead to a shot in the same possession) are then a join on
+(match_id, possession) instead of a scan over time.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.dribbles import dribble_columns
+
+
+def create_possession_index(df):
+    """
+    Create an index of all possessions.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        A dataframe with Statsbomb event data for one or more matches, in event order per match.
+
+    Returns
+    -------
+    df_possessions: pd.DataFrame
+        A dataframe with a row per possession: the possession team, the first and last row of its events in df,
+        the number of events and its terminal shot (the last shot of the possession team, shot_row is -1 without shot).
+    """
+    df_events = df[["match_id", "possession", "possession_team_name"]].assign(row=np.arange(len(df)))
+
+    # Event row range of every possession
+    df_possessions = (df_events
+                      .groupby(["match_id", "possession"], sort=False)
+                      .agg(
+                          possession_team_name=("possession_team_name", "first"),
+                          start_row=("row", "min"),
+                          end_row=("row", "max"),
+                          events=("row", "size")
+                      ))
+
+    # Terminal shot of every possession, shots of the defending team don't end the chain
+    shots_mask = ((df["type_name"] == "Shot") & (df["team_name"] == df["possession_team_name"])).to_numpy()
+    df_shots = pd.DataFrame({
+        "match_id": df["match_id"].to_numpy()[shots_mask],
+        "possession": df["possession"].to_numpy()[shots_mask],
+        "shot_row": np.flatnonzero(shots_mask),
+        "shot_xg": df["shot_statsbomb_xg"].to_numpy(dtype=float)[shots_mask],
+        "shot_goal": (df["outcome_name"] == "Goal").to_numpy()[shots_mask],
+    }).drop_duplicates(["match_id", "possession"], keep="last").set_index(["match_id", "possession"])
+
+    # Possessions without shot get shot_row -1
+    df_possessions = df_possessions.join(df_shots)
+    df_possessions["shot_row"] = df_possessions["shot_row"].fillna(-1).astype(int)
+    df_possessions["shot_xg"] = df_possessions["shot_xg"].fillna(0.0)
+    df_possessions["shot_goal"] = df_possessions["shot_goal"] == True
+
+    return df_possessions.reset_index()
+
+
+def get_possession_chains(df, df_possessions, mask):
+    """
+    Get the possession and terminal shot of a selection of events.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The event data the possession index was created from.
+    df_possessions: pd.DataFrame
+        The possession index (see create_possession_index).
+    mask: array-like
+        Boolean mask of the events to get the chains for (e.g. all dribbles).
+
+    Returns
+    -------
+    df_chains: pd.DataFrame
+        A dataframe with the row of every selected event, its possession, whether its team had the possession and
+        whether the possession ends in a shot after the event (with the xG and outcome of that shot).
+    """
+    rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+    df_chains = pd.DataFrame({
+        "row": rows,
+        "match_id": df["match_id"].to_numpy()[rows],
+        "possession": df["possession"].to_numpy()[rows],
+        "team_name": df["team_name"].to_numpy()[rows],
+    })
+
+    # Join every event to its possession
+    df_chains = df_chains.merge(
+        df_possessions[["match_id", "possession", "possession_team_name", "shot_row", "shot_xg", "shot_goal"]],
+        on=["match_id", "possession"],
+        how="left",
+        validate="many_to_one"
+    )
+    df_chains["own_possession"] = (df_chains["team_name"] == df_chains["possession_team_name"]).to_numpy()
+    df_chains["leads_to_shot"] = df_chains["own_possession"] & (df_chains["shot_row"] > df_chains["row"])
+
+    return df_chains
+
+
+def get_possession_dribbles(match_ids, df, df_possessions=None):
+    """
+    Get all dribbles with danger dribbles defined by possession: a completed dribble followed by a shot of the
+    team in the same possession.
+
+    Parameters
+    ----------
+    match_ids: list
+        A list of match ids to get the dribbles for.
+    df: pd.DataFrame
+        A dataframe with all Statsbomb event data for all matches of a given competition and season.
+    df_possessions: pd.DataFrame
+        Optional possession index of df (see create_possession_index), created when not given.
+
+    Returns
+    -------
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles (same columns as get_all_dribbles without the shot gap columns, plus the
+        possession), in the order of match_ids.
+    """
+    df_matches = df[df["match_id"].isin(match_ids)].reset_index(drop=True)
+    if df_possessions is None:
+        df_possessions = create_possession_index(df_matches)
+
+    # Only check first half, second half and extra time but not penalties
+    dribbles_mask = (df_matches["type_name"] == "Dribble") & df_matches["period"].isin([1, 2, 3, 4])
+    df_chains = get_possession_chains(df_matches, df_possessions, dribbles_mask)
+
+    base_columns = [column for column in dribble_columns if column in df_matches.columns]
+    df_dribbles = df_matches.iloc[df_chains["row"]][base_columns + ["possession"]].reset_index(drop=True)
+
+    # Only completed dribbles can be danger dribbles
+    danger_mask = (df_dribbles["outcome_name"] == "Complete").to_numpy() & df_chains["leads_to_shot"].to_numpy()
+    df_dribbles["danger_dribble"] = danger_mask
+    df_dribbles["xg_from_dribble"] = np.where(danger_mask, df_chains["shot_xg"].to_numpy(), 0.0)
+    df_dribbles["dribble_to_goal"] = danger_mask & df_chains["shot_goal"].to_numpy()
+
+    # Order by match_ids like get_all_dribbles
+    match_order = pd.Series(np.arange(len(match_ids)), index=match_ids)
+    df_dribbles = df_dribbles.iloc[np.argsort(match_order[df_dribbles["match_id"]].to_numpy(), kind="stable")]
+
+    return df_dribbles[dribble_columns[:9] + ["possession"]].reset_index(drop=True)
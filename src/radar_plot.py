@@ -1,25 +1,138 @@
 """
 This module contains functions to create radar plots.
+
+A radar plot is drawn from its content: the texts, values, percentiles and intervals on the plot. The image is saved
+under a hash of the content, so filters that select the same cohort (e.g. 270 and 271 minutes when no player played
+270 minutes) share one image. The footnote shows the lowest minutes and dribbles of the cohort instead of the filters.
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-import matplotlib.image as mpimg
-from matplotlib import font_manager
-from mplsoccer import PyPizza
+import hashlib
+import json
+import os
+import time
 from pathlib import Path
 
-from src.data_plots import calculate_radar_plot_data
+import numpy as np
+
+from src.data_plots import RADAR_COLUMNS, calculate_radar_plot_data
+from src.plot_style import BACKGROUND_COLOR, DARK_COLOR, create_figure, plot_style, save_figure
+from src.telemetry import observe, timer
 
 # Get project root directory
 project_root = Path(__file__).parent.parent
 
-def create_radar_path(player_id, position_filter, minutes_played_filter, dribbles_filter):
-    output_path = project_root / 'generated_images' / 'radar_plots' / f'{player_id}_{minutes_played_filter}min_{dribbles_filter}drib_{position_filter}.png'
+# Directory of the rendered plots, set APP_IMAGES_DIR to render somewhere else (e.g. a cold cache for a load test)
+IMAGES_DIR = Path(os.environ.get("APP_IMAGES_DIR", project_root / "generated_images"))
+
+# Plot colors, the background and dark color are shared by all plots (see src/plot_style.py)
+GENERAL_STATS_COLOR = "#DC851F"
+DRIBBLE_STATS_COLOR = "#6D98BA"
+DANGER_DRIBBLE_STATS_COLOR = "#CA2E55"
+
+# Labels and colors of the slices, in the order of RADAR_COLUMNS
+RADAR_PARAMS = [
+    "Goals", "Assists", "Shots", "xG",
+    "Completed Dribbles", "Failed Dribbles", "Attempted Dribbles", "Dribble Success Rate",
+    "Danger Dribbles", "xG From\nDanger Dribbles", "Goals From\nDanger Dribbles"
+]
+RADAR_COLORS = [GENERAL_STATS_COLOR] * 4 + [DRIBBLE_STATS_COLOR] * 4 + [DANGER_DRIBBLE_STATS_COLOR] * 3
+
+# Bump when the drawing of the radar plot changes, so images of the old drawing aren't reused
+RADAR_VERSION = 1
+
+
+def create_radar_path(content):
+    content_hash = hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:20]
+    output_path = IMAGES_DIR / 'radar_plots' / f'{content_hash}.png'
     return str(output_path)
 
 
-def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dribbles_filter):
+def get_reference_texts(position_filter, minutes_played_filter, dribbles_filter, reference=None):
+    """
+    Get the subtitle and footnote of the players the radar percentiles compare with.
+
+    Parameters
+    ----------
+    position_filter, minutes_played_filter, dribbles_filter:
+        The filters of the cohort (see create_radar_plot).
+    reference: dict
+        Optional reference cohort of percentiles against all competitions (see lookup_sketch_percentiles).
+
+    Returns
+    -------
+    subtitle, footnote: str
+        The texts of the radar plot.
+    """
+    dribblers_text = position_filter.lower() if position_filter != "All" else "dribblers"
+    players_text = position_filter.lower() if position_filter != "All" else "players"
+    if reference is None:
+        return (
+            f'Per 90 stats vs other {dribblers_text}* at Euro 2024',
+            f'*: {players_text} with at least {minutes_played_filter} minutes and {dribbles_filter} attempted dribbles',
+        )
+
+    competitions_text = f'{reference["competitions"]} competition{"s" if reference["competitions"] != 1 else ""}'
+    return (
+        f'Per 90 stats vs other {dribblers_text}* in {competitions_text}',
+        f'*: {players_text} with at least {reference["minutes_played_filter"]} minutes and {reference["dribbles_filter"]} attempted dribbles in {competitions_text}',
+    )
+
+
+def get_radar_content(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, df_intervals=None, percentiles=None, reference=None):
+    """
+    Get the content of a radar plot: everything that is drawn.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort (see filter_player_stats).
+    player_id: int
+        The id of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort (see create_radar_plot).
+    df_intervals: pd.DataFrame
+        Optional bootstrap intervals of the cohort (see calculate_bootstrap_intervals).
+    percentiles: list
+        Optional percentiles of the player from the percentile cube (see lookup_percentiles).
+    reference: dict
+        The reference cohort if the percentiles are against all competitions (see lookup_sketch_percentiles).
+
+    Returns
+    -------
+    content: dict
+        The texts, values, percentiles and intervals of the plot, the same for every filter of the same cohort.
+    """
+    player = df.loc[df["player_id"] == player_id].iloc[0]
+    values, percentiles = calculate_radar_plot_data(df, player_id, percentiles)
+
+    # The lowest minutes and dribbles of the cohort select the same players as the filters
+    if reference is None:
+        minutes_played_filter = int(df["playing_time"].min())
+        dribbles_filter = int(df["attempted_dribbles"].min())
+    subtitle, footnote = get_reference_texts(position_filter, minutes_played_filter, dribbles_filter, reference)
+
+    intervals = None
+    if df_intervals is not None:
+        df_player_intervals = df_intervals[df_intervals["player_id"] == player_id].set_index("metric").loc[RADAR_COLUMNS]
+        intervals = {
+            "lower": df_player_intervals["percentile_lower"].round(1).tolist(),
+            "upper": df_player_intervals["percentile_upper"].round(1).tolist(),
+        }
+
+    return {
+        "version": RADAR_VERSION,
+        "player_name": str(player["player_short_name"]),
+        "team_name": str(player["team_name"]),
+        "subtitle": subtitle,
+        "footnote": footnote,
+        "shot_window": int(shot_window),
+        "values": [float(value) for value in values],
+        "percentiles": [int(percentile) for percentile in percentiles],
+        "intervals": intervals,
+    }
+
+
+def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, df_intervals=None, percentiles=None, reference=None):
     """
     Create a radar plot for a player.
 
@@ -35,18 +148,56 @@ def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dri
         The minimum minutes played to be included in the plot.
     dribbles_filter: int
         The minimum number of dribbles to be included in the plot.
+    shot_window: int
+        The shot window in seconds used for the danger dribbles.
+    df_intervals: pd.DataFrame
+        Optional bootstrap intervals of the cohort (see calculate_bootstrap_intervals), drawn as bands on the slices.
+    percentiles: list
+        Optional percentiles of the player from the percentile cube (see lookup_percentiles).
+    reference: dict
+        The reference cohort if the percentiles are against all competitions (see lookup_sketch_percentiles).
 
     Returns
     -------
     fig: matplotlib.figure.Figure
         The radar plot.
-    """ 
-    # Get player and team name
-    team_name = df.loc[df["player_id"] == player_id, "team_name"].values[0]
-    player_name = df.loc[df["player_id"] == player_id, "player_short_name"].values[0]
+    output_path: str
+        The path of the saved image (see create_radar_path).
+    """
+    content = get_radar_content(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals, percentiles, reference)
+
+    return draw_radar_plot(content)
+
+
+def draw_radar_plot(content):
+    """
+    Draw a radar plot from its content and save it.
+
+    The plot is drawn without pyplot (see src/plot_style.py), so it can be drawn from a thread pool.
+
+    Parameters
+    ----------
+    content: dict
+        The content of the plot (see get_radar_content).
+
+    Returns
+    -------
+    fig: matplotlib.figure.Figure
+        The radar plot, not registered with pyplot.
+    output_path: str
+        The path of the saved image (see create_radar_path).
+    """
+    start_time = time.perf_counter()
 
-    # Get player values and percentiles
-    player_values, player_percentiles = calculate_radar_plot_data(df, player_id)
+    # Import plotting libraries on first use, so the paths can be created without loading matplotlib
+    from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+    import matplotlib.image as mpimg
+    from mplsoccer import PyPizza
+
+    # Get player and team name, values and percentiles
+    team_name = content["team_name"]
+    player_name = content["player_name"]
+    player_values, player_percentiles = content["values"], content["percentiles"]
 
     # Plot dimensions
     title_height_ratio = 0.15
@@ -54,11 +205,8 @@ def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dri
     figsize = (12, 12)
 
     # Plot colors
-    background_color = "#f2f4ee"
-    dark_color = "#053225"
-    general_stats_color = "#DC851F"
-    dribble_stats_color = "#6D98BA"
-    danger_dribble_stats_color = "#CA2E55"
+    background_color = BACKGROUND_COLOR
+    dark_color = DARK_COLOR
 
     # Text styles
     h1_size = 18
@@ -68,120 +216,107 @@ def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dri
     label_size = 8
     alpha = 0.4
 
-    # Load font
-    font_manager.fontManager.addfont('assets/Futura.ttc')
-    prop = font_manager.FontProperties(fname='assets/Futura.ttc')
-
-    # Apply styling
-    plt.rcParams['font.family'] = prop.get_name()
-    plt.rcParams.update({
-        'text.color': dark_color,
-        'axes.labelcolor': dark_color,
-        'axes.edgecolor': dark_color,
-        'xtick.color': dark_color,
-        'ytick.color': dark_color,
-        'grid.color': dark_color,
-    })
-
-    # Create figure
-    fig = plt.figure(figsize=figsize)
-    gs = fig.add_gridspec(3, 1, height_ratios=[title_height_ratio, 1-title_height_ratio-legend_height_ratio, legend_height_ratio])
-    
-    # Set background
-    fig.set_facecolor(background_color)
-    
-    # Title axis
-    heading_ax = fig.add_subplot(gs[0])
-    heading_ax.axis('off')
-    
-    # Main plot axis
-    main_ax = fig.add_subplot(gs[1], polar=True)
-    main_ax.set_facecolor(background_color)
+    # Create the figure and its artists in the style of the plots, the figure isn't registered with pyplot
+    with plot_style():
+        fig = create_figure(figsize)
+        gs = fig.add_gridspec(3, 1, height_ratios=[title_height_ratio, 1-title_height_ratio-legend_height_ratio, legend_height_ratio])
 
-    # Legend axis
-    legend_ax = fig.add_subplot(gs[2])
-    legend_ax.axis('off')
+        # Set background
+        fig.set_facecolor(background_color)
 
-    # Add heading
-    dribblers_text = position_filter.lower() if position_filter != "All" else "dribblers"
-    heading_ax.text(0.01, 0.8, f"{player_name} - {team_name}", fontsize=h1_size, ha='left', va='center')
-    heading_ax.text(0.01, 0.55, f'Per 90 stats vs other {dribblers_text}* at Euro 2024', fontsize=p_size, ha='left', va='center', alpha=alpha)
-
-    # Add Euros 2024 logo
-    logo = mpimg.imread(project_root / 'assets' / 'euro_2024_logo.png')
-    imagebox = OffsetImage(logo, zoom=0.2)
-    ab = AnnotationBbox(imagebox, (0.98, 0.7), xycoords='axes fraction', box_alignment=(1, 0.5), frameon=False)
-    heading_ax.add_artist(ab)
-
-    # MAIN
-    params = [
-        "Goals", "Assists", "Shots", "xG",
-        "Completed Dribbles", "Failed Dribbles", "Attempted Dribbles", "Dribble Success Rate",
-        "Danger Dribbles", "xG From\nDanger Dribbles", "Goals From\nDanger Dribbles"
-    ]
-
-    slice_colors = [general_stats_color] * 4 + [dribble_stats_color] * 4 + [danger_dribble_stats_color] * 3
-    params_colors = [general_stats_color] * 4 + [dribble_stats_color] * 4 + [danger_dribble_stats_color] * 3
-
-    # Init PyPizza class
-    baker = PyPizza(
-        params=params,                          # List of parameters
-        background_color=background_color,      # Background color
-        straight_line_color=background_color,   # Lines between slices
-        straight_line_lw=1,                     # Linewidth for straight lines
-        last_circle_color=background_color,     # Color for last circle
-        last_circle_lw=2,                       # Linewidth of last circle
-        other_circle_lw=0,                      # Linewidth for other circles
-        inner_circle_size=5,                    # Size of inner circle
-    )
+        # Title axis
+        heading_ax = fig.add_subplot(gs[0])
+        heading_ax.axis('off')
+
+        # Main plot axis
+        main_ax = fig.add_subplot(gs[1], polar=True)
+        main_ax.set_facecolor(background_color)
+
+        # Legend axis
+        legend_ax = fig.add_subplot(gs[2])
+        legend_ax.axis('off')
+
+        # Add heading
+        heading_ax.text(0.01, 0.8, f"{player_name} - {team_name}", fontsize=h1_size, ha='left', va='center')
+        heading_ax.text(0.01, 0.55, content["subtitle"], fontsize=p_size, ha='left', va='center', alpha=alpha)
 
-    # Plot pizza
-    baker.make_pizza(
-        player_percentiles,                     # List of values
-        ax=main_ax,
-        param_location=115,
-        color_blank_space="same",               # Color to fill blank space of slices
-        blank_alpha=alpha,                      # Alpha for blank-space colors
-        slice_colors=slice_colors,              # Color for individual slices
-        value_bck_colors=slice_colors,          # Background color for the values box
-        kwargs_params=dict(                     # Labels of slices on the outside of the pizza                 
-            fontsize=p_size,                    
-            va="center",                        
-        ),
-        kwargs_slices=dict(                     # Edges of slices
-            edgecolor=background_color, 
-            zorder=2, 
-            linewidth=1
-        ),
-        kwargs_values=dict(                     # Values box
-            color=background_color, 
-            fontsize=p_size, 
-            zorder=3,
-            bbox=dict(
+        # Add Euros 2024 logo
+        logo = mpimg.imread(project_root / 'assets' / 'euro_2024_logo.png')
+        imagebox = OffsetImage(logo, zoom=0.2)
+        ab = AnnotationBbox(imagebox, (0.98, 0.7), xycoords='axes fraction', box_alignment=(1, 0.5), frameon=False)
+        heading_ax.add_artist(ab)
+
+        # MAIN
+        params = RADAR_PARAMS
+
+        slice_colors = RADAR_COLORS
+        params_colors = RADAR_COLORS
+
+        # Init PyPizza class
+        baker = PyPizza(
+            params=params,                          # List of parameters
+            background_color=background_color,      # Background color
+            straight_line_color=background_color,   # Lines between slices
+            straight_line_lw=1,                     # Linewidth for straight lines
+            last_circle_color=background_color,     # Color for last circle
+            last_circle_lw=2,                       # Linewidth of last circle
+            other_circle_lw=0,                      # Linewidth for other circles
+            inner_circle_size=5,                    # Size of inner circle
+        )
+
+        # Plot pizza
+        baker.make_pizza(
+            player_percentiles,                     # List of values
+            ax=main_ax,
+            param_location=115,
+            color_blank_space="same",               # Color to fill blank space of slices
+            blank_alpha=alpha,                      # Alpha for blank-space colors
+            slice_colors=slice_colors,              # Color for individual slices
+            value_bck_colors=slice_colors,          # Background color for the values box
+            kwargs_params=dict(                     # Labels of slices on the outside of the pizza                 
+                fontsize=p_size,                    
+                va="center",                        
+            ),
+            kwargs_slices=dict(                     # Edges of slices
                 edgecolor=background_color, 
-                facecolor=background_color,
-                boxstyle="round,pad=0.4", 
-                lw=1
+                zorder=2, 
+                linewidth=1
+            ),
+            kwargs_values=dict(                     # Values box
+                color=background_color, 
+                fontsize=p_size, 
+                zorder=3,
+                bbox=dict(
+                    edgecolor=background_color, 
+                    facecolor=background_color,
+                    boxstyle="round,pad=0.4", 
+                    lw=1
+                )
             )
         )
-    )
 
-    # Replace slice text with actual values (normally shows percentiles)
-    texts = baker.get_value_texts()
-    for i, text in enumerate(texts):
-        text.set_text(str(player_values[i]))
+        # Replace slice text with actual values (normally shows percentiles)
+        texts = baker.get_value_texts()
+        for i, text in enumerate(texts):
+            text.set_text(str(player_values[i]))
 
-    # Set param label colors individually
-    param_texts = baker.get_param_texts()
-    for i, text in enumerate(param_texts):
-        text.set_color(params_colors[i])
+        # Set param label colors individually
+        param_texts = baker.get_param_texts()
+        for i, text in enumerate(param_texts):
+            text.set_color(params_colors[i])
 
+        # Draw the percentile intervals as bands next to the value boxes (a quarter slice from the center)
+        if content["intervals"] is not None:
+            band_theta = baker.get_theta() + np.pi / (2 * len(params))
+            main_ax.vlines(band_theta, content["intervals"]["lower"], content["intervals"]["upper"], color=dark_color, linewidth=2, alpha=0.6, zorder=2.5)
 
-    # LEGEND
-    players_text = position_filter.lower() if position_filter != "All" else "players"
-    legend_ax.text(0.01, 0.25, f'*: {players_text} with at least {minutes_played_filter} minutes and {dribbles_filter} attempted dribbles', fontsize=label_size, ha='left', va='center', alpha=alpha)
-    legend_ax.text(0.01, 0.01, 'Danger dribbles: dribbles that end in a shot within 15 seconds', fontsize=label_size, ha='left', va='center', alpha=alpha)
-    legend_ax.text(0.99, 0.01, 'Data provided by StatsBomb', fontsize=label_size, ha='right', va='center', alpha=alpha)
+
+        # LEGEND
+        legend_ax.text(0.01, 0.25, content["footnote"], fontsize=label_size, ha='left', va='center', alpha=alpha)
+        legend_ax.text(0.01, 0.01, f'Danger dribbles: dribbles that end in a shot within {content["shot_window"]} seconds', fontsize=label_size, ha='left', va='center', alpha=alpha)
+        legend_ax.text(0.99, 0.01, 'Data provided by StatsBomb', fontsize=label_size, ha='right', va='center', alpha=alpha)
+        if content["intervals"] is not None:
+            legend_ax.text(0.99, 0.25, 'Lines: 90% interval of the percentile when matches are resampled', fontsize=label_size, ha='right', va='center', alpha=alpha)
 
     # Save plot
     default_kwargs = {
@@ -192,7 +327,9 @@ def create_radar_plot(df, player_id, position_filter, minutes_played_filter, dri
     }
     
     # Generate output path, save figure and return figure and path
-    output_path = create_radar_path(player_id, position_filter, minutes_played_filter, dribbles_filter)
-    fig.savefig(output_path, **default_kwargs)
+    output_path = create_radar_path(content)
+    with timer("plot_save_seconds", {"plot": "radar"}):
+        save_figure(fig, output_path, **default_kwargs)
+    observe("plot_render_seconds", time.perf_counter() - start_time, {"plot": "radar"})
     
     return fig, output_path
\ No newline at end of file
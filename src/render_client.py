@@ -0,0 +1,342 @@
+"""
+This module contains the client side of the render worker protocol.
+
+The app sends small requests (plot type, player id, filters and data version) to the render worker
+(see src/render_worker.py) and gets the image bytes back. This module only uses the standard library,
+so the app process never imports matplotlib.
+
+Requests and responses are dicts:
+- {"type": "health"} -> {"status": "ok", "data_version": str, "pending": int, "max_pending": int}
+- {"type": "render", "plot": "radar" or "pitch", "player_id": int, "filters": dict, "data_version": str}
+  -> {"status": "ok", "image": bytes}
+- {"type": "data", "plot": "radar" or "pitch", "player_id": int, "filters": dict, "data_version": str, "format": "json" or "arrow"}
+  -> {"status": "ok", "data": bytes} (the plotted data for a chart in the browser, see src/plot_data.py)
+- {"type": "prefetch", "player_ids": list, "filters": dict, "data_version": str} -> {"status": "ok", "queued": int}
+Failed requests get {"status": "error", "busy" or "stale", "error": str}. Stale requests have another data version
+than the worker (the data changed since the app read it), the app has to read the data again.
+
+Requests are pickled, so only processes with the key of the worker may connect: the app generates a random key
+every time it starts the worker and passes it in the environment of the worker, which refuses to start without one.
+"""
+
+import hashlib
+import os
+import secrets
+import subprocess
+import sys
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from pathlib import Path
+
+# Get project root directory
+project_root = Path(__file__).parent.parent
+
+# Data files the plots are rendered from, the player match stats (used for bootstrap intervals) and the form
+# series (used for the form chart) are optional
+# Set APP_DATA_DIR to use the data files of another directory (e.g. synthetic data for a load test)
+DATA_DIR = Path(os.environ.get("APP_DATA_DIR", project_root / "data"))
+DATA_PATHS = [
+    DATA_DIR / "player_stats.parquet",
+    DATA_DIR / "dribbles.parquet",
+    DATA_DIR / "player_match_stats.parquet",
+    DATA_DIR / "player_form.parquet",
+]
+
+# Percentile sketches of every competition (see src/percentile_sketch.py), used for percentiles against all competitions
+SKETCH_DIR = DATA_DIR / "percentile_sketches"
+
+# Prebuilt bundle of the data files (see src/bundle.py), the app and the worker read it instead when APP_BUNDLE is set
+BUNDLE_PATH = os.environ.get("APP_BUNDLE")
+
+# Local address of the render worker
+WORKER_ADDRESS = ("localhost", int(os.environ.get("RENDER_WORKER_PORT", 6123)))
+
+# Environment variable with the key of the render worker, set by start_render_worker
+AUTHKEY_VARIABLE = "RENDER_WORKER_AUTHKEY"
+
+# Busy responses are retried with a growing wait (0.25, 0.5, 1 and 2 seconds), renders of other sessions finish in the meantime
+BUSY_RETRIES = 4
+BUSY_RETRY_SECONDS = 0.25
+
+# Workers started by this process, the stdin of a worker stays open until this process exits
+_workers = []
+
+
+def get_worker_authkey():
+    """
+    Get the key of the render worker.
+
+    Returns
+    -------
+    bytes
+        The key, None if it isn't set.
+    """
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+
+    return authkey.encode() if authkey else None
+
+
+def get_data_version(paths=None):
+    """
+    Get the version of the data files, based on their inode, size and modification time.
+
+    Parameters
+    ----------
+    paths: list
+        The data files, by default the bundle if APP_BUNDLE is set and the data files otherwise, and the
+        percentile sketches.
+
+    Returns
+    -------
+    str
+        A short hash that changes when any of the files changes or is replaced (or an optional file is added or removed).
+    """
+    if paths is None:
+        paths = ([BUNDLE_PATH] if BUNDLE_PATH else DATA_PATHS) + sorted(SKETCH_DIR.glob("*.parquet"))
+
+    file_hash = hashlib.sha1()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        file_hash.update(f"{Path(path).name}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return file_hash.hexdigest()[:12]
+
+
+def send_request(request, timeout=60):
+    """
+    Send a request to the render worker and wait for the response.
+
+    Parameters
+    ----------
+    request: dict
+        The request (see the module docstring).
+    timeout: float
+        The maximum number of seconds to wait for the response.
+
+    Returns
+    -------
+    response: dict
+        The response of the worker.
+
+    Raises
+    ------
+    ConnectionError
+        If the worker isn't running or the key of the worker isn't set.
+    TimeoutError
+        If the worker didn't respond in time.
+    """
+    authkey = get_worker_authkey()
+    if authkey is None:
+        raise ConnectionError(f"{AUTHKEY_VARIABLE} isn't set, start the render worker with start_render_worker.")
+
+    with Client(WORKER_ADDRESS, authkey=authkey) as connection:
+        connection.send(request)
+        if not connection.poll(timeout):
+            raise TimeoutError(f"Render worker didn't respond within {timeout} seconds.")
+        return connection.recv()
+
+
+def send_retried_request(request, timeout=60):
+    """
+    Send a request to the render worker, retrying busy responses.
+
+    Parameters
+    ----------
+    request: dict
+        The request (see the module docstring).
+    timeout: float
+        The maximum number of seconds to wait for a response.
+
+    Returns
+    -------
+    response: dict
+        The response of the worker, busy if the worker was still busy after the last retry.
+    """
+    response = send_request(request, timeout=timeout)
+    for attempt in range(BUSY_RETRIES):
+        if response["status"] != "busy":
+            break
+        time.sleep(BUSY_RETRY_SECONDS * 2 ** attempt)
+        response = send_request(request, timeout=timeout)
+
+    return response
+
+
+def check_health():
+    """
+    Check if the render worker is running.
+
+    Returns
+    -------
+    response: dict
+        The health response of the worker, None if the worker isn't running (or has another key).
+    """
+    try:
+        return send_request({"type": "health"}, timeout=5)
+    except (ConnectionError, TimeoutError, EOFError, AuthenticationError):
+        return None
+
+
+def start_render_worker(timeout=30):
+    """
+    Start the render worker in a separate process if it isn't running yet.
+
+    The worker gets a new random key and exits when this process exits (when its stdin is closed).
+
+    Parameters
+    ----------
+    timeout: float
+        The maximum number of seconds to wait until the worker is healthy.
+
+    Returns
+    -------
+    response: dict
+        The health response of the worker.
+
+    Raises
+    ------
+    RuntimeError
+        If the worker stopped, e.g. because a worker of another process uses the port.
+    TimeoutError
+        If the worker isn't healthy in time.
+    """
+    health = check_health()
+    if health is not None:
+        return health
+
+    # Only this process and the worker know the key
+    os.environ[AUTHKEY_VARIABLE] = secrets.token_hex(32)
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "src.render_worker", "--exit-with-parent"], cwd=project_root, env=dict(os.environ), stdin=subprocess.PIPE
+    )
+
+    # Wait until the worker accepts requests
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < timeout:
+        health = check_health()
+        if health is not None:
+            # Keep the pipe open until this process exits
+            _workers.append(worker)
+            return health
+        if worker.poll() is not None:
+            raise RuntimeError(f"Render worker stopped with exit code {worker.returncode}, is another worker using port {WORKER_ADDRESS[1]}?")
+        time.sleep(0.2)
+
+    raise TimeoutError(f"Render worker didn't start within {timeout} seconds.")
+
+
+def request_plot(plot, player_id, filters, data_version, timeout=60):
+    """
+    Request a radar or pitch plot from the render worker.
+
+    Parameters
+    ----------
+    plot: str
+        "radar" or "pitch".
+    player_id: int
+        The id of the player.
+    filters: dict
+        The position_filter, minutes_played_filter, dribbles_filter and shot_window of the app, and optionally
+        percentiles: "cohort" (default) or "competitions" (against the percentile sketches of all competitions).
+    data_version: str
+        The version of the data the app uses (see get_data_version).
+    timeout: float
+        The maximum number of seconds to wait for the plot.
+
+    Returns
+    -------
+    bytes
+        The PNG image.
+
+    Raises
+    ------
+    RuntimeError
+        If the worker couldn't render the plot (or was still busy after the retries, see send_retried_request).
+    """
+    response = send_retried_request({
+        "type": "render",
+        "plot": plot,
+        "player_id": int(player_id),
+        "filters": filters,
+        "data_version": data_version,
+    }, timeout=timeout)
+
+    if response["status"] != "ok":
+        raise RuntimeError(f"Render worker couldn't render the {plot} plot: {response['error']}")
+
+    return response["image"]
+
+
+def request_prefetch(player_ids, filters, data_version):
+    """
+    Ask the render worker to prefetch the plots of some players in the background.
+
+    Parameters
+    ----------
+    player_ids: list
+        The ids of the players, most likely selection first.
+    filters: dict
+        The position_filter, minutes_played_filter, dribbles_filter and shot_window of the app, and optionally
+        percentiles: "cohort" (default) or "competitions" (against the percentile sketches of all competitions).
+    data_version: str
+        The version of the data the app uses (see get_data_version).
+
+    Returns
+    -------
+    response: dict
+        The response of the worker.
+    """
+    return send_request({
+        "type": "prefetch",
+        "player_ids": [int(player_id) for player_id in player_ids],
+        "filters": filters,
+        "data_version": data_version,
+    }, timeout=5)
+
+
+def request_plot_data(plot, player_id, filters, data_version, data_format="json", timeout=60):
+    """
+    Request the data of a radar or pitch plot from the render worker, to draw it in the browser.
+
+    Parameters
+    ----------
+    plot: str
+        "radar" or "pitch".
+    player_id: int
+        The id of the player.
+    filters: dict
+        The position_filter, minutes_played_filter, dribbles_filter and shot_window of the app, and optionally
+        percentiles: "cohort" (default) or "competitions" (against the percentile sketches of all competitions).
+    data_version: str
+        The version of the data the app uses (see get_data_version).
+    data_format: str
+        "json" or "arrow" (see encode_plot_data).
+    timeout: float
+        The maximum number of seconds to wait for the data.
+
+    Returns
+    -------
+    bytes
+        The encoded plot data.
+
+    Raises
+    ------
+    RuntimeError
+        If the worker couldn't get the plot data.
+    """
+    response = send_retried_request({
+        "type": "data",
+        "plot": plot,
+        "player_id": int(player_id),
+        "filters": filters,
+        "data_version": data_version,
+        "format": data_format,
+    }, timeout=timeout)
+
+    if response["status"] != "ok":
+        raise RuntimeError(f"Render worker couldn't get the {plot} plot data: {response['error']}")
+
+    return response["data"]
@@ -0,0 +1,395 @@
+"""
+This module contains functions to render radar and pitch plots in the background.
+
+Plots of the selected player are rendered concurrently in an interactive pool. Plots of other players in the table
+are prefetched in a separate low priority pool, so a click never waits behind a prefetch. Prefetches that are not
+needed anymore (e.g. because the filters changed) are cancelled before they start.
+Every render process writes its metrics (render times, see src/telemetry.py) after a render, to a file per pool slot
+(e.g. render-interactive-0.prom).
+Radar and pitch plots are saved under a hash of their content (see src/radar_plot.py and src/pitch_plot.py), the
+aliases map the filters of a request to the radar image, so filters that select the same cohort render and store the
+plot once.
+"""
+
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from src.telemetry import METRICS_DIR, set_process_name, write_metrics
+
+# Rendered images kept on disk, the least recently requested images are removed beyond this (a plot is about 300 KB)
+MAX_IMAGES = 2000
+
+# Filters of earlier requests kept as aliases of their radar image
+MAX_ALIASES = 20000
+
+
+def render_radar(content):
+    """
+    Render a radar plot if it doesn't exist yet.
+
+    Parameters
+    ----------
+    content: dict
+        The content of the plot (see get_radar_content).
+
+    Returns
+    -------
+    path: str
+        The path of the radar plot.
+    """
+    # Plot modules are imported in the worker, so matplotlib is never imported by the caller
+    from src.radar_plot import create_radar_path, draw_radar_plot
+
+    # The figure isn't registered with pyplot, it's freed when it goes out of scope
+    path = create_radar_path(content)
+    if not os.path.exists(path):
+        _, path = draw_radar_plot(content)
+        write_metrics()
+
+    return path
+
+
+def render_pitch(df_dribbles, player_id, player_name, team_name, shot_window=15):
+    """
+    Render a pitch plot if it doesn't exist yet.
+
+    Parameters
+    ----------
+    df_dribbles: pd.DataFrame
+        The dataframe with the dribbles (only the dribbles of the player are needed).
+    player_id: int
+        The id of the player.
+    player_name, team_name, shot_window:
+        See create_pitch_plot.
+
+    Returns
+    -------
+    path: str
+        The path of the pitch plot.
+    """
+    from src.pitch_plot import create_pitch_path, create_pitch_plot
+
+    path = create_pitch_path(df_dribbles, player_id, player_name, team_name, shot_window)
+    if not os.path.exists(path):
+        _, path = create_pitch_plot(df_dribbles, player_id, player_name, team_name, shot_window)
+        write_metrics()
+
+    return path
+
+
+def _init_render_process(pool, slots, workers):
+    # Every render process writes its own metrics file, named after its slot in the pool so the files of stopped
+    # processes are replaced instead of counted forever
+    with slots.get_lock():
+        slot = slots.value % workers
+        slots.value += 1
+    set_process_name(f"render-{pool}-{slot}")
+
+
+def create_render_executor(interactive_workers=2, prefetch_workers=1, start_method="spawn"):
+    """
+    Create the process pools and bookkeeping for background rendering.
+
+    Parameters
+    ----------
+    interactive_workers: int
+        The number of processes for plots of the selected player (2 renders radar and pitch concurrently).
+    prefetch_workers: int
+        The number of processes for prefetching.
+    start_method: str
+        The multiprocessing start method. Use "fork" when the caller is a script that can't be re-imported by spawned workers.
+
+    Returns
+    -------
+    executor: dict
+        The interactive and prefetch pools, the running renders per plot path, the radar image of the filters of
+        earlier requests and the requested images, least recently requested first.
+    """
+    context = multiprocessing.get_context(start_method)
+
+    # Metrics files of the render processes of an earlier executor (e.g. of a restarted worker with more processes)
+    for path in METRICS_DIR.glob("render-*.prom"):
+        path.unlink(missing_ok=True)
+
+    return {
+        "interactive": ProcessPoolExecutor(
+            max_workers=interactive_workers, mp_context=context, initializer=_init_render_process,
+            initargs=("interactive", context.Value("i", 0), interactive_workers)
+        ),
+        "prefetch": ProcessPoolExecutor(
+            max_workers=prefetch_workers, mp_context=context, initializer=_init_render_process,
+            initargs=("prefetch", context.Value("i", 0), prefetch_workers)
+        ),
+        "renders": {},
+        "prefetches": {},
+        "aliases": OrderedDict(),
+        "images": OrderedDict(),
+    }
+
+
+def close_render_executor(executor):
+    """
+    Stop the render processes, renders that haven't started yet are cancelled.
+
+    Parameters
+    ----------
+    executor: dict
+        The render executor (see create_render_executor).
+    """
+    for pool in ("interactive", "prefetch"):
+        executor[pool].shutdown(cancel_futures=True)
+
+
+def _use_image(executor, path):
+    # Remove the least recently requested images beyond MAX_IMAGES from disk, unless they are still rendering
+    images = executor["images"]
+    images[path] = None
+    images.move_to_end(path)
+    for old_path in list(images)[:max(len(images) - MAX_IMAGES, 0)]:
+        future = executor["renders"].get(old_path)
+        if future is None or future.done():
+            images.pop(old_path)
+            executor["renders"].pop(old_path, None)
+            executor["prefetches"].pop(old_path, None)
+            Path(old_path).unlink(missing_ok=True)
+
+
+def _submit(executor, pool, path, function, *args):
+    # Reuse a render of the same plot that is still pending or running
+    future = executor["renders"].get(path)
+    if future is not None and not future.cancelled() and (not future.done() or future.exception() is None):
+        return future
+
+    future = executor[pool].submit(function, *args)
+    executor["renders"][path] = future
+    if pool == "prefetch":
+        executor["prefetches"][path] = future
+
+    return future
+
+
+def lookup_radar_percentiles(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, percentile_cube=None, percentile_sketches=None):
+    """
+    Look up the radar percentiles of a player in the percentile sketches or the percentile cube.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort.
+    player_id: int
+        The id of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort.
+    percentile_cube: dict
+        Optional percentile cube (see build_percentile_cube), for percentiles within the cohort.
+    percentile_sketches: dict
+        Optional merged percentile sketches (see read_percentile_sketches), for percentiles against all competitions.
+
+    Returns
+    -------
+    percentiles: list
+        The percentiles, None if they have to be calculated from the cohort.
+    reference: dict
+        The reference cohort of percentiles against all competitions, None for percentiles within the cohort.
+    """
+    # The sketches have no other shot windows, those percentiles are within the cohort
+    if percentile_sketches is not None:
+        from src.percentile_sketch import lookup_sketch_percentiles
+        result = lookup_sketch_percentiles(percentile_sketches, df.loc[df["player_id"] == player_id].iloc[0], position_filter, minutes_played_filter, dribbles_filter, shot_window)
+        if result is not None:
+            return result
+
+    if percentile_cube is not None:
+        from src.percentile_cube import lookup_percentiles
+        return lookup_percentiles(percentile_cube, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window), None
+
+    return None, None
+
+
+def get_radar_alias(executor, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, competitions=False):
+    """
+    Get the path of the radar plot of filters that were requested before.
+
+    Parameters
+    ----------
+    executor: dict
+        The render executor (see create_render_executor).
+    player_id: int
+        The id of the player.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort.
+    competitions: bool
+        Whether the percentiles are against all competitions.
+
+    Returns
+    -------
+    path: str
+        The path of the radar plot (which may not be rendered yet), None if the filters weren't requested before.
+    """
+    key = (int(player_id), position_filter, minutes_played_filter, dribbles_filter, shot_window, competitions)
+    path = executor["aliases"].get(key)
+    if path is not None:
+        executor["aliases"].move_to_end(key)
+        _use_image(executor, path)
+
+    return path
+
+
+def _radar_job(executor, df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals=None, percentile_cube=None, percentile_sketches=None):
+    from src.radar_plot import create_radar_path, get_radar_content
+    # Send the looked up percentiles instead of the cube, the render process then doesn't rank the cohort
+    percentiles, reference = lookup_radar_percentiles(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window, percentile_cube, percentile_sketches)
+    # The intervals are ranks within the cohort, they don't apply to percentiles against all competitions
+    if reference is not None:
+        df_intervals = None
+    # The render process only gets the content, filters of the same cohort get the same path
+    content = get_radar_content(df, player_id, position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals, percentiles, reference)
+    path = create_radar_path(content)
+    key = (int(player_id), position_filter, minutes_played_filter, dribbles_filter, shot_window, percentile_sketches is not None)
+    executor["aliases"][key] = path
+    executor["aliases"].move_to_end(key)
+    if len(executor["aliases"]) > MAX_ALIASES:
+        executor["aliases"].popitem(last=False)
+    _use_image(executor, path)
+    return path, (content,)
+
+
+def _pitch_job(executor, df_dribbles, player_id, player_name, team_name, shot_window):
+    from src.pitch_plot import create_pitch_path
+    df_player_dribbles = df_dribbles[df_dribbles["player_id"] == player_id]
+    path = create_pitch_path(df_player_dribbles, player_id, player_name, team_name, shot_window)
+    _use_image(executor, path)
+    return path, (df_player_dribbles, player_id, player_name, team_name, shot_window)
+
+
+def render_player(executor, df, df_dribbles, player, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, df_intervals=None, percentile_cube=None, percentile_sketches=None):
+    """
+    Render the radar and pitch plot of the selected player concurrently.
+
+    Pending prefetches of the same plots are cancelled and rendered in the interactive pool instead.
+
+    Parameters
+    ----------
+    executor: dict
+        The render executor (see create_render_executor).
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort.
+    df_dribbles: pd.DataFrame
+        The dataframe with all dribbles.
+    player: pd.Series
+        The row of the player in df.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort.
+    df_intervals: pd.DataFrame
+        Optional bootstrap intervals of the cohort, drawn on the radar plot.
+    percentile_cube: dict
+        Optional percentile cube (see build_percentile_cube) to look up the percentiles of the radar plot.
+    percentile_sketches: dict
+        Optional merged percentile sketches (see read_percentile_sketches) for percentiles against all competitions,
+        used instead of the cube.
+
+    Returns
+    -------
+    radar_future, pitch_future: concurrent.futures.Future
+        Futures that resolve to the paths of the radar and pitch plot.
+    """
+    radar_path, radar_args = _radar_job(executor, df, player["player_id"], position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals, percentile_cube, percentile_sketches)
+    pitch_path, pitch_args = _pitch_job(executor, df_dribbles, player["player_id"], player["player_short_name"], player["team_name"], shot_window)
+
+    futures = []
+    for path, function, args in [(radar_path, render_radar, radar_args), (pitch_path, render_pitch, pitch_args)]:
+        # The click wins: move a prefetch that hasn't started yet to the interactive pool
+        prefetch = executor["prefetches"].pop(path, None)
+        if prefetch is not None and prefetch.cancel():
+            executor["renders"].pop(path, None)
+
+        futures.append(_submit(executor, "interactive", path, function, *args))
+
+    return futures[0], futures[1]
+
+
+def prefetch_players(executor, df, df_dribbles, position_filter, minutes_played_filter, dribbles_filter, shot_window=15, top_n=5, player_ids=None, df_intervals=None, percentile_cube=None, percentile_sketches=None):
+    """
+    Prefetch the plots of the top rows of the table (or of specific players) in the background.
+
+    Prefetches for plots that are not in the new top rows are cancelled if they haven't started yet.
+
+    Parameters
+    ----------
+    executor: dict
+        The render executor (see create_render_executor).
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort, in table order.
+    df_dribbles: pd.DataFrame
+        The dataframe with all dribbles.
+    position_filter, minutes_played_filter, dribbles_filter, shot_window:
+        The filters of the cohort.
+    top_n: int
+        The number of rows to prefetch.
+    player_ids: list
+        The players to prefetch instead of the top rows, most likely selection first.
+    df_intervals: pd.DataFrame
+        Optional bootstrap intervals of the cohort, drawn on the radar plots.
+    percentile_cube: dict
+        Optional percentile cube (see build_percentile_cube) to look up the percentiles of the radar plots.
+    percentile_sketches: dict
+        Optional merged percentile sketches (see read_percentile_sketches) for percentiles against all competitions,
+        used instead of the cube.
+    """
+    if player_ids is None:
+        df_prefetch = df.head(top_n)
+    else:
+        df_prefetch = df.set_index("player_id").loc[[player_id for player_id in player_ids if player_id in df["player_id"].values]].reset_index()
+
+    jobs = {}
+    for _, player in df_prefetch.iterrows():
+        path, args = _radar_job(executor, df, player["player_id"], position_filter, minutes_played_filter, dribbles_filter, shot_window, df_intervals, percentile_cube, percentile_sketches)
+        jobs[path] = (render_radar, args)
+        path, args = _pitch_job(executor, df_dribbles, player["player_id"], player["player_short_name"], player["team_name"], shot_window)
+        jobs[path] = (render_pitch, args)
+
+    # Cancel stale prefetches and forget finished ones
+    for path, future in list(executor["prefetches"].items()):
+        if future.done() or (path not in jobs and future.cancel()):
+            executor["prefetches"].pop(path)
+            if executor["renders"].get(path) is future and future.cancelled():
+                executor["renders"].pop(path)
+
+    # Queue prefetches for plots that don't exist yet, in table order
+    for path, (function, args) in jobs.items():
+        if not os.path.exists(path):
+            _submit(executor, "prefetch", path, function, *args)
+
+
+def clear_renders(executor):
+    """
+    Forget the aliases and finished renders, so the plots are rendered again (e.g. after the data changed).
+
+    Radar and pitch plots are saved under a hash of their content, so the requested plots are kept: plots whose content
+    changed get a new path and the others are reused, the least recently requested are removed beyond MAX_IMAGES.
+    Images on disk that weren't requested from this executor (e.g. of an earlier run of the worker) are removed.
+    Renders that are still running are kept, they write to the path of their own content, so they never replace a
+    plot of the new data.
+
+    Parameters
+    ----------
+    executor: dict
+        The render executor (see create_render_executor).
+    """
+    from src.pitch_plot import IMAGES_DIR
+
+    # Forget the aliases and finished renders, the filters of a request may point to other content now
+    executor["aliases"].clear()
+    for path, future in list(executor["renders"].items()):
+        if future.done():
+            executor["renders"].pop(path)
+            executor["prefetches"].pop(path, None)
+
+    # Remove the images of earlier runs, the images of this run are removed least recently requested first
+    for plots_dir in ("radar_plots", "pitch_plots"):
+        for path in (IMAGES_DIR / plots_dir).glob("*.png"):
+            if str(path) not in executor["images"]:
+                path.unlink(missing_ok=True)
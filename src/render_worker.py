@@ -0,0 +1,395 @@
+"""
+This module contains the render worker: a separate local process that renders radar and pitch plots for the app.
+
+Start it with `python -m src.render_worker` and a random key in RENDER_WORKER_AUTHKEY (the app starts it
+automatically with a new key, see start_render_worker). It loads the data files itself,
+so requests only contain the player id, filters and data version (see src/render_client.py for the protocol).
+Renders run in the process pools of src/render_executor.py. At most max_pending renders can be queued or running;
+requests beyond that get a busy response (prefetches only count for other prefetches). Data requests return the plotted data instead of an image
+(see src/plot_data.py). They don't render, so they skip the pools and are never busy.
+Radar percentiles are looked up in a percentile cube per shot window (see src/percentile_cube.py), built when the
+data is loaded (15 seconds) or when a shot window is first requested. Requests with "percentiles": "competitions"
+rank the player against all competitions in the merged percentile sketches instead (see src/percentile_sketch.py).
+The data of the last other shot window and the cohorts of the most recently used filters are cached (see MAX_COHORTS).
+With APP_BUNDLE set, the data and the cube of 15 seconds are mapped from the bundle (see src/bundle.py) and image
+requests of the default filters get the bundle's thumbnail while the plot renders.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import Listener
+
+from src.bootstrap import calculate_bootstrap_intervals
+from src.bundle import get_bundle_cube, get_bundle_thumbnail, open_bundle, read_app_snapshot
+from src.data_plots import filter_player_stats
+from src.dribble_stats import update_danger_dribble_match_stats, update_danger_dribble_stats
+from src.dribbles import apply_shot_window
+from src.percentile_cube import build_percentile_cube
+from src.percentile_sketch import read_percentile_sketches
+from src.pitch_plot import create_pitch_path
+from src.plot_data import encode_plot_data, get_pitch_plot_data, get_radar_plot_data
+from src.render_client import AUTHKEY_VARIABLE, BUNDLE_PATH, SKETCH_DIR, WORKER_ADDRESS, get_data_version, get_worker_authkey
+from src.render_executor import clear_renders, close_render_executor, create_render_executor, get_radar_alias, lookup_radar_percentiles, prefetch_players, render_player
+from src.telemetry import increment, observe, set_process_name, write_metrics
+
+# Cohorts (filtered player stats and bootstrap intervals) kept per filters, the least recently used are dropped beyond this
+MAX_COHORTS = 64
+
+
+def load_data(state):
+    """
+    Load the data files into the worker state if they changed.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    """
+    if state.get("data_version") != get_data_version():
+        # Images of the old data are stale (e.g. after a live update, see src/live.py)
+        if "data_version" in state:
+            clear_renders(state["executor"])
+        bundle = open_bundle(BUNDLE_PATH) if BUNDLE_PATH else None
+        state["bundle"] = bundle
+
+        # The version is the version of the files that were read, a publish during the read is read again
+        data, data_version = read_app_snapshot(["player_stats", "dribbles", "player_match_stats"], bundle)
+        state["player_stats"] = data["player_stats"]
+        state["dribbles"] = data["dribbles"]
+        state["player_match_stats"] = data["player_match_stats"]
+        state["shot_windows"] = {}
+        state["cohorts"] = OrderedDict()
+        state["percentile_cubes"] = {}
+        if bundle is not None:
+            cube = get_bundle_cube(bundle)
+            state["percentile_cubes"][cube["shot_window"]] = cube
+            print(f"Percentile cube for a {cube['shot_window']} s shot window: {cube['cohorts']} cohorts, mapped from {BUNDLE_PATH} in {cube['build_seconds']:.3f} s")
+        state["data_version"] = data_version
+        get_percentile_cube(state, 15)
+
+        # Merge the percentile sketches of all competitions
+        state["percentile_sketches"] = read_percentile_sketches(SKETCH_DIR)
+        if state["percentile_sketches"] is not None:
+            sketches = state["percentile_sketches"]
+            print(f"Percentile sketches of {len(sketches['partitions'])} competitions: error at most {sketches['error_bound']:.2f} percentile points, merged in {sketches['read_seconds']:.2f} s")
+
+
+def get_percentile_cube(state, shot_window):
+    """
+    Get the percentile cube of a shot window, built on first use.
+
+    Only the cubes of the default and the last other shot window are kept, a cube of a large dataset can take tens of MB.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    shot_window: int
+        The shot window of the danger dribbles.
+
+    Returns
+    -------
+    cube: dict
+        The percentile cube (see build_percentile_cube).
+    """
+    if shot_window not in state["percentile_cubes"]:
+        if shot_window != 15:
+            state["percentile_cubes"] = {15: state["percentile_cubes"][15]} if 15 in state["percentile_cubes"] else {}
+        df_player_stats, _, _ = get_shot_window_data(state, shot_window)
+
+        cube = build_percentile_cube(df_player_stats, shot_window)
+        state["percentile_cubes"][shot_window] = cube
+        print(f"Percentile cube for a {shot_window} s shot window: {cube['cohorts']} cohorts, {cube['nbytes'] / 1024 ** 2:.1f} MB, built in {cube['build_seconds']:.2f} s")
+
+    return state["percentile_cubes"][shot_window]
+
+
+def get_shot_window_data(state, shot_window):
+    """
+    Get the player stats, dribbles and player match stats with the danger dribbles of a shot window.
+
+    Only the data of the last other shot window than the default is kept, the cohorts of the shot window it replaces
+    are dropped.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    shot_window: int
+        The shot window of the danger dribbles.
+
+    Returns
+    -------
+    df_player_stats, df_dribbles, df_player_match_stats: pd.DataFrame
+        The data for the shot window, the player match stats are None if there are none.
+    """
+    if shot_window == 15:
+        return state["player_stats"], state["dribbles"], state["player_match_stats"]
+
+    if shot_window not in state["shot_windows"]:
+        # Recalculate danger dribbles for another shot window
+        df_player_stats, df_dribbles, df_player_match_stats = state["player_stats"], state["dribbles"], state["player_match_stats"]
+        df_player_stats = update_danger_dribble_stats(df_player_stats, df_dribbles, shot_window)
+        if df_player_match_stats is not None:
+            df_player_match_stats = update_danger_dribble_match_stats(df_player_match_stats, df_dribbles, shot_window)
+        df_dribbles = apply_shot_window(df_dribbles, shot_window)
+
+        state["shot_windows"] = {shot_window: (df_player_stats, df_dribbles, df_player_match_stats)}
+        for key in [key for key in state["cohorts"] if key[3] not in (15, shot_window)]:
+            state["cohorts"].pop(key)
+
+    return state["shot_windows"][shot_window]
+
+
+def get_cohort(state, filters):
+    """
+    Get the filtered player stats and dribbles for the filters of a request.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    filters: dict
+        The position_filter, minutes_played_filter, dribbles_filter and shot_window of the request.
+
+    Returns
+    -------
+    df_player_stats, df_dribbles: pd.DataFrame
+        The player stats of the cohort (in table order) and the dribbles for the shot window.
+    df_intervals: pd.DataFrame
+        The bootstrap intervals of the cohort, None if there are no player match stats.
+    """
+    key = (filters["position_filter"], filters["minutes_played_filter"], filters["dribbles_filter"], filters["shot_window"])
+    if key not in state["cohorts"]:
+        df_player_stats, df_dribbles, df_player_match_stats = get_shot_window_data(state, filters["shot_window"])
+
+        df_player_stats = filter_player_stats(df_player_stats, filters["position_filter"], filters["minutes_played_filter"], filters["dribbles_filter"])
+
+        # Resample the matches of the cohort for the radar bands
+        df_intervals = None
+        if df_player_match_stats is not None:
+            df_intervals = calculate_bootstrap_intervals(df_player_match_stats, df_player_stats["player_id"])
+
+        state["cohorts"][key] = (df_player_stats, df_dribbles, df_intervals)
+        if len(state["cohorts"]) > MAX_COHORTS:
+            state["cohorts"].popitem(last=False)
+
+    state["cohorts"].move_to_end(key)
+
+    return state["cohorts"][key]
+
+
+def count_pending(state, prefetches=True):
+    """
+    Count the renders that are queued or running.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    prefetches: bool
+        Whether to count the prefetches.
+
+    Returns
+    -------
+    int
+        The number of pending renders.
+    """
+    executor = state["executor"]
+
+    return sum(
+        not future.done() and (prefetches or executor["prefetches"].get(path) is not future)
+        for path, future in executor["renders"].items()
+    )
+
+
+def handle_request(state, request):
+    """
+    Handle a single request.
+
+    Parameters
+    ----------
+    state: dict
+        The worker state.
+    request: dict
+        The request (see src/render_client.py).
+
+    Returns
+    -------
+    response: dict
+        The response.
+    """
+    with state["lock"]:
+        if request["type"] == "health":
+            return {
+                "status": "ok",
+                "data_version": get_data_version(),
+                "pending": count_pending(state),
+                "max_pending": state["max_pending"],
+                "percentile_cubes": {
+                    shot_window: {key: cube[key] for key in ("cohorts", "nbytes", "build_seconds")}
+                    for shot_window, cube in state.get("percentile_cubes", {}).items()
+                },
+                "percentile_sketches": {
+                    key: state["percentile_sketches"][key] for key in ("partitions", "error_bound")
+                } if state.get("percentile_sketches") is not None else None,
+            }
+
+        if request["type"] not in ("render", "prefetch", "data"):
+            return {"status": "error", "error": f"Invalid request type: {request['type']}."}
+
+        # Make sure the worker renders the data the app sees
+        load_data(state)
+        if request["data_version"] != state["data_version"]:
+            return {"status": "stale", "error": f"Data version {request['data_version']} is not available, the worker has {state['data_version']}."}
+
+        filters = request["filters"]
+        plot_filters = (filters["position_filter"], filters["minutes_played_filter"], filters["dribbles_filter"], filters["shot_window"])
+        percentile_sketches = state["percentile_sketches"] if filters.get("percentiles") == "competitions" else None
+
+        # Radar plots of filters that were requested before are found by their alias, without getting the cohort
+        if request["type"] == "render" and request["plot"] == "radar":
+            path = get_radar_alias(state["executor"], request["player_id"], *plot_filters, percentile_sketches is not None)
+            if path is not None and os.path.exists(path):
+                increment("render_cache_total", {"plot": "radar", "result": "hit"})
+                with open(path, "rb") as image_file:
+                    return {"status": "ok", "image": image_file.read()}
+
+        # Prefetches never make a click busy, a click moves the prefetch of its plot to the interactive pool
+        if request["type"] != "data" and count_pending(state, prefetches=request["type"] == "prefetch") >= state["max_pending"]:
+            return {"status": "busy", "error": "Too many pending renders."}
+
+        df_player_stats, df_dribbles, df_intervals = get_cohort(state, filters)
+        percentile_cube = get_percentile_cube(state, filters["shot_window"])
+
+        if request["type"] == "prefetch":
+            prefetch_players(state["executor"], df_player_stats, df_dribbles, *plot_filters, player_ids=request["player_ids"], df_intervals=df_intervals, percentile_cube=percentile_cube, percentile_sketches=percentile_sketches)
+            return {"status": "ok", "queued": len(request["player_ids"])}
+
+        players = df_player_stats[df_player_stats["player_id"] == request["player_id"]]
+        if players.empty:
+            return {"status": "error", "error": f"Player {request['player_id']} is not in the cohort."}
+        percentiles, reference = lookup_radar_percentiles(df_player_stats, request["player_id"], *plot_filters, percentile_cube, percentile_sketches)
+
+        if request["type"] != "data":
+            radar_future, pitch_future = render_player(state["executor"], df_player_stats, df_dribbles, players.iloc[0], *plot_filters, df_intervals, percentile_cube, percentile_sketches)
+
+            # Count requests for images that are already rendered (by an earlier request, a prefetch or other filters
+            # of the same cohort)
+            if request["plot"] == "radar":
+                path = get_radar_alias(state["executor"], request["player_id"], *plot_filters, percentile_sketches is not None)
+            else:
+                player = players.iloc[0]
+                path = create_pitch_path(df_dribbles, player["player_id"], player["player_short_name"], player["team_name"], filters["shot_window"])
+            increment("render_cache_total", {"plot": request["plot"], "result": "hit" if os.path.exists(path) else "miss"})
+
+    # The plot data is small and quick to get, so it's returned without rendering
+    if request["type"] == "data":
+        player = players.iloc[0]
+        if request["plot"] == "radar":
+            data = get_radar_plot_data(df_player_stats, player["player_id"], *plot_filters, df_intervals if reference is None else None, percentiles, reference)
+        else:
+            data = get_pitch_plot_data(df_dribbles, player["player_id"], player["player_short_name"], player["team_name"], filters["shot_window"])
+        return {"status": "ok", "data": encode_plot_data(data, request.get("format", "json"))}
+
+    # A replica started from a bundle answers with the thumbnail while the plot renders, the radar thumbnails have
+    # percentiles within the cohort
+    future = radar_future if request["plot"] == "radar" else pitch_future
+    if not future.done() and state["bundle"] is not None and (request["plot"] == "pitch" or reference is None):
+        thumbnail = get_bundle_thumbnail(state["bundle"], request["plot"], request["player_id"], filters)
+        if thumbnail is not None:
+            return {"status": "ok", "image": thumbnail}
+
+    # Wait for the render outside the lock, so other requests are handled in the meantime
+    with open(future.result(), "rb") as image_file:
+        return {"status": "ok", "image": image_file.read()}
+
+
+def serve_connection(state, connection):
+    # Handle one request per connection
+    try:
+        request = connection.recv()
+        start_time = time.perf_counter()
+        try:
+            response = handle_request(state, request)
+        except Exception as error:
+            response = {"status": "error", "error": repr(error)}
+        connection.send(response)
+
+        # Record the request, health checks are too frequent to be interesting
+        if request.get("type") != "health":
+            observe("worker_request_seconds", time.perf_counter() - start_time, {"type": request.get("type")})
+            increment("worker_requests_total", {"type": request.get("type"), "status": response["status"]})
+            write_metrics()
+    except (EOFError, OSError):
+        pass
+    finally:
+        connection.close()
+
+
+def _exit_with_parent(executor):
+    # The app keeps the stdin of the worker open, it's closed when the app exits
+    sys.stdin.buffer.read()
+    close_render_executor(executor)
+    os._exit(0)
+
+
+def run_render_worker(interactive_workers=2, prefetch_workers=1, max_pending=16, exit_with_parent=False):
+    """
+    Run the render worker until the process is stopped.
+
+    Parameters
+    ----------
+    interactive_workers: int
+        The number of processes for requested plots.
+    prefetch_workers: int
+        The number of processes for prefetching.
+    max_pending: int
+        The maximum number of renders that can be queued or running.
+    exit_with_parent: bool
+        Whether to stop the render processes and exit when stdin is closed, i.e. when the app that started the worker exits.
+
+    Raises
+    ------
+    RuntimeError
+        If RENDER_WORKER_AUTHKEY isn't set.
+    """
+    # Requests are unpickled, so never listen without a key of the app
+    authkey = get_worker_authkey()
+    if authkey is None:
+        raise RuntimeError(f"{AUTHKEY_VARIABLE} isn't set, the render worker needs a random key to accept requests.")
+
+    set_process_name("worker")
+    state = {
+        "executor": create_render_executor(interactive_workers, prefetch_workers),
+        "max_pending": max_pending,
+        "lock": threading.Lock(),
+    }
+    load_data(state)
+    if exit_with_parent:
+        threading.Thread(target=_exit_with_parent, args=(state["executor"],), daemon=True).start()
+
+    with Listener(WORKER_ADDRESS, authkey=authkey) as listener:
+        print(f"Render worker listening on {WORKER_ADDRESS[0]}:{WORKER_ADDRESS[1]}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception:
+                # Failed handshakes (e.g. wrong authkey) don't stop the worker
+                continue
+            threading.Thread(target=serve_connection, args=(state, connection), daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render radar and pitch plots for the app.")
+    parser.add_argument("--interactive-workers", type=int, default=2)
+    parser.add_argument("--prefetch-workers", type=int, default=1)
+    parser.add_argument("--max-pending", type=int, default=16)
+    parser.add_argument("--exit-with-parent", action="store_true", help="Exit when stdin is closed, i.e. when the app that started the worker exits.")
+    args = parser.parse_args()
+
+    run_render_worker(args.interactive_workers, args.prefetch_workers, args.max_pending, args.exit_with_parent)
@@ -0,0 +1,310 @@
+"""
+This module contains the schema of the data files and functions to write and read them.
+
+Every data file has an explicit, versioned schema: dictionary encoded strings, float32 coordinates and xG,
+narrow integer ids and counts and (bit-packed) booleans. Files are written with zstd compression and the schema
+name and version in the parquet metadata, and checked against the schema when they are read. Files written
+before the schema existed are accepted if they have all required columns and are cast to the schema on read.
+"""
+
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.telemetry import observe
+
+# Bump when a column is added, removed or changes type, files of other versions have to be rebuilt
+SCHEMA_VERSION = 1
+
+# Parquet settings: the files are small and read whole, so one row group per file and a high compression level
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 9
+ROW_GROUP_SIZE = 1_000_000
+
+# Shared column types
+STRING = pa.dictionary(pa.int32(), pa.string())
+COUNT = pa.int16()
+XG = pa.float32()
+
+# Columns and types of every data file, optional columns don't exist in files of older pipelines
+SCHEMAS = {
+    "player_stats": {
+        "columns": {
+            "player_id": pa.int32(),
+            "player_name": STRING,
+            "player_short_name": STRING,
+            "team_name": STRING,
+            "position": STRING,
+            "position_mask": pa.uint8(),
+            "playing_time": pa.int32(),
+            "goals": COUNT,
+            "assists": COUNT,
+            "shots": COUNT,
+            "shots_xg": XG,
+            "completed_dribbles": COUNT,
+            "failed_dribbles": COUNT,
+            "attempted_dribbles": COUNT,
+            "dribble_success_rate": pa.float64(),
+            "danger_dribbles": COUNT,
+            "danger_dribbles_xg": XG,
+            "dribbles_to_goals": COUNT,
+            "xg_per_danger_dribble": pa.float64(),
+            "goals_per90": pa.float64(),
+            "assists_per90": pa.float64(),
+            "shots_per90": pa.float64(),
+            "shots_xg_per90": pa.float64(),
+            "completed_dribbles_per90": pa.float64(),
+            "failed_dribbles_per90": pa.float64(),
+            "attempted_dribbles_per90": pa.float64(),
+            "danger_dribbles_per90": pa.float64(),
+            "danger_dribbles_xg_per90": pa.float64(),
+            "dribbles_to_goals_per90": pa.float64(),
+        },
+        "optional": ["position_mask"],
+    },
+    "dribbles": {
+        "columns": {
+            "match_id": pa.int32(),
+            "type_name": STRING,
+            "player_id": pa.int32(),
+            "outcome_name": STRING,
+            "x": pa.float32(),
+            "y": pa.float32(),
+            "danger_dribble": pa.bool_(),
+            "xg_from_dribble": XG,
+            "dribble_to_goal": pa.bool_(),
+            "shot_gap": pa.float32(),
+            "next_shot_xg": XG,
+            "next_shot_goal": pa.bool_(),
+        },
+        "optional": ["shot_gap", "next_shot_xg", "next_shot_goal"],
+    },
+    "player_match_stats": {
+        "columns": {
+            "player_id": pa.int32(),
+            "match_id": pa.int32(),
+            "playing_time": pa.int32(),
+            "goals": COUNT,
+            "assists": COUNT,
+            "shots": COUNT,
+            "shots_xg": XG,
+            "completed_dribbles": COUNT,
+            "failed_dribbles": COUNT,
+            "danger_dribbles": COUNT,
+            "danger_dribbles_xg": XG,
+            "dribbles_to_goals": COUNT,
+        },
+        "optional": [],
+    },
+    "player_form": {
+        "columns": {
+            "player_id": pa.int32(),
+            "match_id": pa.int32(),
+            "match_date": pa.date32(),
+            "opponent": STRING,
+            "playing_time": pa.int32(),
+            "goals": COUNT,
+            "assists": COUNT,
+            "shots": COUNT,
+            "shots_xg": XG,
+            "completed_dribbles": COUNT,
+            "failed_dribbles": COUNT,
+            "danger_dribbles": COUNT,
+            "danger_dribbles_xg": XG,
+            "dribbles_to_goals": COUNT,
+        },
+        "optional": [],
+    },
+    "dribble_zones": {
+        "columns": {
+            "grid": STRING,
+            "player_id": pa.int32(),
+            "zone": pa.int16(),
+            "attempts": COUNT,
+            "completions": COUNT,
+            "danger_dribbles": COUNT,
+            "danger_xg": XG,
+        },
+        "optional": [],
+    },
+    "percentile_sketches": {
+        "columns": {
+            "position": STRING,
+            "metric": STRING,
+            "min_minutes": pa.int16(),
+            "min_dribbles": pa.int16(),
+            "level": pa.int8(),
+            "value": pa.float64(),
+            "k": pa.int16(),
+            "rank_error": pa.int32(),
+        },
+        "optional": [],
+    },
+}
+
+
+def get_arrow_schema(name, columns=None):
+    """
+    Get the Arrow schema of a data file.
+
+    Parameters
+    ----------
+    name: str
+        The name of the data file schema (see SCHEMAS).
+    columns: list
+        Optional columns to keep, in schema order. By default all columns.
+
+    Returns
+    -------
+    pa.Schema
+        The schema, with the schema name and version in the metadata.
+    """
+    fields = [
+        pa.field(column, column_type)
+        for column, column_type in SCHEMAS[name]["columns"].items()
+        if columns is None or column in columns
+    ]
+
+    return pa.schema(fields, metadata={"schema_name": name, "schema_version": str(SCHEMA_VERSION)})
+
+
+def check_columns(name, columns):
+    """
+    Check if the columns of a data file match its schema.
+
+    Parameters
+    ----------
+    name: str
+        The name of the data file schema (see SCHEMAS).
+    columns: list
+        The columns of the data file.
+
+    Raises
+    ------
+    ValueError
+        If a required column is missing or a column is not in the schema.
+    """
+    schema = SCHEMAS[name]
+    missing = [column for column in schema["columns"] if column not in columns and column not in schema["optional"]]
+    unknown = [column for column in columns if column not in schema["columns"]]
+
+    if missing or unknown:
+        raise ValueError(f"Columns of {name} don't match schema version {SCHEMA_VERSION}. Missing: {missing}, unknown: {unknown}.")
+
+
+def create_arrow_table(df, name):
+    """
+    Convert data to an Arrow table with its schema.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The data.
+    name: str
+        The name of the data file schema (see SCHEMAS).
+
+    Returns
+    -------
+    pa.Table
+        The data with the types of the schema, in schema order.
+
+    Raises
+    ------
+    ValueError
+        If the columns don't match the schema or a value doesn't fit its type (e.g. a missing id).
+    """
+    check_columns(name, list(df.columns))
+
+    # Cast to the schema, in schema order
+    schema = get_arrow_schema(name, list(df.columns))
+    try:
+        return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+        raise ValueError(f"Data doesn't fit schema {name} version {SCHEMA_VERSION}: {error}") from error
+
+
+def write_data(df, name, path):
+    """
+    Write a data file with its schema.
+
+    The file is written next to the path and renamed over it, so readers (the app, the render worker) see either
+    the old or the new file, never a partly written one.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The data.
+    name: str
+        The name of the data file schema (see SCHEMAS).
+    path: str or Path
+        The path of the parquet file.
+
+    Raises
+    ------
+    ValueError
+        If the columns don't match the schema or a value doesn't fit its type (e.g. a missing id).
+    """
+    table = create_arrow_table(df, name)
+
+    # Write to a temporary file in the same directory and replace the file in one step
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(table, temp_path, compression=COMPRESSION, compression_level=COMPRESSION_LEVEL, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def read_data(name, path, columns=None):
+    """
+    Read a data file and check it against its schema.
+
+    Parameters
+    ----------
+    name: str
+        The name of the data file schema (see SCHEMAS).
+    path: str or Path
+        The path of the parquet file.
+    columns: list
+        Optional columns to read. By default all columns.
+
+    Returns
+    -------
+    pd.DataFrame
+        The data, with categorical strings and the narrow types of the schema.
+
+    Raises
+    ------
+    ValueError
+        If the file was written with another schema or version, or its columns don't match the schema.
+    """
+    start_time = time.perf_counter()
+
+    # Open the file once, so the schema and the data are from the same file when it's replaced while it's read
+    with open(path, "rb") as file:
+        parquet_file = pq.ParquetFile(file)
+        file_schema = parquet_file.schema_arrow
+        metadata = file_schema.metadata or {}
+
+        # Files with a schema have to match the name and version, older files are checked by their columns
+        if b"schema_version" in metadata:
+            file_name = metadata.get(b"schema_name", b"").decode()
+            file_version = int(metadata[b"schema_version"])
+            if file_name != name or file_version != SCHEMA_VERSION:
+                raise ValueError(f"{path} has schema {file_name} version {file_version}, expected {name} version {SCHEMA_VERSION}. Rebuild it with create_data.py.")
+        check_columns(name, file_schema.names)
+
+        table = parquet_file.read(columns=columns)
+
+    # Cast files without a schema (and their plain strings) to the schema
+    if b"schema_version" not in metadata:
+        schema = get_arrow_schema(name, table.column_names)
+        table = table.select(schema.names).cast(schema)
+
+    df = table.to_pandas()
+    observe("data_load_seconds", time.perf_counter() - start_time, {"file": name})
+
+    return df
@@ -0,0 +1,89 @@
+"""
+This module contains functions to find players with a similar profile.
+
+Players are compared on their per 90 and rate stats, standardized within the cohort of players they are
+compared with. The nearest neighbours are found with a KD-tree that is built once per cohort.
+"""
+
+import numpy as np
+
+# Stats used to compare players
+SIMILARITY_COLUMNS = [
+    "goals_per90", "assists_per90", "shots_per90", "shots_xg_per90",
+    "completed_dribbles_per90", "failed_dribbles_per90", "attempted_dribbles_per90", "dribble_success_rate",
+    "danger_dribbles_per90", "danger_dribbles_xg_per90", "dribbles_to_goals_per90", "xg_per_danger_dribble"
+]
+
+
+def create_similarity_index(df, columns=SIMILARITY_COLUMNS):
+    """
+    Create a nearest neighbour index for a cohort of players.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe with the player stats of the cohort (e.g. filtered by position, minutes and dribbles).
+    columns: list
+        The stats to compare players on.
+
+    Returns
+    -------
+    index: dict
+        The player ids, the KD-tree over the standardized stats and the mean and standard deviation used for standardizing.
+    """
+    from scipy.spatial import cKDTree
+
+    values = df[columns].to_numpy(dtype=float)
+
+    # Standardize within the cohort, stats without variation don't contribute to the distance
+    mean = values.mean(axis=0)
+    std = values.std(axis=0)
+    std[std == 0] = 1
+
+    return {
+        "player_ids": df["player_id"].to_numpy(),
+        "tree": cKDTree((values - mean) / std),
+        "mean": mean,
+        "std": std,
+    }
+
+
+def find_similar_players(index, player_id, k=5):
+    """
+    Find the players with the most similar profile to a player.
+
+    Parameters
+    ----------
+    index: dict
+        The similarity index of the cohort (see create_similarity_index).
+    player_id: int
+        The id of the player to find similar players for.
+    k: int
+        The number of similar players to return.
+
+    Returns
+    -------
+    player_ids: np.ndarray
+        The ids of the most similar players, most similar first. The player itself is not included.
+    distances: np.ndarray
+        The distance of every similar player in standardized units.
+
+    Raises
+    ------
+    ValueError
+        If the player is not in the cohort of the index.
+    """
+    positions = np.flatnonzero(index["player_ids"] == player_id)
+    if len(positions) == 0:
+        raise ValueError(f"Player {player_id} is not in the cohort of the similarity index.")
+
+    # Query one extra neighbour because the player is its own nearest neighbour
+    tree = index["tree"]
+    n_neighbours = min(k + 1, tree.n)
+    distances, neighbours = tree.query(tree.data[positions[0]], k=n_neighbours)
+    distances, neighbours = np.atleast_1d(distances), np.atleast_1d(neighbours)
+
+    # Drop the player itself
+    keep = neighbours != positions[0]
+
+    return index["player_ids"][neighbours[keep]][:k], distances[keep][:k]
@@ -0,0 +1,340 @@
+"""
+This module contains the runtime metrics of the app, the render worker, the live mode and the plot modules.
+
+Metrics are counters and histograms (in seconds) kept in memory per process. Every process writes its metrics in the
+Prometheus text format to its own file in METRICS_DIR (e.g. app.prom, worker.prom), so they can be scraped with the
+textfile collector of the Prometheus node exporter and shown on the diagnostics page of the app.
+This module only uses the standard library, so it can be imported everywhere.
+"""
+
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Directory of the metrics files, set APP_METRICS_DIR to the directory of a textfile collector
+METRICS_DIR = Path(os.environ.get("APP_METRICS_DIR", Path(tempfile.gettempdir()) / "soccermatics_metrics"))
+
+# Upper bounds of the histogram buckets in seconds
+HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Type and description of every metric
+METRIC_TYPES = {
+    "app_sessions_total": ("counter", "Sessions of the app."),
+    "app_reruns_total": ("counter", "Reruns of the app script."),
+    "app_script_seconds": ("histogram", "Time to run the app script."),
+    "app_filter_seconds": ("histogram", "Time to filter the player stats."),
+    "app_plot_seconds": ("histogram", "Time from requesting a plot until the app has it."),
+    "app_plot_errors_total": ("counter", "Plots the app couldn't get from the render worker."),
+    "data_load_seconds": ("histogram", "Time to read a data file."),
+    "plot_render_seconds": ("histogram", "Time to create a plot with matplotlib, including saving it."),
+    "plot_save_seconds": ("histogram", "Time to save a plot as PNG."),
+    "render_cache_total": ("counter", "Requested plot images by whether they were already rendered."),
+    "worker_requests_total": ("counter", "Requests to the render worker by type and response status."),
+    "worker_request_seconds": ("histogram", "Time to handle a request to the render worker."),
+    "live_events_total": ("counter", "Events ingested from the feed of a live match."),
+    "live_publish_seconds": ("histogram", "Time to publish the data files with the stats of a live match."),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_process = {"name": f"process-{os.getpid()}"}
+
+
+def set_process_name(name):
+    """
+    Set the name of this process, used as the process label and the name of its metrics file.
+
+    Parameters
+    ----------
+    name: str
+        The name of the process, e.g. "app" or "worker".
+    """
+    _process["name"] = name
+
+
+def _get_key(name, labels):
+    if name not in METRIC_TYPES:
+        raise ValueError(f"Invalid metric: {name}. Valid metrics are: {', '.join(METRIC_TYPES)}.")
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def increment(name, labels=None, value=1):
+    """
+    Increment a counter.
+
+    Parameters
+    ----------
+    name: str
+        The name of the counter (see METRIC_TYPES).
+    labels: dict
+        Optional labels of the counter.
+    value: float
+        The value to add.
+
+    Raises
+    ------
+    ValueError
+        If the counter is not in METRIC_TYPES.
+    """
+    key = _get_key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, labels=None):
+    """
+    Add an observation to a histogram.
+
+    Parameters
+    ----------
+    name: str
+        The name of the histogram (see METRIC_TYPES).
+    seconds: float
+        The observed duration.
+    labels: dict
+        Optional labels of the histogram.
+
+    Raises
+    ------
+    ValueError
+        If the histogram is not in METRIC_TYPES.
+    """
+    key = _get_key(name, labels)
+    with _lock:
+        histogram = _histograms.setdefault(key, {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+@contextmanager
+def timer(name, labels=None):
+    """
+    Time a block of code and add it to a histogram.
+
+    Parameters
+    ----------
+    name: str
+        The name of the histogram (see METRIC_TYPES).
+    labels: dict
+        Optional labels of the histogram.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_time, labels)
+
+
+def _format_labels(labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def format_metrics():
+    """
+    Format the metrics of this process in the Prometheus text format.
+
+    Returns
+    -------
+    str
+        The metrics, with the process name as label on every sample.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in _histograms.items()}
+
+    process = (("process", _process["name"]),)
+    lines = []
+    for name, (metric_type, description) in METRIC_TYPES.items():
+        samples = counters if metric_type == "counter" else histograms
+        keys = sorted(key for key in samples if key[0] == name)
+        if not keys:
+            continue
+
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+        for key in keys:
+            labels = process + key[1]
+            if metric_type == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {samples[key]}")
+                continue
+
+            # Histogram buckets are cumulative and end with +Inf
+            histogram = samples[key]
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(directory=None):
+    """
+    Write the metrics of this process to its metrics file.
+
+    The file is replaced atomically, so a scrape never sees a partial file.
+
+    Parameters
+    ----------
+    directory: str or Path
+        The directory of the metrics files, METRICS_DIR by default.
+
+    Returns
+    -------
+    path: Path
+        The path of the metrics file.
+    """
+    directory = Path(directory or METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f"{_process['name']}.prom"
+    temp_path = path.with_suffix(f".prom.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_path.write_text(format_metrics())
+    os.replace(temp_path, path)
+
+    return path
+
+
+def parse_metrics(text):
+    """
+    Parse metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    text: str
+        The metrics (see format_metrics).
+
+    Returns
+    -------
+    samples: list
+        A (name, labels, value) tuple for every sample, the labels are a dict.
+    """
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = re.match(r"^(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if match is None:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ""))
+        samples.append((match.group(1), labels, float(match.group(3))))
+
+    return samples
+
+
+def read_metrics(directory=None):
+    """
+    Read the metrics files of all processes.
+
+    Parameters
+    ----------
+    directory: str or Path
+        The directory of the metrics files, METRICS_DIR by default.
+
+    Returns
+    -------
+    samples: list
+        A (name, labels, value) tuple for every sample of every process (see parse_metrics).
+    """
+    samples = []
+    for path in sorted(Path(directory or METRICS_DIR).glob("*.prom")):
+        samples += parse_metrics(path.read_text())
+
+    return samples
+
+
+def calculate_histogram_quantile(quantile, buckets):
+    """
+    Estimate a quantile from cumulative histogram buckets, like histogram_quantile in Prometheus.
+
+    Parameters
+    ----------
+    quantile: float
+        The quantile, between 0 and 1.
+    buckets: list
+        The (upper bound, cumulative count) of every bucket, sorted by upper bound and ending with +Inf.
+
+    Returns
+    -------
+    float
+        The estimated quantile (linear within a bucket), NaN without observations.
+    """
+    total = buckets[-1][1]
+    if total == 0:
+        return math.nan
+
+    rank = quantile * total
+    lower_bound, lower_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            # Observations in the +Inf bucket are reported as the highest finite bound
+            if math.isinf(bound):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1)
+        lower_bound, lower_count = bound, count
+
+    return lower_bound
+
+
+def summarize_metrics(samples):
+    """
+    Summarize the metrics of all processes: counters are summed and histograms are merged.
+
+    Parameters
+    ----------
+    samples: list
+        The samples of all processes (see read_metrics).
+
+    Returns
+    -------
+    counters: list
+        A dict with the metric, labels and value of every counter.
+    histograms: list
+        A dict with the metric, labels, count, mean, p50, p95 and p99 (in seconds) of every histogram.
+    """
+    counters = {}
+    buckets = {}
+    sums = {}
+    for name, labels, value in samples:
+        # Merge the processes
+        labels = {key: label for key, label in labels.items() if key != "process"}
+        bound = labels.pop("le", None)
+        label_text = ", ".join(f"{key}={label}" for key, label in sorted(labels.items()))
+
+        if name.endswith("_bucket"):
+            key = (name[:-len("_bucket")], label_text)
+            buckets.setdefault(key, {})
+            buckets[key][float(bound)] = buckets[key].get(float(bound), 0) + value
+        elif name.endswith("_sum"):
+            key = (name[:-len("_sum")], label_text)
+            sums[key] = sums.get(key, 0) + value
+        elif not name.endswith("_count"):
+            counters[(name, label_text)] = counters.get((name, label_text), 0) + value
+
+    histograms = []
+    for (name, label_text), histogram in sorted(buckets.items()):
+        histogram = sorted(histogram.items())
+        count = histogram[-1][1]
+        histograms.append({
+            "metric": name,
+            "labels": label_text,
+            "count": int(count),
+            "mean": sums.get((name, label_text), 0) / count if count else math.nan,
+            "p50": calculate_histogram_quantile(0.5, histogram),
+            "p95": calculate_histogram_quantile(0.95, histogram),
+            "p99": calculate_histogram_quantile(0.99, histogram),
+        })
+
+    return [{"metric": name, "labels": label_text, "value": value} for (name, label_text), value in sorted(counters.items())], histograms
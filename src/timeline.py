@@ -0,0 +1,122 @@
+"""
+This module contains a temporal window join for event sequences.
+
+The timeline of a set of events is built once: the time in seconds of every event, sorted per match and period.
+A window join then finds, for every event of one selection (e.g. dribbles), the events of another selection
+(e.g. shots) of the same team, the opposing team or any team within a time window around it. All matches and
+periods are joined in one vectorized call and the result is a pair of row arrays into the original events.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Offset between groups (match, period, team) on the combined sort key, larger than any time in a period
+GROUP_OFFSET = 1_000_000
+
+
+def create_timeline(df):
+    """
+    Create the timeline of a set of events.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        A dataframe with Statsbomb event data for one or more matches.
+
+    Returns
+    -------
+    df_timeline: pd.DataFrame
+        A dataframe with the row of every event in df, its match, period, team and time in seconds,
+        sorted by match, period and time (events at the same time keep their event order).
+    """
+    df_timeline = pd.DataFrame({
+        "row": np.arange(len(df)),
+        "match_id": df["match_id"].to_numpy(),
+        "period": df["period"].to_numpy(),
+        "team_name": df["team_name"].to_numpy(),
+        "time": (df["minute"] * 60 + df["second"]).to_numpy(dtype=float),
+    })
+
+    return df_timeline.sort_values(["match_id", "period", "time"], kind="stable").reset_index(drop=True)
+
+
+def _get_opponents(df_timeline):
+    # Map every (match, team) to the other team of the match
+    df_teams = df_timeline[["match_id", "team_name"]].dropna().drop_duplicates()
+    df_opponents = df_teams.merge(df_teams, on="match_id", suffixes=("", "_opponent"))
+    df_opponents = df_opponents[df_opponents["team_name"] != df_opponents["team_name_opponent"]]
+
+    return df_opponents.set_index(["match_id", "team_name"])["team_name_opponent"]
+
+
+def window_join(df_timeline, left_mask, right_mask, before=0, after=None, team="same", first=False):
+    """
+    Find the right events within a time window around every left event.
+
+    Parameters
+    ----------
+    df_timeline: pd.DataFrame
+        The timeline of the events (see create_timeline).
+    left_mask, right_mask: array-like
+        Boolean masks (aligned with the rows of the original events) of the left events (e.g. dribbles)
+        and the right events (e.g. shots).
+    before: float
+        The number of seconds before the left event the window starts (0 starts at the left event).
+    after: float
+        The number of seconds after the left event the window ends, None for the end of the period.
+    team: str
+        "same", "opposite" or "any": the team of the right events relative to the left event.
+    first: bool
+        Whether to keep only the first right event in the window of every left event.
+
+    Returns
+    -------
+    left_rows, right_rows: np.ndarray
+        The rows (in the original events) of every matching pair, ordered by the timeline of the left events.
+
+    Raises
+    ------
+    ValueError
+        If team is not "same", "opposite" or "any".
+    """
+    if team not in ("same", "opposite", "any"):
+        raise ValueError(f"Invalid team: {team}. Valid teams are: same, opposite and any.")
+
+    rows = df_timeline["row"].to_numpy()
+    left = np.asarray(left_mask, dtype=bool)[rows]
+    right = np.asarray(right_mask, dtype=bool)[rows]
+
+    # Group events by match and period (and team), the left events look up the group of the team they join with
+    group_columns = ["match_id", "period"] if team == "any" else ["match_id", "period", "team_name"]
+    df_left = df_timeline.loc[left, group_columns]
+    if team == "opposite":
+        opponents = _get_opponents(df_timeline)
+        df_left = df_left.assign(team_name=opponents.reindex(pd.MultiIndex.from_frame(df_left[["match_id", "team_name"]])).to_numpy())
+
+    right_groups = pd.MultiIndex.from_frame(df_timeline.loc[right, group_columns])
+    groups = right_groups.unique()
+    right_codes = groups.get_indexer(right_groups)
+    left_codes = groups.get_indexer(pd.MultiIndex.from_frame(df_left))
+
+    # Combined sort key of the right events: group offset plus time, sorted within every group
+    right_times = df_timeline["time"].to_numpy()[right]
+    right_keys = right_codes * GROUP_OFFSET + right_times
+    right_order = np.argsort(right_keys, kind="stable")
+    right_keys = right_keys[right_order]
+    right_rows = rows[right][right_order]
+
+    # Window of every left event, left events of groups without right events get an empty window
+    left_times = df_timeline["time"].to_numpy()[left]
+    left_rows = rows[left]
+    start = np.searchsorted(right_keys, left_codes * GROUP_OFFSET + left_times - before, side="left")
+    window_end = left_times + after if after is not None else np.full(len(left_times), GROUP_OFFSET / 2)
+    end = np.searchsorted(right_keys, left_codes * GROUP_OFFSET + window_end, side="right")
+    end[left_codes < 0] = start[left_codes < 0]
+    if first:
+        end = np.minimum(end, start + 1)
+
+    # Expand the windows into pairs
+    counts = np.maximum(end - start, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return np.repeat(left_rows, counts), right_rows[np.repeat(start, counts) + offsets]
@@ -0,0 +1,239 @@
+"""
+This module contains functions to create Vega-Lite specs of the radar and pitch plots and the form chart.
+
+The specs are drawn in the browser (e.g. with st.vega_lite_chart) from the payloads of src/plot_data.py,
+so they only contain the plotted data and the styling of the matplotlib plots.
+"""
+
+import numpy as np
+
+# Size of the charts in pixels
+RADAR_SIZE = 520
+PITCH_WIDTH = 720
+PITCH_HEIGHT = 480
+FORM_WIDTH = 720
+FORM_ROW_HEIGHT = 120
+
+# Radius of the radar slices in pixels: the inner circle and the outer edge (100th percentile)
+RADAR_INNER_RADIUS = 20
+RADAR_OUTER_RADIUS = 190
+
+# Pitch markings in StatsBomb coordinates (120 x 80): outline, halfway line, penalty areas and six-yard boxes
+PITCH_LINES = [
+    (0, 120, 0, 80), (60, 60, 0, 80),
+    (0, 18, 18, 62), (102, 120, 18, 62),
+    (0, 6, 30, 50), (114, 120, 30, 50),
+]
+
+
+def _get_config(data):
+    # Shared styling of the charts
+    return {
+        "background": data["background_color"],
+        "title": {
+            "text": data["title"],
+            "subtitle": data["subtitle"],
+            "anchor": "start",
+            "color": data["dark_color"],
+            "subtitleColor": data["dark_color"],
+            "fontSize": 18,
+        },
+        "config": {"view": {"stroke": None}, "font": "Futura, sans-serif"},
+    }
+
+
+def create_radar_chart(data):
+    """
+    Create a Vega-Lite spec of a radar plot.
+
+    Parameters
+    ----------
+    data: dict
+        The radar payload (see get_radar_plot_data).
+
+    Returns
+    -------
+    spec: dict
+        The Vega-Lite spec, with the slices as inline data.
+    """
+    # One row per slice, every slice gets the same angle (in radians, clockwise from the top)
+    table = data["table"]
+    slice_angle = 2 * np.pi / len(table["label"])
+    rows = [
+        dict(zip(table, row), theta=i * slice_angle, theta2=(i + 1) * slice_angle, theta_mid=(i + 0.5) * slice_angle, full=100)
+        for i, row in enumerate(zip(*table.values()))
+    ]
+
+    # Explicit angles instead of stacking, Vega-Lite stacks the radius when both are quantitative
+    theta = {"field": "theta", "type": "quantitative", "scale": None}
+    theta2 = {"field": "theta2"}
+    theta_mid = {"field": "theta_mid", "type": "quantitative", "scale": None}
+    radius_scale = {"type": "linear", "domain": [0, 100], "range": [RADAR_INNER_RADIUS, RADAR_OUTER_RADIUS]}
+    color = {"field": "color", "type": "nominal", "scale": None}
+    tooltip = [
+        {"field": "label", "title": "Stat"},
+        {"field": "value", "title": "Value"},
+        {"field": "percentile", "title": "Percentile"},
+    ]
+
+    layers = [
+        # Blank space of the slices
+        {
+            "mark": {"type": "arc", "opacity": 0.4, "stroke": data["background_color"]},
+            "encoding": {"theta": theta, "theta2": theta2, "radius": {"field": "full", "type": "quantitative", "scale": radius_scale}, "color": color},
+        },
+        # Percentile of the player
+        {
+            "mark": {"type": "arc", "stroke": data["background_color"]},
+            "encoding": {"theta": theta, "theta2": theta2, "radius": {"field": "percentile", "type": "quantitative", "scale": radius_scale}, "color": color, "tooltip": tooltip},
+        },
+        # Value of the player, shown instead of the percentile like the radar plot
+        {
+            "mark": {"type": "text", "color": data["background_color"], "fontSize": 12, "radiusOffset": -12},
+            "encoding": {"theta": theta_mid, "radius": {"field": "percentile", "type": "quantitative", "scale": radius_scale}, "text": {"field": "value"}},
+        },
+        # Labels outside the slices
+        {
+            "mark": {"type": "text", "radius": RADAR_OUTER_RADIUS + 30, "fontSize": 12},
+            "encoding": {"theta": theta_mid, "text": {"field": "label"}, "color": color},
+        },
+    ]
+
+    # Percentile intervals as a band on the slices
+    if "percentile_lower" in table:
+        layers.insert(2, {
+            "mark": {"type": "arc", "color": data["dark_color"], "opacity": 0.25},
+            "encoding": {
+                "theta": theta,
+                "theta2": theta2,
+                "radius": {"field": "percentile_lower", "type": "quantitative", "scale": radius_scale},
+                "radius2": {"field": "percentile_upper"},
+            },
+        })
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        **_get_config(data),
+        "width": RADAR_SIZE,
+        "height": RADAR_SIZE,
+        "data": {"values": rows},
+        "layer": layers,
+    }
+
+
+def create_pitch_chart(data):
+    """
+    Create a Vega-Lite spec of a pitch plot.
+
+    Parameters
+    ----------
+    data: dict
+        The pitch payload (see get_pitch_plot_data).
+
+    Returns
+    -------
+    spec: dict
+        The Vega-Lite spec, with the dribbles and pitch markings as inline data.
+    """
+    table = data["table"]
+    dribbles = [dict(zip(table, row)) for row in zip(*table.values())]
+
+    # StatsBomb coordinates, y points down like on the pitch plot
+    x = {"type": "quantitative", "scale": {"domain": [0, 120]}, "axis": None}
+    y = {"type": "quantitative", "scale": {"domain": [0, 80], "reverse": True}, "axis": None}
+    lines = [{"x": x1, "x2": x2, "y": y1, "y2": y2} for x1, x2, y1, y2 in PITCH_LINES]
+    angles = np.linspace(0, 2 * np.pi, 61)
+    circle = [{"x": float(60 + 10 * np.cos(angle)), "y": float(40 + 10 * np.sin(angle)), "order": i} for i, angle in enumerate(angles)]
+
+    layers = [
+        # Pitch markings
+        {
+            "data": {"values": lines},
+            "mark": {"type": "rect", "fill": None, "stroke": data["dark_color"], "strokeWidth": 0.75},
+            "encoding": {"x": {"field": "x", **x}, "x2": {"field": "x2"}, "y": {"field": "y", **y}, "y2": {"field": "y2"}},
+        },
+        {
+            "data": {"values": circle},
+            "mark": {"type": "line", "color": data["dark_color"], "strokeWidth": 0.75},
+            "encoding": {"x": {"field": "x", **x}, "y": {"field": "y", **y}, "order": {"field": "order"}},
+        },
+        # Dribbles: danger dribbles in red, failed dribbles transparent, sized by the xG of the shot
+        {
+            "data": {"values": dribbles},
+            "transform": [
+                {"calculate": f"datum.danger ? '{data['danger_color']}' : '{data['dark_color']}'", "as": "color"},
+                {"calculate": "datum.outcome == 'Complete' ? 1 : 0.4", "as": "opacity"},
+                {"calculate": "80 + datum.xg * 1200", "as": "size"},
+            ],
+            "mark": {"type": "circle"},
+            "encoding": {
+                "x": {"field": "x", **x},
+                "y": {"field": "y", **y},
+                "color": {"field": "color", "type": "nominal", "scale": None},
+                "opacity": {"field": "opacity", "type": "quantitative", "scale": None},
+                "size": {"field": "size", "type": "quantitative", "scale": None},
+                "tooltip": [
+                    {"field": "outcome", "title": "Outcome"},
+                    {"field": "danger", "title": "Danger dribble"},
+                    {"field": "xg", "title": "xG from dribble", "format": ".2f"},
+                ],
+            },
+        },
+    ]
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        **_get_config(data),
+        "width": PITCH_WIDTH,
+        "height": PITCH_HEIGHT,
+        "layer": layers,
+    }
+
+
+def create_form_chart(data):
+    """
+    Create a Vega-Lite spec of a form chart: a row per stat with its rolling value at every match.
+
+    Parameters
+    ----------
+    data: dict
+        The form payload (see get_form_plot_data).
+
+    Returns
+    -------
+    spec: dict
+        The Vega-Lite spec, with the matches as inline data.
+    """
+    table = data["table"]
+    rows = [dict(zip(table, row)) for row in zip(*table.values())]
+    labels = list(dict.fromkeys(table["label"]))
+
+    # Matches in the order the player played them, labeled with the opponent
+    x = {"field": "match", "type": "ordinal", "title": "Match", "axis": {"labelAngle": 0}}
+    y = {"field": "value", "type": "quantitative", "title": None}
+    color = {"field": "color", "type": "nominal", "scale": None}
+    tooltip = [
+        {"field": "match_date", "title": "Date"},
+        {"field": "opponent", "title": "Opponent"},
+        {"field": "label", "title": "Stat"},
+        {"field": "value", "title": "Value"},
+        {"field": "matches", "title": "Matches in window"},
+        {"field": "minutes", "title": "Minutes in window"},
+    ]
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        **_get_config(data),
+        "data": {"values": rows},
+        "facet": {"row": {"field": "label", "type": "nominal", "sort": labels, "title": None, "header": {"labelAngle": 0, "labelAlign": "left", "labelColor": data["dark_color"]}}},
+        "spec": {
+            "width": FORM_WIDTH,
+            "height": FORM_ROW_HEIGHT,
+            "layer": [
+                {"mark": {"type": "line", "strokeWidth": 2}, "encoding": {"x": x, "y": y, "color": color}},
+                {"mark": {"type": "circle", "size": 60, "opacity": 1}, "encoding": {"x": x, "y": y, "color": color, "tooltip": tooltip}},
+            ],
+        },
+        # Per 90 stats and rates have different ranges
+        "resolve": {"scale": {"y": "independent"}},
+    }
@@ -0,0 +1,224 @@
+"""
+This module contains functions to create and query a spatial index of dribble locations.
+
+Dribbles are binned into zones of configurable pitch grids. The index stores per player and per zone the number
+of attempted, completed and danger dribbles and the danger xG, so cohort histograms and zone leaderboards can be
+calculated without going back to the dribble locations.
+"""
+
+import numpy as np
+import pandas as pd
+
+# StatsBomb pitch dimensions
+PITCH_LENGTH = 120
+PITCH_WIDTH = 80
+
+# Pitch grids as (zones along the length, zones along the width)
+GRIDS = {
+    "zones_6x5": (6, 5),
+    "zones_18": (6, 3),
+    "cells_120x80": (120, 80),
+}
+
+# Metrics stored per player and zone
+ZONE_METRICS = ["attempts", "completions", "danger_dribbles", "danger_xg"]
+
+
+def bin_locations(x, y, grid):
+    """
+    Get the zone of pitch locations in a grid.
+
+    Parameters
+    ----------
+    x: array-like
+        The x coordinates (0 to 120, own goal to opponent goal).
+    y: array-like
+        The y coordinates (0 to 80).
+    grid: str
+        The name of the grid in GRIDS.
+
+    Returns
+    -------
+    zones: np.ndarray
+        The zone id of every location: zone_x * zones along the width + zone_y.
+    """
+    nx, ny = GRIDS[grid]
+
+    # Locations on the far edge belong to the last zone
+    zone_x = np.clip(np.floor(np.asarray(x, dtype=float) / PITCH_LENGTH * nx), 0, nx - 1).astype(int)
+    zone_y = np.clip(np.floor(np.asarray(y, dtype=float) / PITCH_WIDTH * ny), 0, ny - 1).astype(int)
+
+    return zone_x * ny + zone_y
+
+
+def get_zones_in_area(grid, x_min=0, x_max=PITCH_LENGTH, y_min=0, y_max=PITCH_WIDTH):
+    """
+    Get the zones of a grid whose center lies in a pitch area.
+
+    For example the left half-space of the final third is roughly x from 80 to 120 and y from 18 to 30.
+
+    Parameters
+    ----------
+    grid: str
+        The name of the grid in GRIDS.
+    x_min, x_max, y_min, y_max: float
+        The bounds of the area in StatsBomb coordinates.
+
+    Returns
+    -------
+    zones: np.ndarray
+        The zone ids in the area.
+    """
+    nx, ny = GRIDS[grid]
+    center_x = (np.arange(nx) + 0.5) * PITCH_LENGTH / nx
+    center_y = (np.arange(ny) + 0.5) * PITCH_WIDTH / ny
+
+    in_x = np.flatnonzero((center_x >= x_min) & (center_x <= x_max))
+    in_y = np.flatnonzero((center_y >= y_min) & (center_y <= y_max))
+
+    return (in_x[:, None] * ny + in_y[None, :]).ravel()
+
+
+def create_zone_index(df_dribbles, grids=None):
+    """
+    Create the spatial index of dribbles per player and zone.
+
+    Parameters
+    ----------
+    df_dribbles: pd.DataFrame
+        A dataframe with all dribbles (see get_all_dribbles).
+    grids: list
+        The names of the grids to index, all grids in GRIDS by default.
+
+    Returns
+    -------
+    df_zone_index: pd.DataFrame
+        A dataframe with grid, player_id, zone and the ZONE_METRICS for every zone with at least one dribble.
+    """
+    grids = list(GRIDS) if grids is None else grids
+
+    # Dribble contributions, the same for every grid
+    df = df_dribbles[df_dribbles["player_id"].notna()]
+    df_contributions = pd.DataFrame({
+        "player_id": df["player_id"].astype(int).to_numpy(),
+        "attempts": 1,
+        "completions": (df["outcome_name"] == "Complete").to_numpy().astype(int),
+        "danger_dribbles": (df["danger_dribble"] == True).to_numpy().astype(int),
+        "danger_xg": df["xg_from_dribble"].to_numpy(dtype=float),
+    })
+
+    # Bin dribbles for every grid and sum per player and zone
+    zone_index_list = []
+    for grid in grids:
+        df_contributions["zone"] = bin_locations(df["x"], df["y"], grid)
+        df_grid = df_contributions.groupby(["player_id", "zone"], as_index=False)[ZONE_METRICS].sum()
+        df_grid.insert(0, "grid", grid)
+        zone_index_list.append(df_grid)
+
+    return pd.concat(zone_index_list, ignore_index=True)
+
+
+def get_zone_histogram(df_zone_index, grid, metric, player_ids=None):
+    """
+    Get the 2D histogram of a metric for a player or cohort.
+
+    Parameters
+    ----------
+    df_zone_index: pd.DataFrame
+        The spatial index (see create_zone_index).
+    grid: str
+        The name of the grid in GRIDS.
+    metric: str
+        One of ZONE_METRICS.
+    player_ids: list
+        The players in the cohort, all players by default.
+
+    Returns
+    -------
+    histogram: np.ndarray
+        An array with shape (zones along the length, zones along the width).
+    """
+    nx, ny = GRIDS[grid]
+    df = df_zone_index[df_zone_index["grid"] == grid]
+    if player_ids is not None:
+        df = df[df["player_id"].isin(player_ids)]
+
+    histogram = np.bincount(df["zone"], weights=df[metric], minlength=nx * ny)
+
+    return histogram.reshape(nx, ny)
+
+
+def get_zone_leaderboard(df_zone_index, grid, zones, metric="danger_dribbles", player_ids=None, top_n=10):
+    """
+    Get the players with the highest value of a metric in a set of zones.
+
+    Parameters
+    ----------
+    df_zone_index: pd.DataFrame
+        The spatial index (see create_zone_index).
+    grid: str
+        The name of the grid in GRIDS.
+    zones: array-like
+        The zone ids to include (see get_zones_in_area).
+    metric: str
+        One of ZONE_METRICS or "success_rate" (completions / attempts).
+    player_ids: list
+        The players in the cohort, all players by default.
+    top_n: int
+        The number of players to return.
+
+    Returns
+    -------
+    df_leaderboard: pd.DataFrame
+        A dataframe with player_id, the ZONE_METRICS and success_rate in the zones, sorted by metric.
+    """
+    df = df_zone_index[(df_zone_index["grid"] == grid) & df_zone_index["zone"].isin(zones)]
+    if player_ids is not None:
+        df = df[df["player_id"].isin(player_ids)]
+
+    df_leaderboard = df.groupby("player_id", as_index=False)[ZONE_METRICS].sum()
+    df_leaderboard["success_rate"] = df_leaderboard["completions"] / df_leaderboard["attempts"]
+
+    return df_leaderboard.sort_values(metric, ascending=False).head(top_n).reset_index(drop=True)
+
+
+def compare_player_zones(df_zone_index, grid, player_id, player_ids=None):
+    """
+    Compare the dribble success rate of a player in every zone with the cohort.
+
+    Parameters
+    ----------
+    df_zone_index: pd.DataFrame
+        The spatial index (see create_zone_index).
+    grid: str
+        The name of the grid in GRIDS.
+    player_id: int
+        The id of the player.
+    player_ids: list
+        The players in the cohort, all players by default.
+
+    Returns
+    -------
+    df_comparison: pd.DataFrame
+        A dataframe with per zone the attempts and success rate of the player and the cohort.
+        Success rates are NaN in zones without attempts.
+    """
+    nx, ny = GRIDS[grid]
+
+    player_attempts = get_zone_histogram(df_zone_index, grid, "attempts", [player_id]).ravel()
+    player_completions = get_zone_histogram(df_zone_index, grid, "completions", [player_id]).ravel()
+    cohort_attempts = get_zone_histogram(df_zone_index, grid, "attempts", player_ids).ravel()
+    cohort_completions = get_zone_histogram(df_zone_index, grid, "completions", player_ids).ravel()
+
+    df_comparison = pd.DataFrame({
+        "zone": np.arange(nx * ny),
+        "zone_x": np.arange(nx * ny) // ny,
+        "zone_y": np.arange(nx * ny) % ny,
+        "player_attempts": player_attempts.astype(int),
+        "player_success_rate": player_completions / np.where(player_attempts > 0, player_attempts, np.nan),
+        "cohort_attempts": cohort_attempts.astype(int),
+        "cohort_success_rate": cohort_completions / np.where(cohort_attempts > 0, cohort_attempts, np.nan),
+    })
+    df_comparison["success_rate_difference"] = df_comparison["player_success_rate"] - df_comparison["cohort_success_rate"]
+
+    return df_comparison